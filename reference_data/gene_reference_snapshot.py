@@ -0,0 +1,184 @@
+from array import array
+from bisect import bisect_left, bisect_right
+import logging
+import mmap
+import os
+import struct
+import sys
+from threading import Lock
+
+from reference_data.models import GeneInfo
+
+logger = logging.getLogger(__name__)
+
+# The snapshot is a single read-only file of fixed width arrays, which is memory mapped so all processes on a host share
+# its pages. Genes are stored sorted by gene id, with string tables for gene ids and symbols. Lookups by symbol use an
+# index of genes sorted by symbol. Arrays are written in the native byte order of the host, which is recorded in the
+# header. The header also records the reference data version the snapshot was built for, so callers can ignore a
+# snapshot which is out of date
+SNAPSHOT_MAGIC = b'SEQRGENE'
+SNAPSHOT_FORMAT_VERSION = 3
+REFERENCE_DATA_VERSION_LENGTH = 32
+SECTIONS = ['gene_id_offsets', 'gene_ids', 'symbol_offsets', 'symbols', 'symbol_order']
+HEADER_FORMAT = '<8sIB3xI{}s{}Q'.format(REFERENCE_DATA_VERSION_LENGTH, len(SECTIONS) * 2)
+SECTION_ALIGNMENT = 8
+
+
+class InvalidGeneReferenceSnapshot(Exception):
+    pass
+
+
+class GeneReferenceSnapshot(object):
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header_size = struct.calcsize(HEADER_FORMAT)
+        header = struct.unpack(HEADER_FORMAT, self._mmap[:header_size])
+        magic, format_version, is_big_endian, self.num_genes, reference_data_version = header[:5]
+        if magic != SNAPSHOT_MAGIC or format_version != SNAPSHOT_FORMAT_VERSION:
+            raise InvalidGeneReferenceSnapshot('Unsupported gene reference snapshot: {}'.format(path))
+        if bool(is_big_endian) != (sys.byteorder == 'big'):
+            raise InvalidGeneReferenceSnapshot('Gene reference snapshot was built on a host with a different byte order')
+
+        self.reference_data_version = reference_data_version.rstrip(b'\0').decode('ascii') or None
+        section_bounds = header[5:]
+        view = memoryview(self._mmap)
+        self._sections = {}
+        for i, section in enumerate(SECTIONS):
+            offset, length = section_bounds[i * 2:(i + 1) * 2]
+            self._sections[section] = view[offset:offset + length]
+
+        self._gene_id_offsets = self._sections['gene_id_offsets'].cast('I')
+        self._symbol_offsets = self._sections['symbol_offsets'].cast('I')
+        self._symbol_order = self._sections['symbol_order'].cast('I')
+        self._gene_ids = _StringColumn(self._sections['gene_ids'], self._gene_id_offsets, self.num_genes)
+        self._symbols = _StringColumn(self._sections['symbols'], self._symbol_offsets, self.num_genes)
+        self._sorted_symbols = _IndexedColumn(self._symbols, self._symbol_order)
+
+    def has_gene(self, gene_id):
+        return self._gene_index(gene_id) is not None
+
+    def get_gene_ids_for_symbol(self, gene_symbol):
+        """Returns the ids of all genes with the given symbol, with genes from the most recent gencode release first"""
+        start = bisect_left(self._sorted_symbols, gene_symbol)
+        end = bisect_right(self._sorted_symbols, gene_symbol, lo=start)
+        return [self._gene_ids[self._symbol_order[i]] for i in range(start, end)]
+
+    def _gene_index(self, gene_id):
+        index = bisect_left(self._gene_ids, gene_id)
+        if index < self.num_genes and self._gene_ids[index] == gene_id:
+            return index
+        return None
+
+
+class _StringColumn(object):
+
+    def __init__(self, data, offsets, length):
+        self._data = data
+        self._offsets = offsets
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self._data[self._offsets[index]:self._offsets[index + 1]].tobytes().decode('utf-8')
+
+
+class _IndexedColumn(object):
+
+    def __init__(self, column, order):
+        self._column = column
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        return self._column[self._order[index]]
+
+
+SNAPSHOTS = {}
+SNAPSHOTS_LOCK = Lock()
+
+
+def get_gene_reference_snapshot(path):
+    """
+    Returns the memory mapped snapshot at the given path, or None if there is no valid snapshot. Snapshots are replaced
+    atomically when rebuilt, so the file is reopened if it has changed since it was last mapped
+    """
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    file_id = (stat.st_ino, stat.st_mtime_ns)
+
+    with SNAPSHOTS_LOCK:
+        cached = SNAPSHOTS.get(path)
+        if cached and cached[0] == file_id:
+            return cached[1]
+        try:
+            snapshot = GeneReferenceSnapshot(path)
+        except (InvalidGeneReferenceSnapshot, OSError, ValueError, struct.error) as e:
+            logger.error('Unable to load gene reference snapshot {}: {}'.format(path, str(e)))
+            snapshot = None
+        # Previously mapped snapshots are not closed, as they may still be in use by other threads
+        SNAPSHOTS[path] = (file_id, snapshot)
+        return snapshot
+
+
+def write_gene_reference_snapshot(path, reference_data_version=None):
+    """Writes a snapshot of the current GeneInfo table, built for the given reference data version, to the given path"""
+    encoded_version = (reference_data_version or '').encode('ascii')
+    if len(encoded_version) > REFERENCE_DATA_VERSION_LENGTH:
+        raise ValueError('Invalid reference data version: {}'.format(reference_data_version))
+
+    genes = sorted(GeneInfo.objects.values_list('gene_id', 'gene_symbol', 'gencode_release'), key=lambda gene: gene[0])
+
+    gene_id_offsets, gene_ids = _string_table([gene[0] for gene in genes])
+    symbol_offsets, symbols = _string_table([gene[1] or '' for gene in genes])
+    symbol_order = array('I', sorted(
+        (i for i, gene in enumerate(genes) if gene[1]), key=lambda i: (genes[i][1], -(genes[i][2] or 0))))
+
+    sections = {
+        'gene_id_offsets': gene_id_offsets.tobytes(),
+        'gene_ids': gene_ids,
+        'symbol_offsets': symbol_offsets.tobytes(),
+        'symbols': symbols,
+        'symbol_order': symbol_order.tobytes(),
+    }
+    offset = _align(struct.calcsize(HEADER_FORMAT))
+    section_bounds = []
+    for section in SECTIONS:
+        section_bounds += [offset, len(sections[section])]
+        offset = _align(offset + len(sections[section]))
+
+    header = struct.pack(
+        HEADER_FORMAT, SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, sys.byteorder == 'big', len(genes), encoded_version,
+        *section_bounds)
+
+    # Write to a temporary file and then replace the existing snapshot, so processes never map a partially written file
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for section in SECTIONS:
+            f.write(b'\0' * (_align(f.tell()) - f.tell()))
+            f.write(sections[section])
+    os.replace(tmp_path, path)
+    logger.info('Wrote gene reference snapshot of {} genes to {}'.format(len(genes), path))
+
+
+def _string_table(values):
+    encoded = [value.encode('utf-8') for value in values]
+    offsets = array('I', [0])
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    return offsets, b''.join(encoded)
+
+
+def _align(offset):
+    return offset + (-offset % SECTION_ALIGNMENT)
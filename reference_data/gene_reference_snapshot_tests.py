@@ -0,0 +1,55 @@
+import mock
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+
+from reference_data.gene_reference_snapshot import get_gene_reference_snapshot, write_gene_reference_snapshot
+from reference_data.models import GeneInfo
+
+
+@mock.patch.dict('reference_data.gene_reference_snapshot.SNAPSHOTS', clear=True)
+class GeneReferenceSnapshotTest(TestCase):
+    databases = '__all__'
+    fixtures = ['users', 'reference_data']
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.temp_dir, 'genes.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_gene_reference_snapshot(self):
+        self.assertIsNone(get_gene_reference_snapshot(None))
+        self.assertIsNone(get_gene_reference_snapshot(self.snapshot_path))
+
+        write_gene_reference_snapshot(self.snapshot_path, 'abc123')
+        snapshot = get_gene_reference_snapshot(self.snapshot_path)
+        self.assertEqual(snapshot.num_genes, GeneInfo.objects.count())
+        self.assertEqual(snapshot.reference_data_version, 'abc123')
+        self.assertIs(get_gene_reference_snapshot(self.snapshot_path), snapshot)
+
+        self.assertTrue(snapshot.has_gene('ENSG00000223972'))
+        self.assertFalse(snapshot.has_gene('ENSG00000000000'))
+
+        self.assertListEqual(snapshot.get_gene_ids_for_symbol('DDX11L1'), ['ENSG00000223972'])
+        self.assertSetEqual(
+            set(snapshot.get_gene_ids_for_symbol('AL627309.1')), {'ENSG00000238009', 'ENSG00000237683'})
+        self.assertListEqual(snapshot.get_gene_ids_for_symbol('FOO'), [])
+
+        # Test the snapshot is reloaded when rebuilt
+        GeneInfo.objects.filter(gene_id='ENSG00000223972').delete()
+        write_gene_reference_snapshot(self.snapshot_path)
+        updated_snapshot = get_gene_reference_snapshot(self.snapshot_path)
+        self.assertIsNot(updated_snapshot, snapshot)
+        self.assertFalse(updated_snapshot.has_gene('ENSG00000223972'))
+        self.assertIsNone(updated_snapshot.reference_data_version)
+        self.assertListEqual(updated_snapshot.get_gene_ids_for_symbol('DDX11L1'), [])
+        # Previously loaded snapshots are still usable
+        self.assertTrue(snapshot.has_gene('ENSG00000223972'))
+
+        # Test invalid snapshots are ignored
+        with open(self.snapshot_path, 'wb') as f:
+            f.write(b'invalid')
+        self.assertIsNone(get_gene_reference_snapshot(self.snapshot_path))
@@ -10,6 +10,7 @@ from reference_data.management.commands.update_gene_constraint import GeneConstr
 from reference_data.management.commands.update_omim import OmimReferenceDataHandler
 from reference_data.management.commands.update_primate_ai import PrimateAIReferenceDataHandler
 from reference_data.management.commands.update_mgi import MGIReferenceDataHandler
+from reference_data.signals import reference_data_updated
 
 
 logger = logging.getLogger(__name__)
@@ -72,6 +73,9 @@ class Command(BaseCommand):
                     logger.error("unable to update {}: {}".format(source, e))
                     update_failed.append(source)
 
+        if updated:
+            reference_data_updated.send(sender=self.__class__)
+
         logger.info("Done")
         if updated:
             logger.info("Updated: {}".format(', '.join(updated)))
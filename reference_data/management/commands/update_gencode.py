@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand, CommandError
 
 from reference_data.management.commands.utils.download_utils import download_file
 from reference_data.models import GeneInfo, TranscriptInfo, GENOME_VERSION_GRCh37, GENOME_VERSION_GRCh38
+from reference_data.signals import reference_data_updated
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +37,7 @@ class Command(BaseCommand):
             gencode_gtf_path=options.get('gencode_gtf_path'),
             genome_version=options.get('genome_version'),
             reset=options['reset'])
+        reference_data_updated.send(sender=self.__class__)
 
 
 def update_gencode(gencode_release, gencode_gtf_path=None, genome_version=None, reset=False):
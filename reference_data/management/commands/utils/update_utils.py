@@ -6,6 +6,7 @@ from django.core.management.base import BaseCommand, CommandError
 from reference_data.management.commands.utils.download_utils import download_file
 from reference_data.management.commands.utils.gene_utils import get_genes_by_symbol_and_id
 from reference_data.models import GeneInfo
+from reference_data.signals import reference_data_updated
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +60,7 @@ class GeneCommand(BaseCommand):
 
     def handle(self, *args, **options):
         update_records(self.reference_data_handler(**options), file_path=options.get('file_path'), )
+        reference_data_updated.send(sender=self.__class__)
 
 
 def update_records(reference_data_handler, file_path=None):
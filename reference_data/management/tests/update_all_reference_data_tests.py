@@ -17,6 +17,7 @@ def mgi_exception():
     raise Exception('MGI failed')
 
 
+@mock.patch('reference_data.management.commands.update_all_reference_data.reference_data_updated')
 @mock.patch('reference_data.management.commands.update_all_reference_data.logger')
 @mock.patch('reference_data.management.commands.update_all_reference_data.update_records')
 @mock.patch('reference_data.management.commands.update_all_reference_data.update_hpo')
@@ -30,7 +31,7 @@ class UpdateAllReferenceDataTest(TestCase):
     @mock.patch('reference_data.management.commands.update_gene_constraint.GeneConstraintReferenceDataHandler')
     @mock.patch('reference_data.management.commands.update_primate_ai.PrimateAIReferenceDataHandler')
     @mock.patch('reference_data.management.commands.update_mgi.MGIReferenceDataHandler')
-    def test_update_all_reference_data_command(self, mock_mgi_handler, mock_primate_ai_handler, mock_gene_constraint_handler, mock_dbnsfp_gene_handler, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger):
+    def test_update_all_reference_data_command(self, mock_mgi_handler, mock_primate_ai_handler, mock_gene_constraint_handler, mock_dbnsfp_gene_handler, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger, mock_reference_data_updated):
 
         # Test missing required arguments
         with self.assertRaises(CommandError) as err:
@@ -77,9 +78,10 @@ class UpdateAllReferenceDataTest(TestCase):
             mock.call('unable to update mgi: MGI failed')
         ]
         mock_logger.error.assert_has_calls(calls)
+        mock_reference_data_updated.send.assert_called_once()
 
         # Test skipping all
-    def test_update_none_reference_data_command(self, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger):
+    def test_update_none_reference_data_command(self, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger, mock_reference_data_updated):
         call_command('update_all_reference_data', '--skip-gencode', '--skip-omim', '--skip-dbnsfp-gene', '--skip-gene-constraint', '--skip-primate-ai', '--skip-mgi', '--skip-hpo')
 
         mock_update_gencode.assert_not_called()
@@ -87,9 +89,10 @@ class UpdateAllReferenceDataTest(TestCase):
         mock_update_records.assert_not_called()
         mock_update_hpo.assert_not_called()
         mock_logger.info.assert_called_with("Done")
+        mock_reference_data_updated.send.assert_not_called()
 
         # Test omim exception
-    def test_update_exceptions(self, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger):
+    def test_update_exceptions(self, mock_omim, mock_update_gencode, mock_update_hpo, mock_update_records, mock_logger, mock_reference_data_updated):
 
         mock_omim.side_effect = omim_exception
         call_command('update_all_reference_data', '--skip-gencode', '--omim=test_key', '--skip-dbnsfp-gene', '--skip-gene-constraint', '--skip-primate-ai', '--skip-mgi', '--skip-hpo')
@@ -106,4 +109,5 @@ class UpdateAllReferenceDataTest(TestCase):
         mock_logger.info.assert_has_calls(calls)
 
         mock_logger.error.assert_called_with("unable to update omim: Omim exception, key: test_key")
+        mock_reference_data_updated.send.assert_not_called()
 
@@ -21,9 +21,10 @@ class UpdateMgiTest(TestCase):
     fixtures = ['users', 'reference_data']
 
     @responses.activate
+    @mock.patch('reference_data.management.commands.utils.update_utils.reference_data_updated')
     @mock.patch('reference_data.management.commands.utils.update_utils.logger')
     @mock.patch('reference_data.management.commands.utils.download_utils.tempfile')
-    def test_update_mgi_command(self, mock_tempfile, mock_logger):
+    def test_update_mgi_command(self, mock_tempfile, mock_logger, mock_reference_data_updated):
         tmp_dir = tempfile.gettempdir()
         mock_tempfile.gettempdir.return_value = tmp_dir
         tmp_file = '{}/HMD_HumanPhenotype.rpt'.format(tmp_dir)
@@ -43,6 +44,7 @@ class UpdateMgiTest(TestCase):
             mock.call('Running ./manage.py update_gencode to update the gencode version might fix missing genes')
         ]
         mock_logger.info.assert_has_calls(calls)
+        mock_reference_data_updated.send.assert_called_once()
 
         # test with a file_path parameter
         responses.remove(responses.GET, url)
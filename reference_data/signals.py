@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent whenever reference data is reloaded, so that apps which cache reference data can invalidate it
+reference_data_updated = Signal()
@@ -5,6 +5,11 @@ from django.contrib.admin import AdminSite, apps
 class SeqrConfig(AppConfig):
     name = 'seqr'
 
+    def ready(self):
+        from reference_data.signals import reference_data_updated
+        from seqr.utils.gene_utils import handle_reference_data_updated
+        reference_data_updated.connect(handle_reference_data_updated, dispatch_uid='seqr_reference_data_updated')
+
 class SuperuserAdminSite(AdminSite):
     def has_permission(self, request):
         return request.user.is_active and request.user.is_superuser
@@ -0,0 +1,96 @@
+import logging
+from statistics import mean
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from seqr.models import Project, Family, SavedVariant, VariantTag, VariantTagType, VariantNote, VariantFunctionalData
+from seqr.utils.xpos_utils import get_xpos
+from seqr.views.utils.orm_to_json_utils import get_json_for_saved_variants_with_tags
+
+logger = logging.getLogger(__name__)
+
+NOTE_FREQUENCY = 2
+FUNCTIONAL_DATA_FREQUENCY = 5
+
+
+class Command(BaseCommand):
+    help = 'Benchmark loading the saved variants for a project with their tags, notes and functional data. ' \
+           'Synthetic saved variants are added to the project for the benchmark, and are removed once it completes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_guid', help='project to add synthetic saved variants to')
+        parser.add_argument('--num-variants', type=int, default=50000, help='number of synthetic saved variants')
+        parser.add_argument('--iterations', type=int, default=3, help='number of timed runs')
+
+    def handle(self, *args, **options):
+        project = Project.objects.filter(guid=options['project_guid']).first()
+        if not project:
+            raise CommandError('Invalid project: {}'.format(options['project_guid']))
+        family = Family.objects.filter(project=project).first()
+        if not family:
+            raise CommandError('Project {} has no families'.format(project.guid))
+        tag_type = VariantTagType.objects.filter(Q(project=project) | Q(project__isnull=True)).first()
+
+        with transaction.atomic():
+            _create_synthetic_saved_variants(family, tag_type, options['num_variants'])
+
+            durations = []
+            for _ in range(options['iterations']):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = get_json_for_saved_variants_with_tags(
+                        SavedVariant.objects.filter(family__project=project), add_details=True)
+                    durations.append(time.perf_counter() - start)
+
+            transaction.set_rollback(True)
+
+        logger.info(
+            '{} saved variants, {} tags, {} notes, {} functional data: mean {:.4f}s, min {:.4f}s, {} queries'.format(
+                len(response['savedVariantsByGuid']), len(response['variantTagsByGuid']),
+                len(response['variantNotesByGuid']), len(response['variantFunctionalDataByGuid']), mean(durations),
+                min(durations), len(queries)))
+
+
+def _create_synthetic_saved_variants(family, tag_type, num_variants):
+    guid_prefix = uuid.uuid4().hex[:8]
+    saved_variants = SavedVariant.objects.bulk_create([
+        SavedVariant(
+            guid='SV_bm_{}_{}'.format(guid_prefix, i), family=family, xpos=get_xpos('1', i + 1), ref='A', alt='T',
+            variant_id='1-{}-A-T'.format(i + 1), saved_variant_json={'pos': i + 1, 'chrom': '1'},
+        ) for i in range(num_variants)
+    ])
+
+    if tag_type:
+        tags = VariantTag.objects.bulk_create([
+            VariantTag(guid='VT_bm_{}_{}'.format(guid_prefix, i), variant_tag_type=tag_type)
+            for i in range(num_variants)
+        ])
+        VariantTag.saved_variants.through.objects.bulk_create([
+            VariantTag.saved_variants.through(varianttag_id=tag.id, savedvariant_id=saved_variant.id)
+            for tag, saved_variant in zip(tags, saved_variants)
+        ])
+
+    note_variants = saved_variants[::NOTE_FREQUENCY]
+    notes = VariantNote.objects.bulk_create([
+        VariantNote(guid='VN_bm_{}_{}'.format(guid_prefix, i), note='Synthetic note {}'.format(i))
+        for i in range(len(note_variants))
+    ])
+    VariantNote.saved_variants.through.objects.bulk_create([
+        VariantNote.saved_variants.through(variantnote_id=note.id, savedvariant_id=saved_variant.id)
+        for note, saved_variant in zip(notes, note_variants)
+    ])
+
+    functional_data_variants = saved_variants[::FUNCTIONAL_DATA_FREQUENCY]
+    functional_data = VariantFunctionalData.objects.bulk_create([
+        VariantFunctionalData(guid='VFD_bm_{}_{}'.format(guid_prefix, i), functional_data_tag='Biochemical Function')
+        for i in range(len(functional_data_variants))
+    ])
+    VariantFunctionalData.saved_variants.through.objects.bulk_create([
+        VariantFunctionalData.saved_variants.through(variantfunctionaldata_id=tag.id, savedvariant_id=saved_variant.id)
+        for tag, saved_variant in zip(functional_data, functional_data_variants)
+    ])
@@ -0,0 +1,376 @@
+from collections import defaultdict
+from copy import deepcopy
+import json
+import logging
+from statistics import mean
+import time
+import tracemalloc
+from types import SimpleNamespace
+from urllib.parse import unquote
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from elasticsearch import Connection, Elasticsearch
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.response import Response
+
+from reference_data.models import GENOME_VERSION_GRCh37
+from seqr.models import Family, Individual, Sample
+from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY, MAX_VARIANTS, MAX_COMPOUND_HET_GENES
+from seqr.utils.elasticsearch.es_gene_agg_search import EsGeneAggSearch
+from seqr.utils.elasticsearch.es_search import EsSearch
+from seqr.utils.elasticsearch.utils import get_es_variants
+from seqr.utils.redis_utils import safe_redis_delete_matching
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_INDEX_NAMES = ['benchmark_index', 'benchmark_index_second']
+SAMPLES_PER_FAMILY = 3
+FAMILIES_PER_HIT = 5
+BENCHMARK_SEARCH = {'annotations': {'frameshift': ['frameshift_variant']}}
+
+
+class SyntheticEsConnection(Connection):
+    """Elasticsearch connection which serves synthetic search responses instead of sending requests to a cluster"""
+
+    def __init__(self, synthetic_dataset=None, **kwargs):
+        super(SyntheticEsConnection, self).__init__(**kwargs)
+        self._dataset = synthetic_dataset
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=(), headers=None):
+        path = unquote(url.split('?')[0])
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        if path.endswith('/_msearch'):
+            requests = [json.loads(line) for line in body.splitlines() if line.strip()]
+            response = {'responses': [
+                self._dataset.search_response(header['index'], search)
+                for header, search in zip(requests[::2], requests[1::2])
+            ]}
+        elif path.endswith('/_search'):
+            response = self._dataset.search_response(path.strip('/').split('/')[0].split(','), json.loads(body or '{}'))
+        else:
+            raise NotFoundError(404, 'Unsupported synthetic request: {} {}'.format(method, url))
+        return 200, {'content-type': 'application/json'}, json.dumps(response)
+
+
+class SyntheticDataset(object):
+    """
+    Synthetic families, samples and elasticsearch responses for benchmarking. Hits are generated once for each index,
+    and searches return the requested page of hits. About half the variants in the second index are duplicates of
+    variants in the first index
+    """
+
+    def __init__(self, num_hits, num_families, num_genes):
+        self.num_hits = num_hits
+        self.families = [
+            Family(guid='F_benchmark_{}'.format(i), family_id='benchmark_{}'.format(i)) for i in range(num_families)
+        ]
+        self.index_metadata = {}
+        self._samples_by_family = {}
+        self._hits_by_index = {}
+        self._merged_hits = {}
+        for family in self.families:
+            self._samples_by_family[family.guid] = {
+                sample.sample_id: sample for sample in _synthetic_family_samples(family)}
+
+        self._gene_ids = ['ENSG{:011d}'.format(i) for i in range(num_genes)]
+        for index_num, index_name in enumerate(BENCHMARK_INDEX_NAMES):
+            self._hits_by_index[index_name] = [
+                self._synthetic_hit(index_name, i, offset=5 if index_num and i % 2 else 0) for i in range(num_hits)
+            ]
+            self.index_metadata[index_name] = {
+                'genomeVersion': GENOME_VERSION_GRCh37,
+                'sourceFilePath': '{}.vcf'.format(index_name),
+                'fields': {field: 'keyword' for field in self._hits_by_index[index_name][0]['_source'].keys()},
+            }
+
+        self._gene_buckets = [self._synthetic_gene_bucket(i, gene_id) for i, gene_id in enumerate(self._gene_ids)]
+        self.client = Elasticsearch(
+            hosts=[{'host': 'synthetic'}], connection_class=SyntheticEsConnection, synthetic_dataset=self)
+
+    def samples_by_family_index(self, index_names):
+        return defaultdict(lambda: defaultdict(dict), {
+            index_name: defaultdict(dict, {
+                family_guid: dict(samples_by_id) for family_guid, samples_by_id in self._samples_by_family.items()
+            }) for index_name in index_names
+        })
+
+    def search_response(self, index_names, search):
+        if isinstance(index_names, str):
+            index_names = index_names.split(',')
+        if 'aggs' in search:
+            return _response([], self.num_hits, aggregations={'genes': {'buckets': self._gene_buckets}})
+
+        hits = self._get_merged_hits(tuple(sorted(index_names)))
+        start_index = search.get('from', 0)
+        hits = hits[start_index:start_index + search.get('size', 10)]
+        source_fields = search.get('_source')
+        if isinstance(source_fields, dict):
+            source_fields = source_fields.get('includes')
+        if isinstance(source_fields, list):
+            hits = [dict(hit, _source={k: v for k, v in hit['_source'].items() if k in source_fields}) for hit in hits]
+        return _response(hits, len(self._get_merged_hits(tuple(sorted(index_names)))))
+
+    def parsed_index_responses(self, index_names):
+        """Returns the raw hits for each index as elasticsearch_dsl responses, as they are passed to response parsing"""
+        return {
+            index_name: Response(Search(), _response(self._hits_by_index[index_name], self.num_hits))
+            for index_name in index_names
+        }
+
+    def gene_aggregation_response(self):
+        return Response(Search(), self.search_response(BENCHMARK_INDEX_NAMES[:1], {'aggs': {}}))
+
+    def _get_merged_hits(self, index_names):
+        if index_names not in self._merged_hits:
+            self._merged_hits[index_names] = sorted(
+                [hit for index_name in index_names for hit in self._hits_by_index[index_name]],
+                key=lambda hit: hit['sort'])
+        return self._merged_hits[index_names]
+
+    def _hit_families(self, i):
+        return [self.families[(i + j) % len(self.families)] for j in range(min(FAMILIES_PER_HIT, len(self.families)))]
+
+    def _synthetic_hit(self, index_name, i, offset=0):
+        contig = str(i * 22 // self.num_hits + 1)
+        pos = 100000 + i * 10 + offset
+        variant_id = '{}-{}-A-G'.format(contig, pos)
+        xpos = int(contig) * int(1e9) + pos
+        genotypes = []
+        samples_num_alt_1 = []
+        samples_num_alt_2 = []
+        for family in self._hit_families(i):
+            for sample_id, sample in self._samples_by_family[family.guid].items():
+                num_alt = 1 if sample.individual.affected == Individual.AFFECTED_STATUS_AFFECTED else (i % 2)
+                genotypes.append({'num_alt': num_alt, 'ab': 0.5 * num_alt, 'dp': 40, 'gq': 99, 'sample_id': sample_id})
+                if num_alt == 1:
+                    samples_num_alt_1.append(sample_id)
+                elif num_alt == 2:
+                    samples_num_alt_2.append(sample_id)
+
+        gene_id = self._gene_ids[i % len(self._gene_ids)]
+        return {
+            '_index': index_name,
+            '_id': variant_id,
+            'sort': [xpos],
+            '_source': {
+                'contig': contig, 'start': pos, 'ref': 'A', 'alt': 'G', 'variantId': variant_id, 'xpos': xpos,
+                'rsid': 'rs{}'.format(i), 'filters': [], 'originalAltAlleles': [variant_id],
+                'AC': len(samples_num_alt_1), 'AF': 0.063, 'AN': 32, 'gnomad_exomes_AF': 0.00006,
+                'gnomad_exomes_AF_POPMAX_OR_GLOBAL': 0.0009, 'gnomad_genomes_AF': 0.0001, 'gnomad_genomes_AN': 30946,
+                'topmed_AF': 0.0002, 'exac_AF': 0.00007, 'exac_AC_Adj': 8, 'exac_AN_Adj': 121308, 'cadd_PHRED': '25.9',
+                'dbnsfp_REVEL_score': '0.5', 'clinvar_clinical_significance': None, 'hgmd_class': None,
+                'sortedTranscriptConsequences': [{
+                    'gene_id': gene_id, 'gene_symbol': 'GENE{}'.format(i % len(self._gene_ids)),
+                    'transcript_id': 'ENST{:011d}'.format(i), 'major_consequence': 'frameshift_variant',
+                    'consequence_terms': ['frameshift_variant'], 'biotype': 'protein_coding', 'canonical': 1,
+                    'transcript_rank': 0, 'hgvsc': 'ENST{:011d}.1:c.862delC'.format(i),
+                }],
+                'genotypes': genotypes,
+                'samples_num_alt_1': samples_num_alt_1,
+                'samples_num_alt_2': samples_num_alt_2,
+            },
+        }
+
+    def _synthetic_gene_bucket(self, i, gene_id):
+        family_samples = [self._samples_by_family[family.guid] for family in self._hit_families(i)]
+        sample_ids = [sample_id for samples in family_samples for sample_id in samples.keys()]
+        return {
+            'key': gene_id,
+            'doc_count': len(sample_ids),
+            'samples_num_alt_1': {'buckets': [{'key': sample_id, 'doc_count': 1} for sample_id in sample_ids[1:]]},
+            'samples_num_alt_2': {'buckets': [{'key': sample_id, 'doc_count': 1} for sample_id in sample_ids[:1]]},
+            'samples': {'buckets': []},
+        }
+
+
+def _synthetic_family_samples(family):
+    samples = []
+    for i in range(SAMPLES_PER_FAMILY):
+        individual = Individual(
+            guid='I_{}_{}'.format(family.family_id, i), individual_id='{}_{}'.format(family.family_id, i),
+            family=family, sex=Individual.SEX_MALE if i == 1 else Individual.SEX_FEMALE,
+            affected=Individual.AFFECTED_STATUS_AFFECTED if i == 0 else Individual.AFFECTED_STATUS_UNAFFECTED,
+        )
+        samples.append(Sample(
+            sample_id='{}_{}'.format(family.family_id, i), individual=individual, is_active=True,
+            dataset_type=Sample.DATASET_TYPE_VARIANT_CALLS,
+        ))
+    return samples
+
+
+def _response(hits, total, aggregations=None):
+    response = {'took': 0, 'timed_out': False, 'hits': {'total': {'value': total, 'relation': 'eq'}, 'hits': hits}}
+    if aggregations:
+        response['aggregations'] = aggregations
+    return response
+
+
+def _synthetic_search_cls(search_cls, dataset, index_names):
+    """Returns a search class which loads its samples and index metadata from the synthetic dataset"""
+
+    class SyntheticSearch(search_cls):
+
+        def _set_samples_by_family_index(self, families, skip_unaffected_families):
+            self.samples_by_family_index = dataset.samples_by_family_index(index_names)
+            self._skipped_sample_count = defaultdict(int)
+
+        def _set_index_metadata(self):
+            self._client = dataset.client
+            self.index_name = ','.join(self._indices)
+            self.index_metadata = {index_name: dataset.index_metadata[index_name] for index_name in self._indices}
+
+        @staticmethod
+        def _get_index_sample_count(index):
+            return len(dataset.families) * SAMPLES_PER_FAMILY
+
+    return SyntheticSearch
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the variant search pipeline with synthetic elasticsearch responses. No elasticsearch cluster ' \
+           'or database is required, but search results are cached in redis when it is available, and are removed ' \
+           'after each run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--num-hits', type=int, default=MAX_VARIANTS, help='number of variants in each index')
+        parser.add_argument('--num-families', type=int, default=1000, help='number of searched families')
+        parser.add_argument('--num-genes', type=int, default=MAX_COMPOUND_HET_GENES, help='number of genes')
+        parser.add_argument('--iterations', type=int, default=3, help='number of timed runs of each benchmark')
+        parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS.keys()),
+                            help='benchmark to run. Can be specified multiple times, defaults to all benchmarks')
+
+    def handle(self, *args, **options):
+        if options['num_hits'] > MAX_VARIANTS:
+            raise CommandError('Unable to benchmark more than {} hits'.format(MAX_VARIANTS))
+        if options['num_genes'] > MAX_COMPOUND_HET_GENES:
+            raise CommandError('Unable to benchmark more than {} genes'.format(MAX_COMPOUND_HET_GENES))
+
+        dataset = SyntheticDataset(options['num_hits'], options['num_families'], options['num_genes'])
+        logger.info('Benchmarking {} hits for {} families ({} iterations)'.format(
+            options['num_hits'], options['num_families'], options['iterations']))
+
+        for name in options['benchmark'] or sorted(BENCHMARKS.keys()):
+            setup, run, teardown = BENCHMARKS[name]
+            durations = []
+            for _ in range(options['iterations']):
+                run_args = setup(dataset)
+                try:
+                    start = time.perf_counter()
+                    num_items = run(*run_args)
+                    durations.append(time.perf_counter() - start)
+                finally:
+                    if teardown:
+                        teardown(*run_args)
+
+            # Memory tracing slows down execution, so peak memory is measured in a separate untimed run
+            run_args = setup(dataset)
+            tracemalloc.start()
+            try:
+                run(*run_args)
+                _, peak_memory = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                if teardown:
+                    teardown(*run_args)
+
+            logger.info('{}: {} items, mean {:.4f}s, min {:.4f}s, {:.0f} items/s, peak memory {:.1f} MiB'.format(
+                name, num_items, mean(durations), min(durations), num_items / min(durations) if min(durations) else 0,
+                peak_memory / 1024 ** 2))
+
+
+def _setup_get_es_variants(dataset):
+    search_model = SimpleNamespace(
+        guid='VSR_benchmark_{}'.format(uuid.uuid4().hex),
+        variant_search=SimpleNamespace(search=BENCHMARK_SEARCH),
+        families=SimpleNamespace(all=lambda: dataset.families),
+    )
+    return search_model, _synthetic_search_cls(EsSearch, dataset, BENCHMARK_INDEX_NAMES[:1])
+
+
+def _run_get_es_variants(search_model, search_cls):
+    variants, _ = get_es_variants(search_model, es_search_cls=search_cls, num_results=MAX_VARIANTS)
+    return len(variants)
+
+
+def _teardown_get_es_variants(search_model, search_cls):
+    # Removes the cached search state, result chunks and job status for the synthetic search
+    safe_redis_delete_matching('search_results__{}*'.format(search_model.guid))
+
+
+def _index_search(dataset, search_cls=EsSearch, index_names=None):
+    index_names = index_names or BENCHMARK_INDEX_NAMES
+    es_search = _synthetic_search_cls(search_cls, dataset, index_names)(dataset.families)
+    es_search.sort(XPOS_SORT_KEY)
+    return es_search
+
+
+def _setup_parse_hits(dataset):
+    response = dataset.parsed_index_responses(BENCHMARK_INDEX_NAMES[:1])[BENCHMARK_INDEX_NAMES[0]]
+    return _index_search(dataset, index_names=BENCHMARK_INDEX_NAMES[:1]), list(response)
+
+
+def _run_parse_hits(es_search, hits):
+    for hit in hits:
+        es_search._parse_hit(hit)
+    return len(hits)
+
+
+def _parsed_index_results(dataset):
+    es_search = _index_search(dataset)
+    return es_search, {
+        index_name: [es_search._parse_hit(hit) for hit in response]
+        for index_name, response in dataset.parsed_index_responses(BENCHMARK_INDEX_NAMES).items()
+    }
+
+
+def _setup_process_multi_search_responses(dataset):
+    es_search, results_by_index = _parsed_index_results(dataset)
+    es_search.previous_search_results['loaded_variant_counts'] = {
+        index_name: {'loaded': 0, 'total': 0} for index_name in results_by_index.keys()
+    }
+    parsed_responses = [
+        (results, len(results), False, index_name) for index_name, results in results_by_index.items()
+    ]
+    return es_search, parsed_responses
+
+
+def _run_process_multi_search_responses(es_search, parsed_responses):
+    es_search._process_multi_search_responses(parsed_responses, num_results=MAX_VARIANTS)
+    return sum(len(results) for results, _, _, _ in parsed_responses)
+
+
+def _setup_deduplicate_results(dataset):
+    es_search, results_by_index = _parsed_index_results(dataset)
+    sorted_results = sorted(
+        [deepcopy(variant) for results in results_by_index.values() for variant in results],
+        key=lambda variant: variant['_sort'])
+    es_search.previous_search_results['total_results'] = len(sorted_results)
+    return es_search, sorted_results
+
+
+def _run_deduplicate_results(es_search, sorted_results):
+    es_search._deduplicate_results(sorted_results)
+    return len(sorted_results)
+
+
+def _setup_gene_aggregation(dataset):
+    es_search = _index_search(dataset, search_cls=EsGeneAggSearch, index_names=BENCHMARK_INDEX_NAMES[:1])
+    return es_search, dataset.gene_aggregation_response()
+
+
+def _run_gene_aggregation(es_search, response):
+    es_search._parse_response(response)
+    return len(response.aggregations.genes.buckets)
+
+
+BENCHMARKS = {
+    'get_es_variants': (_setup_get_es_variants, _run_get_es_variants, _teardown_get_es_variants),
+    'parse_hit': (_setup_parse_hits, _run_parse_hits, None),
+    'process_multi_search_responses': (
+        _setup_process_multi_search_responses, _run_process_multi_search_responses, None),
+    'deduplicate_results': (_setup_deduplicate_results, _run_deduplicate_results, None),
+    'gene_aggregation': (_setup_gene_aggregation, _run_gene_aggregation, None),
+}
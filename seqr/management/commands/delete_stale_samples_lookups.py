@@ -0,0 +1,24 @@
+from datetime import timedelta
+import logging
+from django.core.management.base import BaseCommand, CommandError
+
+from seqr.utils.elasticsearch.es_search import SAMPLES_LOOKUP_MAX_AGE
+from seqr.utils.elasticsearch.utils import delete_stale_samples_lookups
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete stored search samples lookups which have not been used recently'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age-days', type=int, default=SAMPLES_LOOKUP_MAX_AGE.days,
+            help='delete lookups which have not been used for this many days')
+
+    def handle(self, *args, **options):
+        try:
+            deleted = delete_stale_samples_lookups(max_age=timedelta(days=options['max_age_days']))
+        except ValueError as e:
+            raise CommandError(str(e))
+        logger.info('Deleted {} stale samples lookups'.format(deleted))
@@ -3,9 +3,8 @@ from collections import defaultdict
 from django.core.management.base import BaseCommand, CommandError
 from django.db.models import prefetch_related_objects
 from django.db.models.query_utils import Q
-from pyliftover.liftover import LiftOver
 
-from reference_data.models import GENOME_VERSION_GRCh38
+from reference_data.models import GENOME_VERSION_GRCh37, GENOME_VERSION_GRCh38
 from seqr.models import Project, SavedVariant, Individual
 from seqr.views.apis.dataset_api import _update_variant_samples
 from seqr.views.utils.dataset_utils import match_sample_ids_to_sample_records, validate_index_metadata, \
@@ -14,6 +13,7 @@ from seqr.views.utils.json_to_orm_utils import update_model_from_json
 from seqr.views.utils.orm_to_json_utils import get_json_for_saved_variants
 from seqr.views.utils.variant_utils import reset_cached_search_results
 from seqr.utils.elasticsearch.utils import get_es_variants_for_variant_tuples, get_single_es_variant
+from seqr.utils.liftover_utils import liftover_positions
 from seqr.utils.xpos_utils import get_xpos
 
 logger = logging.getLogger(__name__)
@@ -93,16 +93,18 @@ class Command(BaseCommand):
         logger.info('Lifting over {} variants (skipping {} that are already lifted)'.format(
             len(saved_variants_to_lift), num_already_lifted))
 
-        liftover_to_38 = LiftOver('hg19', 'hg38')
+        lifted_positions = liftover_positions(
+            GENOME_VERSION_GRCh37, [(v['chrom'], v['pos']) for v in saved_variants_to_lift])
+        if lifted_positions is None:
+            raise CommandError('Error: unable to set up liftover')
         hg37_to_hg38_xpos = {}
         lift_failed = {}
         for v in saved_variants_to_lift:
-            if not (hg37_to_hg38_xpos.get(v['xpos']) or v['xpos'] in lift_failed):
-                hg38_coord = liftover_to_38.convert_coordinate('chr{}'.format(v['chrom'].lstrip('chr')), int(v['pos']))
-                if hg38_coord and hg38_coord[0]:
-                    hg37_to_hg38_xpos[v['xpos']] = get_xpos(hg38_coord[0][0], hg38_coord[0][1])
-                else:
-                    lift_failed[v['xpos']] = v
+            hg38_coord = lifted_positions[(v['chrom'], v['pos'])]
+            if hg38_coord:
+                hg37_to_hg38_xpos[v['xpos']] = get_xpos(*hg38_coord)
+            elif v['xpos'] not in lift_failed:
+                lift_failed[v['xpos']] = v
 
         if lift_failed:
             if input(
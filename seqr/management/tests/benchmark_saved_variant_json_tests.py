@@ -0,0 +1,40 @@
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from seqr.models import SavedVariant, VariantTag, VariantNote, VariantFunctionalData
+
+PROJECT_GUID = 'R0001_1kg'
+
+
+@mock.patch('seqr.management.commands.benchmark_saved_variant_json.logger')
+class BenchmarkSavedVariantJsonTest(TestCase):
+    databases = '__all__'
+    fixtures = ['users', '1kg_project']
+
+    def test_command(self, mock_logger):
+        num_saved_variants = SavedVariant.objects.count()
+        num_tags = VariantTag.objects.count()
+        num_notes = VariantNote.objects.count()
+        num_functional_data = VariantFunctionalData.objects.count()
+        num_project_variants = SavedVariant.objects.filter(family__project__guid=PROJECT_GUID).count()
+
+        call_command('benchmark_saved_variant_json', PROJECT_GUID, '--num-variants=20', '--iterations=2')
+
+        mock_logger.info.assert_called_once()
+        self.assertRegex(
+            mock_logger.info.call_args[0][0],
+            r'{} saved variants, \d+ tags, \d+ notes, \d+ functional data: mean [\d.]+s, min [\d.]+s, 5 queries'.format(
+                num_project_variants + 20))
+
+        # Test synthetic data is removed
+        self.assertEqual(SavedVariant.objects.count(), num_saved_variants)
+        self.assertEqual(VariantTag.objects.count(), num_tags)
+        self.assertEqual(VariantNote.objects.count(), num_notes)
+        self.assertEqual(VariantFunctionalData.objects.count(), num_functional_data)
+
+        with self.assertRaises(CommandError) as ce:
+            call_command('benchmark_saved_variant_json', 'R_invalid')
+        self.assertEqual(str(ce.exception), 'Invalid project: R_invalid')
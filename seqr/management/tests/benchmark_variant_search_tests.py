@@ -0,0 +1,46 @@
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+BENCHMARK_RESULT_REGEX = r'{}: {} items, mean [\d.]+s, min [\d.]+s, \d+ items/s, peak memory [\d.]+ MiB'
+
+
+@mock.patch('seqr.utils.redis_utils.redis.StrictRedis')
+@mock.patch('seqr.management.commands.benchmark_variant_search.logger')
+class BenchmarkVariantSearchTest(TestCase):
+
+    def test_command(self, mock_logger, mock_redis):
+        mock_redis.return_value.get.return_value = None
+        mock_redis.return_value.scan_iter.side_effect = lambda match: iter([match])
+
+        call_command(
+            'benchmark_variant_search', '--num-hits=20', '--num-families=4', '--num-genes=5', '--iterations=2')
+
+        log_messages = [call[0][0] for call in mock_logger.info.call_args_list]
+        self.assertEqual(log_messages[0], 'Benchmarking 20 hits for 4 families (2 iterations)')
+        self.assertEqual(len(log_messages), 6)
+        for message, (name, num_items) in zip(log_messages[1:], [
+            ('deduplicate_results', 40), ('gene_aggregation', 5), ('get_es_variants', 20), ('parse_hit', 20),
+            ('process_multi_search_responses', 40),
+        ]):
+            self.assertRegex(message, BENCHMARK_RESULT_REGEX.format(name, num_items))
+
+        # Test cached search results are removed after each get_es_variants run
+        deleted_patterns = [call.kwargs['match'] for call in mock_redis.return_value.scan_iter.call_args_list]
+        self.assertEqual(len(deleted_patterns), 3)
+        self.assertEqual(len(set(deleted_patterns)), 3)
+        for pattern in deleted_patterns:
+            self.assertRegex(pattern, r'^search_results__VSR_benchmark_[0-9a-f]{32}\*$')
+        self.assertEqual(mock_redis.return_value.delete.call_count, 3)
+
+        # Test running a single benchmark
+        mock_logger.reset_mock()
+        call_command('benchmark_variant_search', '--num-hits=20', '--num-families=4', '--benchmark=parse_hit')
+        self.assertEqual(mock_logger.info.call_count, 2)
+        self.assertRegex(mock_logger.info.call_args[0][0], BENCHMARK_RESULT_REGEX.format('parse_hit', 20))
+
+        with self.assertRaises(CommandError) as ce:
+            call_command('benchmark_variant_search', '--num-hits=20000')
+        self.assertEqual(str(ce.exception), 'Unable to benchmark more than 10000 hits')
@@ -0,0 +1,36 @@
+import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+
+@mock.patch('seqr.utils.elasticsearch.utils.time')
+@mock.patch('seqr.utils.elasticsearch.utils.get_es_client')
+@mock.patch('seqr.management.commands.delete_stale_samples_lookups.logger')
+class DeleteStaleSamplesLookupsTest(TestCase):
+
+    def test_command(self, mock_logger, mock_get_es_client, mock_time):
+        mock_time.time.return_value = 1000000
+        mock_delete_by_query = mock_get_es_client.return_value.delete_by_query
+        mock_delete_by_query.return_value = {'deleted': 3}
+
+        call_command('delete_stale_samples_lookups')
+        mock_delete_by_query.assert_called_with(
+            index='seqr_search_samples_lookup', body={'query': {'range': {'last_used': {'lt': 395200}}}}, ignore=404)
+        mock_logger.info.assert_called_with('Deleted 3 stale samples lookups')
+
+        # Test when the lookup index does not exist
+        mock_delete_by_query.return_value = {'error': {'type': 'index_not_found_exception'}, 'status': 404}
+        call_command('delete_stale_samples_lookups', '--max-age-days=2')
+        mock_delete_by_query.assert_called_with(
+            index='seqr_search_samples_lookup', body={'query': {'range': {'last_used': {'lt': 827200}}}}, ignore=404)
+        mock_logger.info.assert_called_with('Deleted 0 stale samples lookups')
+
+        # Test lookups are not deleted while their cache markers may still be set
+        mock_delete_by_query.reset_mock()
+        with self.assertRaises(CommandError) as ce:
+            call_command('delete_stale_samples_lookups', '--max-age-days=1')
+        self.assertEqual(
+            str(ce.exception), 'Samples lookups can only be deleted once their cache markers expire after 1 day, 0:00:00')
+        mock_delete_by_query.assert_not_called()
@@ -3,7 +3,7 @@ import mock
 from copy import deepcopy
 from django.core.management.base import CommandError
 from seqr.models import Family
-from pyliftover.liftover import LiftOver
+from seqr.utils import liftover_utils
 from seqr.views.utils.test_utils import VARIANTS, SINGLE_VARIANT
 
 from django.core.management import call_command
@@ -21,8 +21,6 @@ INDEX_METADATA = {
 }
 SAMPLE_IDS = ["NA19679", "NA19675_1", "NA19678", "HG00731", "HG00732", "HG00733"]
 
-liftover_to_38 = LiftOver('hg19', 'hg38')
-
 LIFT_MAP = {
     21003343353: [('chr21', 3343400)],
     1248367227: [('chr1', 248203925)],
@@ -36,6 +34,7 @@ def mock_convert_coordinate(chrom, pos):
     return(LIFT_MAP[pos])
 
 
+@mock.patch.dict('seqr.utils.liftover_utils.LIFTOVERS', clear=True)
 @mock.patch('seqr.management.commands.lift_project_to_hg38.logger')
 @mock.patch('seqr.management.commands.lift_project_to_hg38.get_elasticsearch_index_samples')
 class LiftProjectToHg38Test(TestCase):
@@ -43,7 +42,7 @@ class LiftProjectToHg38Test(TestCase):
 
     @mock.patch('seqr.management.commands.lift_project_to_hg38.input')
     @mock.patch('seqr.management.commands.lift_project_to_hg38.get_es_variants_for_variant_tuples')
-    @mock.patch('seqr.management.commands.lift_project_to_hg38.LiftOver')
+    @mock.patch('seqr.utils.liftover_utils.LiftOver')
     def test_command(self, mock_liftover, mock_get_es_variants, mock_input, mock_get_es_samples, mock_logger):
         mock_get_es_samples.return_value = SAMPLE_IDS, INDEX_METADATA
         mock_get_es_variants.return_value = VARIANTS
@@ -150,7 +149,7 @@ class LiftProjectToHg38Test(TestCase):
     @mock.patch('seqr.management.commands.lift_project_to_hg38.input')
     @mock.patch('seqr.management.commands.lift_project_to_hg38.get_es_variants_for_variant_tuples')
     @mock.patch('seqr.management.commands.lift_project_to_hg38.get_single_es_variant')
-    @mock.patch('seqr.management.commands.lift_project_to_hg38.LiftOver')
+    @mock.patch('seqr.utils.liftover_utils.LiftOver')
     def test_command_other_exceptions(self, mock_liftover, mock_single_es_variants,
             mock_get_es_variants, mock_input, mock_get_es_samples, mock_logger):
         mock_get_es_samples.return_value = SAMPLE_IDS, INDEX_METADATA
@@ -175,6 +174,7 @@ class LiftProjectToHg38Test(TestCase):
         # Test discontinue on failure of finding a variant in the index
         mock_get_es_variants.return_value = VARIANTS
         mock_liftover_to_38.convert_coordinate.side_effect = mock_convert_coordinate
+        liftover_utils.LIFTOVERS.clear()  # reloading the liftover resets the cached lifted positions
         mock_logger.reset_mock()
         with self.assertRaises(CommandError) as ce:
             call_command('lift_project_to_hg38', '--project={}'.format(PROJECT_NAME),
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seqr', '0022_auto_20210201_2151'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='savedvariant',
+            index=models.Index(fields=['variant_id', 'family'], name='seqr_savedv_variant_7912cf_idx'),
+        ),
+    ]
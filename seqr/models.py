@@ -627,6 +627,7 @@ class SavedVariant(ModelWithGUID):
 
     class Meta:
         unique_together = ('xpos', 'xpos_end', 'variant_id', 'family')
+        indexes = [models.Index(fields=['variant_id', 'family'])]
 
         json_fields = ['guid', 'xpos', 'ref', 'alt', 'variant_id', 'selected_main_transcript_id']
 
@@ -88,6 +88,7 @@ from seqr.views.apis.variant_search_api import \
     export_variants_handler, \
     get_saved_search_handler, \
     get_variant_gene_breakdown, \
+    get_variant_search_job_status, \
     create_saved_search_handler,\
     update_saved_search_handler, \
     delete_saved_search_handler
@@ -198,6 +199,7 @@ api_endpoints = {
     'search/(?P<search_hash>[^/]+)': query_variants_handler,
     'search/(?P<search_hash>[^/]+)/download': export_variants_handler,
     'search/(?P<search_hash>[^/]+)/gene_breakdown': get_variant_gene_breakdown,
+    'search/(?P<search_hash>[^/]+)/job_status': get_variant_search_job_status,
     'search_context': search_context_handler,
     'saved_search/all': get_saved_search_handler,
     'saved_search/create': create_saved_search_handler,
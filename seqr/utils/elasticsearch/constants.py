@@ -3,7 +3,9 @@ from seqr.models import Individual
 
 MAX_VARIANTS = 10000
 MAX_COMPOUND_HET_GENES = 1000
+COMPOUND_HET_GENE_PAGE_SIZE = 1000
 MAX_INDEX_NAME_LENGTH = 7500
+SAMPLES_LOOKUP_INDEX = 'seqr_search_samples_lookup'
 
 XPOS_SORT_KEY = 'xpos'
 
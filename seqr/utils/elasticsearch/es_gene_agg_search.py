@@ -11,6 +11,10 @@ class EsGeneAggSearch(EsSearch):
     AGGREGATION_NAME = 'gene aggregation'
     CACHED_COUNTS_KEY = None
 
+    def __init__(self, *args, **kwargs):
+        super(EsGeneAggSearch, self).__init__(*args, **kwargs)
+        self._families_by_sample = None
+
     def aggregate_by_gene(self):
         searches = [self._search]
         for index_searches in self._index_searches.values():
@@ -20,7 +24,7 @@ class EsGeneAggSearch(EsSearch):
             agg = search.aggs.bucket(
                 'genes', 'terms', field='mainTranscript_gene_id', size=MAX_COMPOUND_HET_GENES+1
             )
-            if self._no_sample_filters or self._any_affected_sample_filters:
+            if self._no_sample_filters or self._any_affected_sample_filters or self._samples_lookup_filters:
                 for key in HAS_ALT_FIELD_KEYS:
                     agg.bucket(key, 'terms', field=key, size=10000)
             else:
@@ -56,7 +60,7 @@ class EsGeneAggSearch(EsSearch):
 
         return gene_aggs
 
-    def _parse_response(self, response):
+    def _parse_response(self, response, search=None, hits=None):
         if len(response.aggregations.genes.buckets) > MAX_COMPOUND_HET_GENES:
             from seqr.utils.elasticsearch.utils import InvalidSearchException
             raise InvalidSearchException('This search returned too many genes')
@@ -71,12 +75,7 @@ class EsGeneAggSearch(EsSearch):
                     for family_guid in hit.meta.matched_queries:
                         gene_counts[gene_id]['families'][family_guid] += 1
             else:
-                families_by_sample = {}
-                for index_samples_by_family in self.samples_by_family_index.values():
-                    for family_guid, samples_by_id in index_samples_by_family.items():
-                        for sample_id in samples_by_id.keys():
-                            families_by_sample[sample_id] = family_guid
-
+                families_by_sample = self._get_families_by_sample()
                 for key in HAS_ALT_FIELD_KEYS:
                     for sample_agg in gene_agg[key]['buckets']:
                         family_guid = families_by_sample.get(sample_agg['key'])
@@ -90,6 +89,16 @@ class EsGeneAggSearch(EsSearch):
 
         return gene_counts
 
+    def _get_families_by_sample(self):
+        if self._families_by_sample is None:
+            self._families_by_sample = {
+                sample_id: family_guid
+                for index_samples_by_family in self.samples_by_family_index.values()
+                for family_guid, samples_by_id in index_samples_by_family.items()
+                for sample_id in samples_by_id.keys()
+            }
+        return self._families_by_sample
+
     def _add_compound_hets(self, gene_counts):
         # Compound hets are always loaded as part of the initial search and are not part of the fetched aggregation
         loaded_compound_hets = self.previous_search_results.get('grouped_results', []) + \
@@ -1,12 +1,15 @@
 from collections import defaultdict
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import elasticsearch
-from elasticsearch_dsl import Search, Q, MultiSearch
+from functools import lru_cache
+from elasticsearch_dsl import Search, Q, MultiSearch, A
 import hashlib
+import heapq
 import json
 import logging
-from pyliftover.liftover import LiftOver
 from sys import maxsize
+import time
 from itertools import combinations
 
 from reference_data.models import GENOME_VERSION_GRCh38, GENOME_VERSION_GRCh37
@@ -15,29 +18,85 @@ from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY, COMPOUND_HET, RECE
     HAS_ALT_FIELD_KEYS, GENOTYPES_FIELD_KEY, GENOTYPE_FIELDS_CONFIG, POPULATION_RESPONSE_FIELD_CONFIGS, POPULATIONS, \
     SORTED_TRANSCRIPTS_FIELD_KEY, CORE_FIELDS_CONFIG, NESTED_FIELDS, PREDICTION_FIELDS_CONFIG, INHERITANCE_FILTERS, \
     QUERY_FIELD_NAMES, REF_REF, ANY_AFFECTED, GENOTYPE_QUERY_MAP, CLINVAR_SIGNFICANCE_MAP, HGMD_CLASS_MAP, \
-    SORT_FIELDS, MAX_VARIANTS, MAX_COMPOUND_HET_GENES, MAX_INDEX_NAME_LENGTH, QUALITY_FIELDS, \
-    GRCH38_LOCUS_FIELD
+    SORT_FIELDS, MAX_VARIANTS, COMPOUND_HET_GENE_PAGE_SIZE, MAX_INDEX_NAME_LENGTH, \
+    QUALITY_FIELDS, GRCH38_LOCUS_FIELD, SAMPLES_LOOKUP_INDEX
+from seqr.utils.elasticsearch.index_metadata_cache import get_cached_index_value, set_cached_index_value
+from seqr.utils.elasticsearch.search_context_cache import get_samples_by_family_index
+from seqr.utils.elasticsearch.search_profiler import timed_phase, CONTEXT_PHASE, INDEX_METADATA_PHASE, \
+    ES_SEARCH_PHASE, PARSE_PHASE, MERGE_PHASE, COMPOUND_HET_PHASE
+from seqr.utils.liftover_utils import liftover_position, liftover_positions, LIFTED_GENOME_VERSIONS
 from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json
 from seqr.utils.xpos_utils import get_xpos
 from seqr.views.utils.json_utils import _to_camel_case
+from settings import ELASTICSEARCH_SEARCH_AFTER_PAGINATION, ELASTICSEARCH_SEARCH_THREADS, \
+    ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+# Genotype queries are rebuilt for every family on every page of a search, so compiled queries are cached by the
+# inputs they are built from and only need to be rebuilt when the family samples or search filters change
+GENOTYPE_QUERY_CACHE_SIZE = 10000
+GENOTYPE_QUERY_FIELDS = {'samples'}.union(*[
+    config.get('allowed_num_alt', []) + config.get('not_allowed_num_alt', []) for config in GENOTYPE_QUERY_MAP.values()
+])
+
+# Search results are cached for 2 weeks, so markers for stored sample lookups must expire sooner. Lookups are rewritten
+# with the time they were last used whenever their marker expires, so lookups which are unused for longer than the
+# marker expiry can be deleted
+SAMPLES_LOOKUP_CACHE_EXPIRE = timedelta(days=1)
+SAMPLES_LOOKUP_MAX_AGE = timedelta(days=7)
+
 
 class EsSearch(object):
 
     AGGREGATION_NAME = 'compound het'
     CACHED_COUNTS_KEY = 'loaded_variant_counts'
+    SEARCH_AFTER_CURSORS_KEY = 'search_after_cursors'
+    LOADED_VARIANT_KEYS_KEY = 'loaded_variant_keys'
 
     def __init__(self, families, previous_search_results=None, skip_unaffected_families=False,
-                 return_all_queried_families=False):
-        from seqr.utils.elasticsearch.utils import get_es_client, InvalidIndexException, InvalidSearchException
-        self._client = get_es_client()
+                 return_all_queried_families=False, profiler=None, es_timeout=None):
+        from seqr.utils.elasticsearch.utils import get_es_client, InvalidIndexException
+        self._client = get_es_client(timeout=es_timeout) if es_timeout else get_es_client()
+        self._profiler = profiler
+
+        with timed_phase(self._profiler, CONTEXT_PHASE):
+            self._set_samples_by_family_index(families, skip_unaffected_families)
+
+        self._indices = sorted(list(self.samples_by_family_index.keys()))
+        with timed_phase(self._profiler, INDEX_METADATA_PHASE):
+            self._set_index_metadata()
+
+        if len(self.samples_by_family_index) > len(self.index_metadata):
+            raise InvalidIndexException('Could not find expected indices: {}'.format(
+                ', '.join(sorted(set(self._indices) - set(self.index_metadata.keys()), reverse = True))
+            ))
+
+        self.indices_by_dataset_type = defaultdict(list)
+        for index in self._indices:
+            dataset_type = self.index_metadata[index].get('datasetType', Sample.DATASET_TYPE_VARIANT_CALLS)
+            self.indices_by_dataset_type[dataset_type].append(index)
+
+        self.previous_search_results = previous_search_results or {}
+        self._return_all_queried_families = return_all_queried_families
 
-        self.samples_by_family_index = defaultdict(lambda: defaultdict(dict))
-        samples = Sample.objects.filter(is_active=True, individual__family__in=families)
-        for s in samples.select_related('individual__family'):
-            self.samples_by_family_index[s.elasticsearch_index][s.individual.family.guid][s.sample_id] = s
+        self._search = Search()
+        self._index_searches = defaultdict(list)
+        self._sort = None
+        self._allowed_consequences = None
+        self._allowed_consequences_secondary = None
+        self._filtered_variant_ids = None
+        self._no_sample_filters = False
+        self._any_affected_sample_filters = False
+        self._samples_lookup_filters = False
+        self._family_individual_affected_status = {}
+        self._index_sample_lookups = {}
+        self._search_after_pages = {}
+        self._loaded_variant_keys = None
+
+    def _set_samples_by_family_index(self, families, skip_unaffected_families):
+        from seqr.utils.elasticsearch.utils import InvalidSearchException
+        self.samples_by_family_index = get_samples_by_family_index(families)
 
         if len(self.samples_by_family_index) < 1:
             raise InvalidSearchException('No es index found for families {}'.format(
@@ -65,42 +124,16 @@ class EsSearch(object):
             if len(self.samples_by_family_index) < 1:
                 raise InvalidSearchException('Inheritance based search is disabled in families with no data loaded for affected individuals')
 
-        self._indices = sorted(list(self.samples_by_family_index.keys()))
-        self._set_index_metadata()
-
-        if len(self.samples_by_family_index) > len(self.index_metadata):
-            raise InvalidIndexException('Could not find expected indices: {}'.format(
-                ', '.join(sorted(set(self._indices) - set(self.index_metadata.keys()), reverse = True))
-            ))
-
-        self.indices_by_dataset_type = defaultdict(list)
-        for index in self._indices:
-            dataset_type = self.index_metadata[index].get('datasetType', Sample.DATASET_TYPE_VARIANT_CALLS)
-            self.indices_by_dataset_type[dataset_type].append(index)
-
-        self.previous_search_results = previous_search_results or {}
-        self._return_all_queried_families = return_all_queried_families
-
-        self._search = Search()
-        self._index_searches = defaultdict(list)
-        self._sort = None
-        self._allowed_consequences = None
-        self._allowed_consequences_secondary = None
-        self._filtered_variant_ids = None
-        self._no_sample_filters = False
-        self._any_affected_sample_filters = False
-        self._family_individual_affected_status = {}
-
     def _set_index_name(self):
         self.index_name = ','.join(sorted(self._indices))
         if len(self.index_name) > MAX_INDEX_NAME_LENGTH:
             alias = hashlib.md5(self.index_name.encode('utf-8')).hexdigest()
             cache_key = 'index_alias__{}'.format(alias)
-            if safe_redis_get_json(cache_key) != self.index_name:
+            if get_cached_index_value(cache_key) != self.index_name:
                 self._client.indices.update_aliases(body={'actions': [
                     {'add': {'indices': self._indices, 'alias': alias}}
                 ]})
-                safe_redis_set_json(cache_key, self.index_name)
+                set_cached_index_value(cache_key, self.index_name)
             self.index_name = alias
 
     def _set_index_metadata(self):
@@ -191,15 +224,17 @@ class EsSearch(object):
         genome_version = locus and locus.get('genomeVersion')
         variant_id_genome_versions = {variant_id: genome_version for variant_id in variant_ids or []}
         if variant_id_genome_versions and genome_version:
-            lifted_genome_version = GENOME_VERSION_GRCh37 if genome_version == GENOME_VERSION_GRCh38 else GENOME_VERSION_GRCh38
-            liftover = _liftover_grch38_to_grch37() if genome_version == GENOME_VERSION_GRCh38 else _liftover_grch37_to_grch38()
-            if liftover:
-                for variant_id in deepcopy(variant_ids):
-                    chrom, pos, ref, alt = self.parse_variant_id(variant_id)
-                    lifted_coord = liftover.convert_coordinate('chr{}'.format(chrom), pos)
-                    if lifted_coord and lifted_coord[0]:
+            source_genome_version = GENOME_VERSION_GRCh38 if genome_version == GENOME_VERSION_GRCh38 else GENOME_VERSION_GRCh37
+            lifted_genome_version = LIFTED_GENOME_VERSIONS[source_genome_version]
+            parsed_variant_ids = [self.parse_variant_id(variant_id) for variant_id in variant_ids]
+            lifted_positions = liftover_positions(
+                source_genome_version, [(chrom, pos) for chrom, pos, _, _ in parsed_variant_ids])
+            if lifted_positions:
+                for chrom, pos, ref, alt in parsed_variant_ids:
+                    lifted_coord = lifted_positions[(chrom, pos)]
+                    if lifted_coord:
                         lifted_variant_id = '{chrom}-{pos}-{ref}-{alt}'.format(
-                            chrom=lifted_coord[0][0].lstrip('chr'), pos=lifted_coord[0][1], ref=ref, alt=alt
+                            chrom=lifted_coord[0], pos=lifted_coord[1], ref=ref, alt=alt
                         )
                         variant_id_genome_versions[lifted_variant_id] = lifted_genome_version
                         variant_ids.append(lifted_variant_id)
@@ -276,15 +311,10 @@ class EsSearch(object):
             genotypes_q = None
             if all_sample_search:
                 search_sample_count = sum(len(samples) for samples in family_samples_by_id.values()) + self._skipped_sample_count[index]
-                index_sample_count = Sample.objects.filter(elasticsearch_index=index, is_active=True).count()
+                index_sample_count = self._get_index_sample_count(index)
                 if search_sample_count == index_sample_count:
                     if inheritance_mode == ANY_AFFECTED:
-                        sample_ids = []
-                        for family_guid, samples_by_id in family_samples_by_id.items():
-                            sample_ids += [
-                                sample_id for sample_id, sample in samples_by_id.items()
-                                if self._family_individual_affected_status[family_guid][sample.individual.guid] == Individual.AFFECTED_STATUS_AFFECTED]
-                        genotypes_q = _any_affected_sample_filter(sample_ids)
+                        genotypes_q = _any_affected_sample_filter(self._get_affected_sample_ids(family_samples_by_id))
                         self._any_affected_sample_filters = True
                     else:
                         # If searching across all families in an index with no inheritance mode we do not need to explicitly
@@ -292,17 +322,31 @@ class EsSearch(object):
                         self._no_sample_filters = True
                         no_filter_indices.add(index)
                         continue
+                elif ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD and \
+                        len(family_samples_by_id) >= ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD:
+                    # Filter on a stored lookup of the searched samples so the request size does not grow with the
+                    # number of families. Hits have no matched queries, so families are attributed from their genotypes
+                    if inheritance_mode == ANY_AFFECTED:
+                        sample_ids = self._get_affected_sample_ids(family_samples_by_id)
+                    else:
+                        sample_ids = [
+                            sample_id for samples_by_id in family_samples_by_id.values() for sample_id in samples_by_id.keys()
+                        ]
+                    genotypes_q = self._samples_lookup_filter(sample_ids)
+                    if genotypes_q:
+                        self._samples_lookup_filters = True
+                        if inheritance_mode == ANY_AFFECTED:
+                            self._any_affected_sample_filters = True
 
             if not genotypes_q:
-                for family_guid in sorted(family_samples_by_id.keys()):
-                    family_samples_q = self._get_family_sample_query(
+                family_sample_queries = [
+                    self._get_family_sample_query(
                         family_guid, family_samples_by_id, quality_filters_by_family,
                         index_fields, inheritance_mode, inheritance_filter
-                    )
-                    if not genotypes_q:
-                        genotypes_q = family_samples_q
-                    else:
-                        genotypes_q |= family_samples_q
+                    ) for family_guid in sorted(family_samples_by_id.keys())
+                ]
+                genotypes_q = family_sample_queries[0] if len(family_sample_queries) == 1 else \
+                    Q('bool', should=family_sample_queries)
 
             self._index_searches[index].append(self._search.filter(genotypes_q))
 
@@ -310,17 +354,42 @@ class EsSearch(object):
             for index in no_filter_indices:
                 self._index_searches[index].append(self._search)
 
+    @staticmethod
+    def _get_index_sample_count(index):
+        return Sample.objects.filter(elasticsearch_index=index, is_active=True).count()
+
+    def _get_affected_sample_ids(self, family_samples_by_id):
+        sample_ids = []
+        for family_guid, samples_by_id in family_samples_by_id.items():
+            sample_ids += [
+                sample_id for sample_id, sample in samples_by_id.items()
+                if self._family_individual_affected_status[family_guid][sample.individual.guid] == Individual.AFFECTED_STATUS_AFFECTED]
+        return sample_ids
+
+    def _samples_lookup_filter(self, sample_ids):
+        sample_ids = sorted(sample_ids)
+        lookup_id = hashlib.md5(','.join(sample_ids).encode('utf-8')).hexdigest()
+        cache_key = 'samples_lookup__{}'.format(lookup_id)
+        if not safe_redis_get_json(cache_key):
+            try:
+                self._client.index(index=SAMPLES_LOOKUP_INDEX, id=lookup_id, body={
+                    'sample_ids': sample_ids, 'last_used': int(time.time()),
+                })
+            except elasticsearch.exceptions.TransportError as e:
+                logger.warning('Unable to store samples lookup {}, filtering on families: {}'.format(lookup_id, str(e)))
+                return None
+            # A removed lookup document silently matches no variants, so it is recreated once the marker expires
+            safe_redis_set_json(cache_key, True, expire=SAMPLES_LOOKUP_CACHE_EXPIRE)
+
+        lookup = {'index': SAMPLES_LOOKUP_INDEX, 'id': lookup_id, 'path': 'sample_ids'}
+        return Q('terms', samples_num_alt_1=lookup) | Q('terms', samples_num_alt_2=lookup) | Q('terms', samples=lookup)
+
     def _get_family_sample_query(self, family_guid, family_samples_by_id, quality_filters_by_family, index_fields, inheritance_mode, inheritance_filter):
-        samples_by_id = family_samples_by_id[family_guid]
-        affected_status = self._family_individual_affected_status.get(family_guid)
-
-        # Filter samples by inheritance
-        if inheritance_mode == ANY_AFFECTED:
-            # Only return variants where at least one of the affected samples has an alt allele
-            sample_ids = [sample_id for sample_id, sample in samples_by_id.items()
-                          if affected_status[sample.individual.guid] == Individual.AFFECTED_STATUS_AFFECTED]
-            family_samples_q = _any_affected_sample_filter(sample_ids)
-        elif inheritance_filter or inheritance_mode:
+        family_samples = _family_samples(
+            family_samples_by_id[family_guid], self._family_individual_affected_status.get(family_guid) or {})
+
+        inheritance_filter_key = None
+        if inheritance_mode != ANY_AFFECTED and (inheritance_filter or inheritance_mode):
             if inheritance_mode:
                 inheritance_filter.update(INHERITANCE_FILTERS[inheritance_mode])
 
@@ -328,21 +397,12 @@ class EsSearch(object):
                 from seqr.utils.elasticsearch.utils import InvalidSearchException
                 raise InvalidSearchException('Inheritance must be specified if custom affected status is set')
 
-            family_samples_q = _family_genotype_inheritance_filter(
-                inheritance_mode, inheritance_filter, samples_by_id, affected_status, index_fields,
-            )
-
-            # For recessive search, should be hom recessive, x-linked recessive, or compound het
-            if inheritance_mode == RECESSIVE:
-                x_linked_q = _family_genotype_inheritance_filter(
-                    X_LINKED_RECESSIVE, inheritance_filter, samples_by_id, affected_status, index_fields,
-                )
-                family_samples_q |= x_linked_q
-        else:
-            # If no inheritance specified only return variants where at least one of the requested samples has an alt allele
-            family_samples_q = _any_affected_sample_filter(list(samples_by_id.keys()))
+            inheritance_filter_key = _inheritance_filter_key(inheritance_filter, family_samples)
 
-        return _named_family_sample_q(family_samples_q, family_guid, quality_filters_by_family)
+        return Q(_compiled_family_sample_query(
+            family_guid, family_samples, inheritance_mode, inheritance_filter_key,
+            _genotype_query_fields(index_fields), quality_filters_by_family.get(family_guid),
+        ))
 
     def _filter_compound_hets(self, quality_filters_by_family, annotations_secondary_search):
         indices = set(self._indices)
@@ -384,19 +444,21 @@ class EsSearch(object):
 
                 affected_status = self._family_individual_affected_status[family_guid]
                 family_samples_q = _family_genotype_inheritance_filter(
-                    COMPOUND_HET, INHERITANCE_FILTERS[COMPOUND_HET], samples_by_id, affected_status, index_fields,
+                    COMPOUND_HET, INHERITANCE_FILTERS[COMPOUND_HET], _family_samples(samples_by_id, affected_status),
+                    index_fields,
                 )
 
                 if paired_index:
                     pair_index_fields = self.index_metadata[paired_index]['fields']
                     pair_samples_by_id = self.samples_by_family_index[paired_index][family_guid]
                     family_samples_q |= _family_genotype_inheritance_filter(
-                        COMPOUND_HET, INHERITANCE_FILTERS[COMPOUND_HET], pair_samples_by_id, affected_status,
-                        pair_index_fields,
+                        COMPOUND_HET, INHERITANCE_FILTERS[COMPOUND_HET],
+                        _family_samples(pair_samples_by_id, affected_status), pair_index_fields,
                     )
                     index = ','.join(sorted([index, paired_index]))
 
-                samples_q = _named_family_sample_q(family_samples_q, family_guid, quality_filters_by_family)
+                samples_q = _named_family_sample_q(
+                    family_samples_q, family_guid, quality_filters_by_family.get(family_guid))
 
                 index_comp_het_q = comp_het_q_by_index.get(index)
                 if not index_comp_het_q:
@@ -406,13 +468,18 @@ class EsSearch(object):
 
         for index, compound_het_q in comp_het_q_by_index.items():
             compound_het_search = (annotations_secondary_search or self._search).filter(compound_het_q)
-            compound_het_search.aggs.bucket(
-                'genes', 'terms', field='geneIds', min_doc_count=2, size=MAX_COMPOUND_HET_GENES + 1
-            ).metric(
-                'vars_by_gene', 'top_hits', size=100, sort=self._sort, _source=QUERY_FIELD_NAMES
-            )
+            self._add_compound_het_genes_agg(compound_het_search)
             self._index_searches[index].append(compound_het_search)
 
+    def _add_compound_het_genes_agg(self, search, after_key=None):
+        # Genes are paged through with a composite aggregation, so the number of gene buckets loaded in each request is
+        # bounded no matter how many genes the search returns
+        genes_agg_kwargs = {'after': after_key} if after_key else {}
+        search.aggs.bucket(
+            'genes', 'composite', sources=[{'gene_id': A('terms', field='geneIds')}], size=COMPOUND_HET_GENE_PAGE_SIZE,
+            **genes_agg_kwargs
+        ).metric('vars_by_gene', 'top_hits', size=100, sort=self._sort, _source=QUERY_FIELD_NAMES)
+
     def search(self,  **kwargs):
         indices = self._indices
 
@@ -460,7 +527,9 @@ class EsSearch(object):
             self.index_name, page=page, num_results=num_results_for_search, start_index=start_index
         )[0]
         response = self._execute_search(search)
-        parsed_response = self._parse_response(response)
+        page_hits = self._consume_search_after_page(self.index_name, response)
+        with timed_phase(self._profiler, PARSE_PHASE):
+            parsed_response = self._parse_response(response, search=search, hits=page_hits)
         return self._process_single_search_response(
             parsed_response, page=page, num_results=num_results, deduplicate=deduplicate, **kwargs)
 
@@ -476,13 +545,17 @@ class EsSearch(object):
             return _get_compound_het_page(variant_results, results_start_index, end_index)
 
         if deduplicate:
-            variant_results = self._deduplicate_results(variant_results)
+            with timed_phase(self._profiler, MERGE_PHASE):
+                variant_results = self._deduplicate_results(variant_results)
 
         # Only save contiguous pages of results:
         previous_all_results = self.previous_search_results.get('all_results', [])
         if len(previous_all_results) >= results_start_index:
-            self.previous_search_results['all_results'] = self.previous_search_results.get('all_results', []) + variant_results
-            variant_results = self.previous_search_results['all_results'][results_start_index:]
+            if deduplicate:
+                self._add_loaded_variant_keys(variant_results)
+            previous_all_results.extend(variant_results)
+            self.previous_search_results['all_results'] = previous_all_results
+            variant_results = previous_all_results[results_start_index:]
 
         return variant_results[:num_results]
 
@@ -493,6 +566,7 @@ class EsSearch(object):
             self.previous_search_results[self.CACHED_COUNTS_KEY] = {}
 
         ms = MultiSearch()
+        index_searches = []
         for index_name in indices:
             start_index = 0
             if self.CACHED_COUNTS_KEY:
@@ -508,13 +582,39 @@ class EsSearch(object):
             ms = ms.index(index_name.split(','))
             for search in searches:
                 ms = ms.add(search)
+                # Only paginated searches move the search_after cursor, aggregations are loaded in a single request
+                index_searches.append((None if search.aggs.to_dict() else index_name, search))
 
-        responses = self._execute_search(ms) if ms._searches else []
-        parsed_responses = [self._parse_response(response) for response in responses]
+        if ELASTICSEARCH_SEARCH_THREADS > 1 and len(index_searches) > 1:
+            parsed_responses = self._execute_parallel_searches(index_searches)
+        else:
+            responses = self._execute_search(ms) if ms._searches else []
+            parsed_responses = [
+                self._parse_index_response(index_name, search, response)
+                for (index_name, search), response in zip(index_searches, responses)
+            ]
         return self._process_multi_search_responses(parsed_responses, **kwargs)
 
+    def _execute_parallel_searches(self, index_searches):
+        """
+        Executes each index search as a separate request on a bounded thread pool, so responses from fast indices are
+        parsed while slower indices are still searching. Parsed responses are returned in the order of the searches
+        """
+        def _execute_index_search(index_search):
+            index_name, search = index_search
+            return self._parse_index_response(index_name, search, self._execute_search(search))
+
+        max_workers = min(ELASTICSEARCH_SEARCH_THREADS, len(index_searches))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(_execute_index_search, index_searches))
+
+    def _parse_index_response(self, index_name, search, response):
+        page_hits = self._consume_search_after_page(index_name, response) if index_name else None
+        with timed_phase(self._profiler, PARSE_PHASE):
+            return self._parse_response(response, search=search, hits=page_hits)
+
     def _process_multi_search_responses(self, parsed_responses, page=1, num_results=100):
-        new_results = []
+        new_results_by_index = []
         compound_het_results = self.previous_search_results.get('compound_het_results', [])
         for response_hits, response_total, is_compound_het, index_name in parsed_responses:
             if not response_total:
@@ -525,7 +625,7 @@ class EsSearch(object):
                 self.previous_search_results['loaded_variant_counts']['{}_compound_het'.format(index_name)] = {
                     'total': response_total, 'loaded': response_total}
             else:
-                new_results += response_hits
+                new_results_by_index.append(response_hits)
                 self.previous_search_results['loaded_variant_counts'][index_name]['total'] = response_total
                 self.previous_search_results['loaded_variant_counts'][index_name]['loaded'] += len(response_hits)
 
@@ -533,37 +633,48 @@ class EsSearch(object):
             counts['total'] for counts in self.previous_search_results['loaded_variant_counts'].values())
         self.previous_search_results['total_results'] = total_results
 
-        # combine new results with unsorted previously loaded results to correctly sort/paginate
+        # combine new results with unsorted previously loaded results to correctly sort/paginate. Each index's results
+        # and the previously loaded results are already sorted, so they are merged rather than re-sorted. Previously
+        # loaded results are already deduplicated, so only the new results need to be deduplicated
         all_loaded_results = self.previous_search_results.get('all_results', [])
-        new_results += self.previous_search_results.get('variant_results', [])
-
-        new_results = sorted(new_results, key=lambda variant: variant['_sort'])
-        variant_results = self._deduplicate_results(new_results)
+        with timed_phase(self._profiler, MERGE_PHASE):
+            new_results = self._deduplicate_results(
+                list(heapq.merge(*new_results_by_index, key=lambda variant: variant['_sort'])))
+            self._add_loaded_variant_keys(new_results)
+            variant_results = list(heapq.merge(
+                new_results, self.previous_search_results.get('variant_results', []),
+                key=lambda variant: variant['_sort'],
+            ))
 
         if compound_het_results or self.previous_search_results.get('grouped_results'):
-            if compound_het_results:
-                compound_het_results = self._deduplicate_compound_het_results(compound_het_results)
-                compound_het_results = _sort_compound_hets(compound_het_results)
-            loaded_results = sum(
-                counts['loaded'] for counts in self.previous_search_results['loaded_variant_counts'].values())
-            return self._process_compound_hets(
-                compound_het_results, variant_results, num_results, all_loaded=loaded_results == total_results)
+            with timed_phase(self._profiler, COMPOUND_HET_PHASE):
+                if compound_het_results:
+                    compound_het_results = self._deduplicate_compound_het_results(compound_het_results)
+                    compound_het_results = _sort_compound_hets(compound_het_results)
+                loaded_results = sum(
+                    counts['loaded'] for counts in self.previous_search_results['loaded_variant_counts'].values())
+                return self._process_compound_hets(
+                    compound_het_results, variant_results, num_results, all_loaded=loaded_results == total_results)
         else:
             end_index = num_results * page
             num_loaded = num_results * page - len(all_loaded_results)
-            self.previous_search_results['all_results'] = all_loaded_results + variant_results[:num_loaded]
+            all_loaded_results.extend(variant_results[:num_loaded])
+            self.previous_search_results['all_results'] = all_loaded_results
             self.previous_search_results['variant_results'] = variant_results[num_loaded:]
             return self.previous_search_results['all_results'][end_index-num_results:end_index]
 
-    def _parse_response(self, response):
+    def _parse_response(self, response, search=None, hits=None):
         index_name = response.hits[0].meta.index if response.hits else None
         if hasattr(response.aggregations, 'genes') and response.hits:
-            response_hits, response_total = self._parse_compound_het_response(response)
+            with timed_phase(self._profiler, COMPOUND_HET_PHASE):
+                response_hits, response_total = self._parse_compound_het_response(response, search)
             return response_hits, response_total, True, index_name
 
         response_total = response.hits.total['value']
         logger.info('Total hits: {} ({} seconds)'.format(response_total, response.took / 1000.0))
-        return [self._parse_hit(hit) for hit in response], response_total, False, index_name
+        if hits is None:
+            hits = response.hits
+        return [self._parse_hit(hit) for hit in hits], response_total, False, index_name
 
     def _parse_hit(self, raw_hit):
         hit = {k: raw_hit[k] for k in QUERY_FIELD_NAMES if k in raw_hit}
@@ -571,39 +682,31 @@ class EsSearch(object):
         index_family_samples = self.samples_by_family_index[index_name]
         is_sv = self.index_metadata[index_name].get('datasetType') == Sample.DATASET_TYPE_SV_CALLS
 
+        samples_by_id, alt_allele_family_guids = self._get_index_sample_lookup(index_name)
         if hasattr(raw_hit.meta, 'matched_queries'):
             family_guids = list(raw_hit.meta.matched_queries)
         elif self._return_all_queried_families:
             family_guids = list(index_family_samples.keys())
         else:
             # Searches for all inheritance and all families do not filter on inheritance so there are no matched_queries
-            alt_allele_samples = set()
-            for alt_samples_field in HAS_ALT_FIELD_KEYS:
-                if alt_samples_field in hit:
-                    alt_allele_samples.update(hit[alt_samples_field])
-
-            if self._any_affected_sample_filters:
-                # If using the any inheritance filter only include matched families
-                def _is_matched_sample(family_guid, sample):
-                    return self._family_individual_affected_status[family_guid][sample.individual.guid] == \
-                           Individual.AFFECTED_STATUS_AFFECTED
-            else:
-                _is_matched_sample = lambda *args: True
-
-            family_guids = [family_guid for family_guid, samples_by_id in index_family_samples.items()
-                            if any(sample_id in alt_allele_samples and _is_matched_sample(family_guid, sample)
-                                   for sample_id, sample in samples_by_id.items())]
+            family_guids = list({
+                family_guid for alt_samples_field in HAS_ALT_FIELD_KEYS if alt_samples_field in hit
+                for sample_id in alt_allele_family_guids.keys() & set(hit[alt_samples_field] or [])
+                for family_guid in alt_allele_family_guids[sample_id]
+            })
 
         genotypes = {}
-        for family_guid in family_guids:
-            samples_by_id = index_family_samples[family_guid]
-            genotypes.update({
-                samples_by_id[genotype_hit['sample_id']].individual.guid: _get_field_values(genotype_hit, GENOTYPE_FIELDS_CONFIG)
-                for genotype_hit in hit[GENOTYPES_FIELD_KEY] if genotype_hit['sample_id'] in samples_by_id
-            })
-            if len(samples_by_id) != len(genotypes) and is_sv:
-                # Family members with no variants are not included in the SV index
-                for sample_id, sample in samples_by_id.items():
+        family_guid_set = set(family_guids)
+        if family_guid_set:
+            for genotype_hit in hit[GENOTYPES_FIELD_KEY]:
+                for family_guid, individual_guid, _, _ in samples_by_id.get(genotype_hit['sample_id'], []):
+                    if family_guid in family_guid_set:
+                        genotypes[individual_guid] = _get_field_values(genotype_hit, GENOTYPE_FIELDS_CONFIG)
+
+        if is_sv:
+            # Family members with no variants are not included in the SV index
+            for family_guid in family_guid_set:
+                for sample_id, sample in index_family_samples.get(family_guid, {}).items():
                     if sample.individual.guid not in genotypes:
                         genotypes[sample.individual.guid] = _get_field_values(
                             {'sample_id': sample_id}, GENOTYPE_FIELDS_CONFIG)
@@ -650,15 +753,10 @@ class EsSearch(object):
                 lifted_over_pos = grch37_locus['position']
             else:
                 # TODO once all projects are lifted in pipeline, remove this code (https://github.com/broadinstitute/seqr/issues/1010)
-                liftover_grch38_to_grch37 = _liftover_grch38_to_grch37()
-                if liftover_grch38_to_grch37:
-                    grch37_coord = liftover_grch38_to_grch37.convert_coordinate(
-                        'chr{}'.format(hit['contig'].lstrip('chr')), int(hit['start'])
-                    )
-                    if grch37_coord and grch37_coord[0]:
-                        lifted_over_genome_version = GENOME_VERSION_GRCh37
-                        lifted_over_chrom = grch37_coord[0][0].lstrip('chr')
-                        lifted_over_pos = grch37_coord[0][1]
+                grch37_coord = liftover_position(GENOME_VERSION_GRCh38, hit['contig'], hit['start'])
+                if grch37_coord:
+                    lifted_over_genome_version = GENOME_VERSION_GRCh37
+                    lifted_over_chrom, lifted_over_pos = grch37_coord
 
         populations = {
             population: _get_field_values(
@@ -696,11 +794,28 @@ class EsSearch(object):
         })
         return result
 
-    def _parse_compound_het_response(self, response):
-        if len(response.aggregations.genes.buckets) > MAX_COMPOUND_HET_GENES:
-            from seqr.utils.elasticsearch.utils import InvalidSearchException
-            raise InvalidSearchException('This search returned too many compound heterozygous variants. Please add stricter filters')
-
+    def _get_index_sample_lookup(self, index_name):
+        """
+        Builds the per-index sample lookups used to attribute hits to families once per search, so parsing each hit
+        scales with the genotypes in the hit rather than with the number of searched families and samples
+        """
+        if index_name not in self._index_sample_lookups:
+            # The same sample ID can belong to individuals in different families, so each ID maps to all its entries
+            samples_by_id = defaultdict(list)
+            alt_allele_family_guids = defaultdict(set)
+            for family_guid, family_samples_by_id in self.samples_by_family_index[index_name].items():
+                affected_status = self._family_individual_affected_status.get(family_guid, {})
+                for sample_id, sample in family_samples_by_id.items():
+                    individual = sample.individual
+                    affected = affected_status.get(individual.guid, individual.affected)
+                    samples_by_id[sample_id].append((family_guid, individual.guid, affected, individual.sex))
+                    # If using the any inheritance filter only include matched families
+                    if affected == Individual.AFFECTED_STATUS_AFFECTED or not self._any_affected_sample_filters:
+                        alt_allele_family_guids[sample_id].add(family_guid)
+            self._index_sample_lookups[index_name] = (dict(samples_by_id), dict(alt_allele_family_guids))
+        return self._index_sample_lookups[index_name]
+
+    def _parse_compound_het_response(self, response, search):
         family_unaffected_individual_guids = {
             family_guid: {individual_guid for individual_guid, affected_status in individual_affected_status.items() if
                           affected_status == Individual.AFFECTED_STATUS_UNAFFECTED}
@@ -708,9 +823,8 @@ class EsSearch(object):
         }
 
         compound_het_pairs_by_gene = {}
-        for gene_agg in response.aggregations.genes.buckets:
-            gene_variants = [self._parse_hit(hit) for hit in gene_agg['vars_by_gene']]
-            gene_id = gene_agg['key']
+        for gene_id, gene_hits in self._iter_compound_het_gene_hits(response, search, compound_het_pairs_by_gene):
+            gene_variants = [self._parse_hit(hit) for hit in gene_hits]
 
             if gene_id in compound_het_pairs_by_gene:
                 continue
@@ -764,6 +878,37 @@ class EsSearch(object):
             compound_het_results.extend([{k: compound_het_pair} for compound_het_pair in compound_het_pairs])
         return compound_het_results, total_compound_het_results
 
+    def _iter_compound_het_gene_hits(self, response, search, compound_het_pairs_by_gene):
+        """
+        Yields the gene id and variant hits for each gene bucket in a compound het response. If the response has a full
+        page of gene buckets, the following pages are loaded with the given search, which is the search the response
+        was returned for. Each page is parsed before the next one is loaded, so only the compound het pairs and a single
+        page of variants are held in memory at a time
+        """
+        from seqr.utils.elasticsearch.utils import InvalidSearchException
+        genes_response = response.aggregations.genes
+        page = 1
+        while True:
+            for gene_agg in genes_response.buckets:
+                # Composite aggregations do not support a minimum doc count
+                if gene_agg['doc_count'] > 1:
+                    yield gene_agg['key']['gene_id'], gene_agg['vars_by_gene']
+
+            after_key = genes_response.to_dict().get('after_key')
+            if not after_key or len(genes_response.buckets) < COMPOUND_HET_GENE_PAGE_SIZE:
+                return
+
+            total_compound_het_results = sum(len(pairs) for pairs in compound_het_pairs_by_gene.values())
+            if total_compound_het_results > MAX_VARIANTS:
+                raise InvalidSearchException(
+                    'This search returned too many compound heterozygous variants. Please add stricter filters')
+
+            page += 1
+            page_search = search[:0]
+            self._add_compound_het_genes_agg(page_search, after_key=after_key)
+            logger.info('Loading {}s page {}'.format(self.AGGREGATION_NAME, page))
+            genes_response = self._execute_search(page_search).aggregations.genes
+
     def _is_primary_compound_het_gene(self, gene_id, gene_variants, compound_het_pairs_by_gene):
         primary_genes = set()
         for variant in gene_variants:
@@ -829,6 +974,12 @@ class EsSearch(object):
                 valid_ch_1_index, valid_ch_2_index in valid_combinations]
 
     def _deduplicate_results(self, sorted_new_results):
+        """
+        Deduplicates newly loaded results against each other and against previously loaded results by their deduplication
+        keys. Duplicates of results which were loaded but not yet returned are merged into the loaded result. Duplicates
+        of results which were already returned are dropped, and are found using the keys of all loaded results which are
+        maintained incrementally in the cached search state
+        """
         original_result_count = len(sorted_new_results)
 
         if self._filtered_variant_ids:
@@ -836,16 +987,33 @@ class EsSearch(object):
                 v for v in sorted_new_results if self._filtered_variant_ids.get(v['variantId']) == v['genomeVersion']
             ]
 
-        genome_builds = {var['genomeVersion'] for var in sorted_new_results}
-        if len(genome_builds) > 1:
-            variant_results = self._deduplicate_multi_genome_variant_results(sorted_new_results)
-        else:
-            variant_results = []
-            for variant in sorted_new_results:
-                if variant_results and variant_results[-1]['variantId'] == variant['variantId']:
-                    self._merge_duplicate_variants(variant_results[-1], variant)
-                else:
+        loaded_variant_keys = self._get_loaded_variant_keys()
+        unreturned_variants_by_key = {
+            self._variant_deduplication_key(variant): variant
+            for variant in self.previous_search_results.get('variant_results', [])
+        }
+        variant_results = []
+        result_indices_by_key = {}
+        for variant in sorted_new_results:
+            key = self._variant_deduplication_key(variant)
+            existing_index = result_indices_by_key.get(key)
+            if existing_index is not None:
+                existing_variant = variant_results[existing_index]
+                if variant['genomeVersion'] == GENOME_VERSION_GRCh38 and \
+                        existing_variant['genomeVersion'] != GENOME_VERSION_GRCh38:
+                    # Prefer the GRCh38 variant, which is returned in its own sort position
+                    self._merge_duplicate_variants(variant, existing_variant)
+                    variant_results[existing_index] = None
+                    result_indices_by_key[key] = len(variant_results)
                     variant_results.append(variant)
+                else:
+                    self._merge_duplicate_variants(existing_variant, variant)
+            elif key in unreturned_variants_by_key:
+                self._merge_duplicate_variants(unreturned_variants_by_key[key], variant)
+            elif key not in loaded_variant_keys:
+                result_indices_by_key[key] = len(variant_results)
+                variant_results.append(variant)
+        variant_results = [variant for variant in variant_results if variant]
 
         previous_duplicates = self.previous_search_results.get('duplicate_doc_count', 0)
         new_duplicates = original_result_count - len(variant_results)
@@ -855,42 +1023,32 @@ class EsSearch(object):
 
         return variant_results
 
-    @classmethod
-    def _deduplicate_multi_genome_variant_results(cls, sorted_new_results):
-        hg_38_variant_indices = {}
-        hg_37_variant_indices = {}
-
-        variant_results = []
-        for i, variant in enumerate(sorted_new_results):
-            if variant['genomeVersion'] == GENOME_VERSION_GRCh38:
-                hg37_id = '{}-{}-{}-{}'.format(variant['liftedOverChrom'], variant['liftedOverPos'], variant['ref'],
-                                               variant['alt'])
-                existing_38_index = hg_38_variant_indices.get(hg37_id)
-                if existing_38_index is not None:
-                    cls._merge_duplicate_variants(variant_results[existing_38_index], variant)
-                    variant_results.append(None)
-                else:
-                    existing_37_index = hg_37_variant_indices.get(hg37_id)
-                    if existing_37_index is not None:
-                        cls._merge_duplicate_variants(variant, variant_results[existing_37_index])
-                        variant_results[existing_37_index] = None
-
-                    hg_38_variant_indices[hg37_id] = i
-                    variant_results.append(variant)
-            else:
-                existing_38_index = hg_38_variant_indices.get(variant['variantId'])
-                existing_37_index = hg_37_variant_indices.get(variant['variantId'])
-                if existing_38_index is not None:
-                    cls._merge_duplicate_variants(variant_results[existing_38_index], variant)
-                    variant_results.append(None)
-                elif existing_37_index is not None:
-                    cls._merge_duplicate_variants(variant_results[existing_37_index], variant)
-                    variant_results.append(None)
-                else:
-                    hg_37_variant_indices[variant['variantId']] = i
-                    variant_results.append(variant)
-
-        return [var for var in variant_results if var]
+    def _variant_deduplication_key(self, variant):
+        if variant['genomeVersion'] == GENOME_VERSION_GRCh38 and self._is_multi_genome_version_search():
+            # GRCh38 variants are matched to GRCh37 variants by their lifted over position
+            if variant['liftedOverPos']:
+                return '{}-{}-{}-{}'.format(
+                    variant['liftedOverChrom'], variant['liftedOverPos'], variant['ref'], variant['alt'])
+            return '{}__{}'.format(GENOME_VERSION_GRCh38, variant['variantId'])
+        return variant['variantId']
+
+    def _is_multi_genome_version_search(self):
+        return len({self.index_metadata[index]['genomeVersion'] for index in self._indices}) > 1
+
+    def _get_loaded_variant_keys(self):
+        if self._loaded_variant_keys is None:
+            self._loaded_variant_keys = set(self.previous_search_results.get(self.LOADED_VARIANT_KEYS_KEY, []))
+        return self._loaded_variant_keys
+
+    def _add_loaded_variant_keys(self, variants):
+        if len(self._indices) < 2:
+            # Results from a single index are never duplicated
+            return
+        new_keys = [self._variant_deduplication_key(variant) for variant in variants]
+        self._get_loaded_variant_keys().update(new_keys)
+        loaded_keys = self.previous_search_results.get(self.LOADED_VARIANT_KEYS_KEY, [])
+        loaded_keys.extend(new_keys)
+        self.previous_search_results[self.LOADED_VARIANT_KEYS_KEY] = loaded_keys
 
     @classmethod
     def _merge_duplicate_variants(cls, variant, duplicate_variant):
@@ -903,30 +1061,26 @@ class EsSearch(object):
         for gene_compound_het_pair in compound_het_results:
             gene = next(iter(gene_compound_het_pair))
             compound_het_pair = gene_compound_het_pair[gene]
-            if gene in results:
-                variant_ids = {variant['variantId'] for variant in compound_het_pair}
-                existing_index = next(
-                    (i for i, existing in enumerate(results[gene]) if
-                     {variant['variantId'] for variant in existing} == variant_ids), None,
-                )
-                if existing_index is not None:
-                    existing_compound_het_pair = results[gene][existing_index]
-
-                    def _update_existing_variant(existing_variant, variant):
-                        existing_variant['genotypes'].update(variant['genotypes'])
-                        existing_variant['familyGuids'] = sorted(
-                            existing_variant['familyGuids'] + variant['familyGuids']
-                        )
-                    _update_existing_variant(existing_compound_het_pair[0], compound_het_pair[0])
-                    _update_existing_variant(existing_compound_het_pair[1], compound_het_pair[1])
-                    duplicates += 1
-                else:
-                    results[gene].append(compound_het_pair)
+            pair_key = (gene, frozenset(variant['variantId'] for variant in compound_het_pair))
+            existing_compound_het_pair = results.get(pair_key)
+            if existing_compound_het_pair:
+                def _update_existing_variant(existing_variant, variant):
+                    existing_variant['genotypes'].update(variant['genotypes'])
+                    existing_variant['familyGuids'] = sorted(
+                        existing_variant['familyGuids'] + variant['familyGuids']
+                    )
+                _update_existing_variant(existing_compound_het_pair[0], compound_het_pair[0])
+                _update_existing_variant(existing_compound_het_pair[1], compound_het_pair[1])
+                duplicates += 1
             else:
-                results[gene] = [compound_het_pair]
+                results[pair_key] = compound_het_pair
 
+        # Results are returned grouped by gene in the order each gene was first loaded
+        pairs_by_gene = defaultdict(list)
+        for (gene, _), compound_het_pair in results.items():
+            pairs_by_gene[gene].append(compound_het_pair)
         deduplicated_results = []
-        for gene, compound_het_pairs in results.items():
+        for gene, compound_het_pairs in pairs_by_gene.items():
             deduplicated_results += [{gene: ch_pair} for ch_pair in compound_het_pairs]
 
         self.previous_search_results['duplicate_doc_count'] = duplicates + self.previous_search_results.get('duplicate_doc_count', 0)
@@ -977,23 +1131,89 @@ class EsSearch(object):
                 end_index = page * num_results
                 if start_index is None:
                     start_index = end_index - num_results
-                if end_index > MAX_VARIANTS:
+
+                cursor = self._get_search_after_cursor(index_name, start_index, end_index)
+                if cursor:
+                    # Results which tie with the last loaded result are re-fetched and dropped from the response
+                    search = search.extra(
+                        search_after=cursor['search_after'], size=end_index - start_index + len(cursor['skip_ids']))
+                elif end_index > MAX_VARIANTS:
                     # ES request size limits are limited by offset + size, which is the same as end_index
                     from seqr.utils.elasticsearch.utils import InvalidSearchException
                     raise InvalidSearchException(
                         'Unable to load more than {} variants ({} requested)'.format(MAX_VARIANTS, end_index))
+                else:
+                    search = search[start_index:end_index]
+
+                if ELASTICSEARCH_SEARCH_AFTER_PAGINATION:
+                    self._search_after_pages[index_name] = {
+                        'start_index': start_index, 'size': end_index - start_index, 'cursor': cursor,
+                    }
 
-                search = search[start_index:end_index]
                 search = search.source(QUERY_FIELD_NAMES)
                 logger.info('Loading {} records {}-{}'.format(index_name, start_index, end_index))
 
+            if self._profiler and self._profiler.include_es_profile:
+                search = search.extra(profile=True)
+
             searches.append(search)
         return searches
 
+    def _get_search_after_cursor(self, index_name, start_index, end_index):
+        if not ELASTICSEARCH_SEARCH_AFTER_PAGINATION:
+            return None
+        cursor = self.previous_search_results.get(self.SEARCH_AFTER_CURSORS_KEY, {}).get(index_name)
+        # Cursors can only be used to load the page directly following the loaded results
+        if not (cursor and cursor['loaded'] == start_index and cursor['search_after'] is not None):
+            return None
+        if cursor['skip_ids'] is None or end_index - start_index + len(cursor['skip_ids']) > MAX_VARIANTS:
+            return None
+        return cursor
+
+    def _consume_search_after_page(self, index_name, response):
+        """
+        Updates the search_after cursor for the index with the hits in a paginated response. The cursor tracks the sort
+        values of the last result which does not tie with the final loaded result, and the ids of the tied results, so
+        results with identical sort values are never skipped when paging from the cursor. Returns the hits in the page,
+        excluding the tied results already loaded from the previous page, or None if the response is not paginated
+        """
+        page = self._search_after_pages.pop(index_name, None)
+        if not page:
+            return None
+
+        hits = list(response.hits)
+        if page['cursor']:
+            skip_ids = set(page['cursor']['skip_ids'])
+            hits = [hit for hit in hits if hit.meta.id not in skip_ids][:page['size']]
+
+        # Searches for different indices may be parsed concurrently, but each only updates the cursor for its own index
+        cursors = self.previous_search_results.setdefault(self.SEARCH_AFTER_CURSORS_KEY, {})
+        cursor = cursors.get(index_name) or {'loaded': 0, 'search_after': None, 'last_sort': None, 'skip_ids': []}
+        if cursor['loaded'] != page['start_index']:
+            # Pages which are not contiguous with the loaded results are not cached, so do not move the cursor
+            return hits
+
+        for hit in hits:
+            sort = hit.meta.to_dict().get('sort')
+            if sort != cursor['last_sort']:
+                if cursor['last_sort'] is not None:
+                    cursor['search_after'] = cursor['last_sort']
+                cursor['last_sort'] = sort
+                cursor['skip_ids'] = []
+            if cursor['skip_ids'] is not None:
+                cursor['skip_ids'].append(hit.meta.id)
+                if len(cursor['skip_ids']) > MAX_VARIANTS:
+                    # Too many tied results to page past with a cursor
+                    cursor['skip_ids'] = None
+        cursor['loaded'] += len(hits)
+        cursors[index_name] = cursor
+        return hits
+
     def _execute_search(self, search):
         logger.debug(json.dumps(search.to_dict(), indent=2))
         try:
-            return search.using(self._client).execute()
+            with timed_phase(self._profiler, ES_SEARCH_PHASE):
+                response = search.using(self._client).execute()
         except elasticsearch.exceptions.ConnectionTimeout as e:
             canceled = self._delete_long_running_tasks()
             logger.warning('ES Query Timeout. Canceled {} long running searches'.format(canceled))
@@ -1005,6 +1225,11 @@ class EsSearch(object):
                     'This search is not supported for large numbers of cases. Try removing family-based inheritance filters or sample-level quality filters')
             raise e
 
+        if self._profiler:
+            for es_response in (response if isinstance(search, MultiSearch) else [response]):
+                self._profiler.record_es_response(es_response)
+        return response
+
     def _delete_long_running_tasks(self):
         search_tasks = self._client.tasks.list(actions='*search', group_by='parents')
         canceled = 0
@@ -1045,29 +1270,6 @@ class EsSearch(object):
         return var_fields[0].lstrip('chr'), int(var_fields[1]), var_fields[2], var_fields[3]
 
 
-# TODO  move liftover to hail pipeline once upgraded to 0.2 (https://github.com/broadinstitute/seqr/issues/1010)
-LIFTOVER_GRCH38_TO_GRCH37 = None
-def _liftover_grch38_to_grch37():
-    global LIFTOVER_GRCH38_TO_GRCH37
-    if not LIFTOVER_GRCH38_TO_GRCH37:
-        try:
-            LIFTOVER_GRCH38_TO_GRCH37 = LiftOver('hg38', 'hg19')
-        except Exception as e:
-            logger.error('ERROR: Unable to set up liftover. {}'.format(e))
-    return LIFTOVER_GRCH38_TO_GRCH37
-
-
-LIFTOVER_GRCH37_TO_GRCH38 = None
-def _liftover_grch37_to_grch38():
-    global LIFTOVER_GRCH37_TO_GRCH38
-    if not LIFTOVER_GRCH37_TO_GRCH38:
-        try:
-            LIFTOVER_GRCH37_TO_GRCH38 = LiftOver('hg19', 'hg38')
-        except Exception as e:
-            logger.error('ERROR: Unable to set up liftover. {}'.format(e))
-    return LIFTOVER_GRCH37_TO_GRCH38
-
-
 def _get_family_affected_status(family_samples_by_id, inheritance_filter):
     individual_affected_status = inheritance_filter.get('affected') or {}
     affected_status = {}
@@ -1097,49 +1299,108 @@ def _quality_filters_by_family(quality_filter, samples_by_family_index, indices)
             for family_guid, samples_by_id in family_samples_by_id.items():
                 family_sample_ids[family_guid].update(samples_by_id.keys())
 
+        # Families are mapped to the hashable inputs for their quality filter, which is compiled when it is used
+        quality_filter_items = tuple(sorted(
+            (field, quality_filter[field]) for field in quality_field_configs.keys() if quality_filter[field]
+        ))
         for family_guid, sample_ids in sorted(family_sample_ids.items()):
-            quality_q = Q()
-            for sample_id in sorted(sample_ids):
-                for field, config in sorted(quality_field_configs.items()):
-                    if quality_filter[field]:
-                        q = _build_or_filter('term', [
-                            {'samples_{}_{}_to_{}'.format(config['field'], i, i + config['step']): sample_id}
-                            for i in range(0, quality_filter[field], config['step'])
-                        ])
-                        if field == 'min_ab':
-                            #  AB only relevant for hets
-                            quality_q &= ~Q(q) | ~Q('term', samples_num_alt_1=sample_id)
-                        else:
-                            quality_q &= ~Q(q)
-            quality_filters_by_family[family_guid] = quality_q
+            quality_filters_by_family[family_guid] = (quality_filter_items, tuple(sorted(sample_ids)))
     return quality_filters_by_family
 
 
+@lru_cache(maxsize=GENOTYPE_QUERY_CACHE_SIZE)
+def _compiled_quality_filter(quality_filter_items, sample_ids):
+    quality_field_configs = {
+        'min_{}'.format(field): {'field': field, 'step': step} for field, step in QUALITY_FIELDS.items()
+    }
+    quality_filter = dict(quality_filter_items)
+    quality_q = Q()
+    for sample_id in sample_ids:
+        for field, config in sorted(quality_field_configs.items()):
+            if quality_filter.get(field):
+                q = _build_or_filter('term', [
+                    {'samples_{}_{}_to_{}'.format(config['field'], i, i + config['step']): sample_id}
+                    for i in range(0, quality_filter[field], config['step'])
+                ])
+                if field == 'min_ab':
+                    #  AB only relevant for hets
+                    quality_q &= ~Q(q) | ~Q('term', samples_num_alt_1=sample_id)
+                else:
+                    quality_q &= ~Q(q)
+    return quality_q.to_dict()
+
+
+def _family_samples(samples_by_id, individual_affected_status):
+    return tuple(
+        (sample_id, sample.individual.guid, sample.individual.sex, individual_affected_status.get(sample.individual.guid))
+        for sample_id, sample in sorted(samples_by_id.items())
+    )
+
+
+def _inheritance_filter_key(inheritance_filter, family_samples):
+    # Custom affected status is already included in the family samples, and custom genotypes are only used for the
+    # individuals in the family
+    individual_guids = {individual_guid for _, individual_guid, _, _ in family_samples}
+    genotype_filter = tuple(sorted(
+        (individual_guid, genotype) for individual_guid, genotype in (inheritance_filter.get('genotype') or {}).items()
+        if individual_guid in individual_guids
+    ))
+    return tuple(sorted(
+        (key, value) for key, value in inheritance_filter.items() if key not in {'affected', 'genotype'}
+    )) + (('genotype', genotype_filter),)
+
+
+def _genotype_query_fields(index_fields):
+    return tuple(sorted(field for field in GENOTYPE_QUERY_FIELDS if field in index_fields))
+
+
+@lru_cache(maxsize=GENOTYPE_QUERY_CACHE_SIZE)
+def _compiled_family_sample_query(family_guid, family_samples, inheritance_mode, inheritance_filter_key, genotype_query_fields, quality_filter_key):
+    # Filter samples by inheritance
+    if inheritance_mode == ANY_AFFECTED:
+        # Only return variants where at least one of the affected samples has an alt allele
+        sample_ids = [sample_id for sample_id, _, _, affected in family_samples
+                      if affected == Individual.AFFECTED_STATUS_AFFECTED]
+        family_samples_q = _any_affected_sample_filter(sample_ids)
+    elif inheritance_filter_key:
+        inheritance_filter = dict(inheritance_filter_key)
+        inheritance_filter['genotype'] = dict(inheritance_filter['genotype'])
+
+        family_samples_q = _family_genotype_inheritance_filter(
+            inheritance_mode, inheritance_filter, family_samples, genotype_query_fields,
+        )
+
+        # For recessive search, should be hom recessive, x-linked recessive, or compound het
+        if inheritance_mode == RECESSIVE:
+            x_linked_q = _family_genotype_inheritance_filter(
+                X_LINKED_RECESSIVE, inheritance_filter, family_samples, genotype_query_fields,
+            )
+            family_samples_q |= x_linked_q
+    else:
+        # If no inheritance specified only return variants where at least one of the requested samples has an alt allele
+        family_samples_q = _any_affected_sample_filter([sample_id for sample_id, _, _, _ in family_samples])
+
+    return _named_family_sample_q(family_samples_q, family_guid, quality_filter_key).to_dict()
+
+
 def _any_affected_sample_filter(sample_ids):
     sample_ids = sorted(sample_ids)
     return Q('terms', samples_num_alt_1=sample_ids) | Q('terms', samples_num_alt_2=sample_ids) | Q('terms', samples=sample_ids)
 
 
-def _family_genotype_inheritance_filter(inheritance_mode, inheritance_filter, samples_by_id, individual_affected_status, index_fields):
+def _family_genotype_inheritance_filter(inheritance_mode, inheritance_filter, family_samples, index_fields):
     samples_q = None
 
-    individuals = [sample.individual for sample in samples_by_id.values()]
-
-    individual_genotype_filter = inheritance_filter.get('genotype') or {}
+    individual_genotype_filter = dict(inheritance_filter.get('genotype') or {})
 
     if inheritance_mode == X_LINKED_RECESSIVE:
         samples_q = Q('match', contig='X')
-        for individual in individuals:
-            if individual_affected_status[individual.guid] == Individual.AFFECTED_STATUS_UNAFFECTED \
-                    and individual.sex == Individual.SEX_MALE:
-                individual_genotype_filter[individual.guid] = REF_REF
+        for _, individual_guid, sex, affected in family_samples:
+            if affected == Individual.AFFECTED_STATUS_UNAFFECTED and sex == Individual.SEX_MALE:
+                individual_genotype_filter[individual_guid] = REF_REF
 
     is_sv_comp_het = inheritance_mode == COMPOUND_HET and 'samples' in index_fields
-    for sample_id, sample in sorted(samples_by_id.items()):
-
-        individual_guid = sample.individual.guid
-        affected = individual_affected_status[individual_guid]
-
+    for sample_id, individual_guid, _, affected in family_samples:
         genotype = individual_genotype_filter.get(individual_guid) or inheritance_filter.get(affected)
 
         if genotype:
@@ -1170,11 +1431,10 @@ def _family_genotype_inheritance_filter(inheritance_mode, inheritance_filter, sa
     return samples_q
 
 
-def _named_family_sample_q(family_samples_q, family_guid, quality_filters_by_family):
+def _named_family_sample_q(family_samples_q, family_guid, quality_filter_key):
     sample_queries = [family_samples_q]
-    quality_q = quality_filters_by_family.get(family_guid)
-    if quality_q:
-        sample_queries.append(quality_q)
+    if quality_filter_key:
+        sample_queries.append(Q(_compiled_quality_filter(*quality_filter_key)))
 
     return Q('bool', must=sample_queries, _name=family_guid)
 
@@ -1277,22 +1537,18 @@ def _sort_compound_hets(grouped_variants):
 
 
 def _get_compound_het_page(grouped_variants, start_index, end_index):
-    skipped = 0
+    end_index = max(end_index, 1)
+    if len(grouped_variants) < end_index:
+        return None
+
     variant_results = []
-    variant_count = 0
-    for variants in grouped_variants:
+    for variants in grouped_variants[start_index:end_index]:
         curr_variant = next(iter(variants.values()))
-        if skipped < start_index:
-            skipped += 1
+        if len(curr_variant) == 1:
+            variant_results += curr_variant
         else:
-            if len(curr_variant) == 1:
-                variant_results += curr_variant
-            else:
-                variant_results.append(curr_variant)
-            variant_count += 1
-        if variant_count + skipped >= end_index:
-            return variant_results
-    return None
+            variant_results.append(curr_variant)
+    return variant_results
 
 
 def _parse_es_sort(sort, sort_config):
@@ -1,4 +1,6 @@
+from concurrent.futures import Future
 from copy import deepcopy
+import hashlib
 import mock
 import jmespath
 import json
@@ -6,14 +8,25 @@ import re
 from collections import defaultdict
 from datetime import timedelta
 from django.test import TestCase
+from django.utils import timezone
 from elasticsearch.exceptions import ConnectionTimeout, TransportError
+from elasticsearch_dsl.response import Hit
 from sys import maxsize
 from urllib3.exceptions import ReadTimeoutError
 
-from seqr.models import Family, Sample, VariantSearch, VariantSearchResults
+from seqr.models import Family, Individual, Sample, VariantSearch, VariantSearchResults
 from seqr.utils.elasticsearch.utils import get_es_variants_for_variant_tuples, get_single_es_variant, get_es_variants, \
-    get_es_variant_gene_counts, get_es_variants_for_variant_ids, InvalidIndexException, InvalidSearchException
-from seqr.utils.elasticsearch.es_search import EsSearch, _get_family_affected_status, _liftover_grch38_to_grch37
+    get_es_variant_gene_counts, get_es_variants_for_variant_ids, get_es_client, get_cached_es_variants, \
+    InvalidIndexException, InvalidSearchException, SearchLoadingException
+from seqr.utils.elasticsearch.index_metadata_cache import get_cached_index_value, set_cached_index_value, \
+    reset_index_metadata_cache
+from seqr.utils.elasticsearch.search_results_cache import load_cached_search_results, CachedResultsList
+from seqr.utils.elasticsearch.es_search import EsSearch, _get_family_affected_status, _compiled_family_sample_query
+from seqr.utils.elasticsearch.search_context_cache import get_samples_by_family_index, reset_cached_search_context
+from seqr.utils.elasticsearch.search_profiler import SearchProfiler
+from seqr.utils.elasticsearch.search_jobs import submit_search_job, prefetch_search_page, get_search_job_status, \
+    _get_executor as _get_search_job_executor, _refresh_search_job_heartbeats, SEARCH_JOBS
+from seqr.utils.liftover_utils import liftover_position, LIFTOVER_LOAD_FAILURES
 from seqr.views.utils.test_utils import urllib3_responses, PARSED_VARIANTS, PARSED_SV_VARIANT, TRANSCRIPT_2
 
 INDEX_NAME = 'test_index'
@@ -805,11 +818,17 @@ RECESSIVE_INHERITANCE_QUERY = {
 ANNOTATION_QUERY = {'terms': {'transcriptConsequenceTerms': ['frameshift_variant']}}
 
 REDIS_CACHE = {}
-def _set_cache(k, v):
+def _set_cache(k, v, ex=None, nx=False):
+    if nx and k in REDIS_CACHE:
+        return None
     REDIS_CACHE[k] = v
+    return True
 MOCK_REDIS = mock.MagicMock()
 MOCK_REDIS.get.side_effect = REDIS_CACHE.get
 MOCK_REDIS.set.side_effect =_set_cache
+MOCK_REDIS.mget.side_effect = lambda keys: [REDIS_CACHE.get(k) for k in keys]
+MOCK_REDIS.delete.side_effect = lambda *keys: [REDIS_CACHE.pop(k, None) for k in keys]
+MOCK_REDIS.pipeline.return_value.set.side_effect = _set_cache
 
 def mock_hits(hits, increment_sort=False, include_matched_queries=True, sort=None, index=INDEX_NAME):
     parsed_hits = deepcopy(hits)
@@ -839,7 +858,7 @@ def mock_hits(hits, increment_sort=False, include_matched_queries=True, sort=Non
                 sort_value = 'Infinity'
             if increment_sort:
                 sort_value += 100
-            hit['_sort'] = [sort_value]
+            hit['sort'] = [sort_value]
     return parsed_hits
 
 
@@ -890,7 +909,20 @@ def create_mock_response(search, index=INDEX_NAME):
                     doc_count += sum(gene_samples.values())
                 bucket['doc_count'] = doc_count
 
-        response_dict['aggregations'] = {'genes': {'buckets': buckets}}
+        composite_agg = search['aggs']['genes'].get('composite')
+        if composite_agg:
+            after_gene_id = composite_agg.get('after', {}).get('gene_id')
+            if after_gene_id:
+                buckets = [bucket for bucket in buckets if bucket['key'] > after_gene_id]
+            buckets = buckets[:composite_agg['size']]
+            for bucket in buckets:
+                bucket['key'] = {'gene_id': bucket['key']}
+            genes_agg = {'buckets': buckets}
+            if buckets:
+                genes_agg['after_key'] = buckets[-1]['key']
+            response_dict['aggregations'] = {'genes': genes_agg}
+        else:
+            response_dict['aggregations'] = {'genes': {'buckets': buckets}}
 
     return response_dict
 
@@ -934,6 +966,19 @@ def setup_responses():
     setup_search_response()
 
 
+class _InlineExecutor(object):
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+@mock.patch.dict('seqr.utils.elasticsearch.index_metadata_cache.INDEX_METADATA', clear=True)
+@mock.patch.dict(
+    'seqr.utils.elasticsearch.index_metadata_cache.INDEX_METADATA_VERSION', {'version': None, 'checked': None})
+@mock.patch.dict('seqr.utils.gene_utils.GENE_JSON_CACHE', clear=True)
+@mock.patch.dict('seqr.utils.elasticsearch.search_context_cache.SEARCH_CONTEXTS', clear=True)
 @mock.patch('seqr.utils.redis_utils.redis.StrictRedis', lambda **kwargs: MOCK_REDIS)
 class EsUtilsTest(TestCase):
     databases = '__all__'
@@ -978,7 +1023,7 @@ class EsUtilsTest(TestCase):
 
         if expected_search_params.get('gene_aggs'):
             expected_search['aggs'] = {
-                'genes': {'terms': {'field': 'geneIds', 'min_doc_count': 2, 'size': 1001}, 'aggs': {
+                'genes': {'composite': {'sources': [{'gene_id': {'terms': {'field': 'geneIds'}}}], 'size': 1000}, 'aggs': {
                     'vars_by_gene': {
                         'top_hits': {'sort': expected_search_params['sort'], '_source': mock.ANY, 'size': 100}
                     }
@@ -1000,8 +1045,33 @@ class EsUtilsTest(TestCase):
 
     def assertCachedResults(self, results_model, expected_results, sort='xpos'):
         cache_key = 'search_results__{}__{}'.format(results_model.guid, sort)
-        self.assertDictEqual(json.loads(REDIS_CACHE.get(cache_key)), expected_results)
-        MOCK_REDIS.expire.assert_called_with(cache_key, timedelta(weeks=2))
+        cached_results = {
+            k: list(v) if isinstance(v, CachedResultsList) else v
+            for k, v in load_cached_search_results(cache_key).items()
+        }
+        self.assertDictEqual(cached_results, expected_results)
+        MOCK_REDIS.pipeline.return_value.set.assert_called_with(cache_key, mock.ANY, ex=timedelta(weeks=2))
+
+    @mock.patch('seqr.utils.elasticsearch.utils.os.getpid')
+    @mock.patch('seqr.utils.elasticsearch.utils.ES_CLIENTS', {})
+    def test_get_es_client(self, mock_getpid):
+        mock_getpid.return_value = 1
+        client = get_es_client()
+        self.assertIs(get_es_client(), client)
+        self.assertIs(get_es_client(timeout=60), client)
+
+        timeout_client = get_es_client(timeout=3, max_retries=0)
+        self.assertIsNot(timeout_client, client)
+        self.assertIs(get_es_client(timeout=3, max_retries=0), timeout_client)
+        self.assertIsNot(get_es_client(timeout=3), timeout_client)
+
+        connection = client.transport.connection_pool.connections[0]
+        self.assertEqual(connection.pool.pool.maxsize, 10)
+        self.assertEqual(connection.headers['connection'], 'keep-alive')
+
+        # Clients are not shared with forked processes
+        mock_getpid.return_value = 2
+        self.assertIsNot(get_es_client(), client)
 
     @urllib3_responses.activate
     def test_get_es_variants_for_variant_tuples(self):
@@ -1056,7 +1126,6 @@ class EsUtilsTest(TestCase):
             get_single_es_variant(self.families, '10-10334333-A-G')
         self.assertEqual(str(cm.exception), 'Variant 10-10334333-A-G not found')
 
-    @mock.patch('seqr.utils.elasticsearch.es_search.MAX_COMPOUND_HET_GENES', 1)
     @mock.patch('seqr.utils.elasticsearch.es_gene_agg_search.MAX_COMPOUND_HET_GENES', 1)
     @urllib3_responses.activate
     def test_invalid_get_es_variants(self):
@@ -1093,12 +1162,6 @@ class EsUtilsTest(TestCase):
 
         search_model.search = {'inheritance': {'mode': 'compound_het'}}
         search_model.save()
-        with self.assertRaises(InvalidSearchException) as cm:
-            get_es_variants(results_model)
-        self.assertEqual(
-            str(cm.exception),
-            'This search returned too many compound heterozygous variants. Please add stricter filters')
-
         with self.assertRaises(InvalidSearchException) as cm:
             get_es_variant_gene_counts(results_model)
         self.assertEqual(str(cm.exception), 'This search returned too many genes')
@@ -1144,6 +1207,7 @@ class EsUtilsTest(TestCase):
             'This search is not supported for large numbers of cases. Try removing family-based inheritance filters or sample-level quality filters')
 
         _set_cache('index_metadata__test_index,test_index_sv', None)
+        reset_index_metadata_cache()
         urllib3_responses.add(
             urllib3_responses.GET, '/test_index,test_index_sv/_mapping', body=Exception('Connection error'))
         with self.assertRaises(InvalidIndexException) as cm:
@@ -1200,6 +1264,411 @@ class EsUtilsTest(TestCase):
         self.assertEqual(len(variants), 5)
         self.assertListEqual(variants, PARSED_VARIANTS + PARSED_VARIANTS + PARSED_VARIANTS[:1])
 
+    @mock.patch('seqr.utils.elasticsearch.es_search.ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD', 3)
+    @mock.patch('seqr.utils.elasticsearch.es_search.time')
+    @mock.patch.dict(REDIS_CACHE, clear=True)
+    @urllib3_responses.activate
+    def test_samples_lookup_get_es_variants(self, mock_time):
+        mock_time.time.return_value = 1000000
+        setup_responses()
+        lookup_id = hashlib.md5(b'HG00731,HG00732,HG00733,NA20870,NA20874').hexdigest()
+        lookup_url = '/seqr_search_samples_lookup/_doc/{}'.format(lookup_id)
+        urllib3_responses.add_json(lookup_url, {'result': 'created'}, method=urllib3_responses.PUT)
+
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+
+        variants, total_results = get_es_variants(results_model, num_results=2)
+        self.assertEqual(total_results, 5)
+        # Families are attributed from the hit genotypes
+        self.assertListEqual(variants, PARSED_VARIANTS)
+
+        lookup_calls = [call for call in urllib3_responses.calls if call.request.url == lookup_url]
+        self.assertEqual(len(lookup_calls), 1)
+        self.assertDictEqual(json.loads(lookup_calls[0].request.body), {
+            'sample_ids': ['HG00731', 'HG00732', 'HG00733', 'NA20870', 'NA20874'], 'last_used': 1000000})
+        MOCK_REDIS.set.assert_called_with('samples_lookup__{}'.format(lookup_id), 'true', ex=timedelta(days=1))
+
+        lookup = {'index': 'seqr_search_samples_lookup', 'id': lookup_id, 'path': 'sample_ids'}
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, {'bool': {'should': [
+            {'terms': {'samples_num_alt_1': lookup}},
+            {'terms': {'samples_num_alt_2': lookup}},
+            {'terms': {'samples': lookup}},
+        ]}}], sort=['xpos'])
+
+        # Lookups are only stored once
+        results_model = VariantSearchResults.objects.create(variant_search=search_model, search_hash='samples_lookup')
+        results_model.families.set(self.families)
+        get_es_variants(results_model, num_results=2)
+        lookup_calls = [call for call in urllib3_responses.calls if call.request.url == lookup_url]
+        self.assertEqual(len(lookup_calls), 1)
+
+        # Lookups are rewritten with the time they were last used once their cache marker expires
+        REDIS_CACHE.clear()
+        mock_time.time.return_value = 2000000
+        urllib3_responses.replace_json(lookup_url, {'result': 'updated'}, method=urllib3_responses.PUT)
+        results_model = VariantSearchResults.objects.create(
+            variant_search=search_model, search_hash='samples_lookup_expired')
+        results_model.families.set(self.families)
+        variants, _ = get_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        lookup_calls = [call for call in urllib3_responses.calls if call.request.url == lookup_url]
+        self.assertEqual(len(lookup_calls), 2)
+        self.assertEqual(json.loads(lookup_calls[1].request.body)['last_used'], 2000000)
+        self.assertIn('samples_lookup__{}'.format(lookup_id), REDIS_CACHE)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, {'bool': {'should': [
+            {'terms': {'samples_num_alt_1': lookup}},
+            {'terms': {'samples_num_alt_2': lookup}},
+            {'terms': {'samples': lookup}},
+        ]}}], sort=['xpos'])
+
+        # Searches fall back to per-family filters if the lookup can not be stored
+        REDIS_CACHE.clear()
+        urllib3_responses.replace_json(
+            lookup_url, {'error': {'type': 'cluster_block_exception'}}, method=urllib3_responses.PUT, status=403)
+        results_model = VariantSearchResults.objects.create(
+            variant_search=search_model, search_hash='samples_lookup_error')
+        results_model.families.set(self.families)
+        variants, _ = get_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertNotIn('samples_lookup__{}'.format(lookup_id), REDIS_CACHE)
+        executed_search = urllib3_responses.call_request_json()
+        self.assertNotIn('seqr_search_samples_lookup', json.dumps(executed_search))
+        self.assertListEqual(
+            [family_q['bool']['_name'] for family_q in executed_search['query']['bool']['filter'][1]['bool']['should']],
+            ['F000002_2', 'F000003_3', 'F000005_5'],
+        )
+
+    @mock.patch('seqr.utils.elasticsearch.es_search.ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD', 2)
+    @mock.patch.dict(REDIS_CACHE, clear=True)
+    @urllib3_responses.activate
+    def test_samples_lookup_any_affected_get_es_variants(self):
+        setup_responses()
+        lookup_id = hashlib.md5(b'HG00731,NA20870').hexdigest()
+        lookup_url = '/seqr_search_samples_lookup/_doc/{}'.format(lookup_id)
+        urllib3_responses.add_json(lookup_url, {'result': 'created'}, method=urllib3_responses.PUT)
+
+        search_model = VariantSearch.objects.create(search={
+            'annotations': {'frameshift': ['frameshift_variant']}, 'inheritance': {'mode': 'any_affected'},
+        })
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+
+        variants, total_results = get_es_variants(results_model, num_results=2)
+        self.assertEqual(total_results, 5)
+        # Families with no affected individuals are not searched, and only families with a matched affected sample
+        # are returned
+        self.assertListEqual(variants, PARSED_ANY_AFFECTED_VARIANTS)
+
+        lookup_calls = [call for call in urllib3_responses.calls if call.request.url == lookup_url]
+        self.assertEqual(len(lookup_calls), 1)
+        self.assertListEqual(json.loads(lookup_calls[0].request.body)['sample_ids'], ['HG00731', 'NA20870'])
+
+        lookup = {'index': 'seqr_search_samples_lookup', 'id': lookup_id, 'path': 'sample_ids'}
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, {'bool': {'should': [
+            {'terms': {'samples_num_alt_1': lookup}},
+            {'terms': {'samples_num_alt_2': lookup}},
+            {'terms': {'samples': lookup}},
+        ]}}], sort=['xpos'])
+
+    @mock.patch('seqr.utils.elasticsearch.es_search.MAX_VARIANTS', 3)
+    @mock.patch('seqr.utils.elasticsearch.es_search.ELASTICSEARCH_SEARCH_AFTER_PAGINATION', True)
+    @urllib3_responses.activate
+    def test_search_after_get_es_variants(self):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+        first_xpos = PARSED_VARIANTS[0]['xpos']
+        second_xpos = PARSED_VARIANTS[1]['xpos']
+
+        variants, total_results = get_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(total_results, 5)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'])
+        self.assertCachedResults(results_model, {
+            'all_results': PARSED_VARIANTS, 'total_results': 5, 'search_after_cursors': {INDEX_NAME: {
+                'loaded': 2, 'search_after': [first_xpos], 'last_sort': [second_xpos],
+                'skip_ids': [PARSED_VARIANTS[1]['variantId']],
+            }},
+        })
+
+        # test next page is loaded from the cursor, and is not limited by the max offset
+        variants, total_results = get_es_variants(results_model, page=2, num_results=2)
+        executed_search = urllib3_responses.call_request_json()
+        self.assertNotIn('from', executed_search)
+        self.assertEqual(executed_search['size'], 3)
+        self.assertListEqual(executed_search['search_after'], [first_xpos])
+        self.assertListEqual(executed_search['sort'], ['xpos'])
+        # The mock response returns the same hits, so the re-fetched tied result is dropped
+        self.assertListEqual(variants, PARSED_VARIANTS[:1])
+        self.assertCachedResults(results_model, {
+            'all_results': PARSED_VARIANTS + PARSED_VARIANTS[:1], 'total_results': 5, 'search_after_cursors': {
+                INDEX_NAME: {
+                    'loaded': 3, 'search_after': [second_xpos], 'last_sort': [first_xpos],
+                    'skip_ids': [PARSED_VARIANTS[0]['variantId']],
+                }},
+        })
+
+        # test non-consecutive pages use offsets
+        with self.assertRaises(InvalidSearchException) as cm:
+            get_es_variants(results_model, page=4, num_results=2)
+        self.assertEqual(str(cm.exception), 'Unable to load more than 3 variants (8 requested)')
+
+    @mock.patch('seqr.utils.elasticsearch.search_results_cache.RESULTS_CHUNK_SIZE', 2)
+    @mock.patch('seqr.utils.elasticsearch.utils.logger')
+    @urllib3_responses.activate
+    def test_chunked_cached_get_es_variants(self, mock_logger):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+        cache_key = 'search_results__{}__xpos'.format(results_model.guid)
+        first_chunk_key = '{}__all_results__0'.format(cache_key)
+        second_chunk_key = '{}__all_results__1'.format(cache_key)
+
+        get_es_variants(results_model, num_results=2)
+        self.assertDictEqual(
+            json.loads(REDIS_CACHE[cache_key]), {'total_results': 5, 'chunked_results_counts': {'all_results': 2}})
+        self.assertListEqual(json.loads(REDIS_CACHE[first_chunk_key]), PARSED_VARIANTS)
+
+        # test only new result chunks are written
+        MOCK_REDIS.reset_mock()
+        get_es_variants(results_model, page=2, num_results=2)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'], start_index=2, size=2)
+        MOCK_REDIS.pipeline.return_value.set.assert_has_calls([
+            mock.call(second_chunk_key, mock.ANY, ex=timedelta(weeks=2)),
+            mock.call(cache_key, mock.ANY, ex=timedelta(weeks=2)),
+        ])
+        self.assertEqual(MOCK_REDIS.pipeline.return_value.set.call_count, 2)
+        self.assertDictEqual(
+            json.loads(REDIS_CACHE[cache_key]), {'total_results': 5, 'chunked_results_counts': {'all_results': 4}})
+
+        # test only the result chunks for the requested page are loaded
+        MOCK_REDIS.reset_mock()
+        urllib3_responses.reset()
+        variants, total_results = get_es_variants(results_model, page=2, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(total_results, 5)
+        MOCK_REDIS.mget.assert_called_once_with([second_chunk_key])
+        MOCK_REDIS.pipeline.assert_not_called()
+
+        # test search is reloaded if cached chunks have expired
+        _set_cache(second_chunk_key, None)
+        setup_responses()
+        variants, total_results = get_es_variants(results_model, page=2, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        mock_logger.warning.assert_called_with(
+            'Unable to load cached results {}. Reloading search results'.format(second_chunk_key))
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'], start_index=2, size=2)
+        self.assertDictEqual(json.loads(REDIS_CACHE[cache_key]), {'total_results': 5, 'chunked_results_counts': {}})
+
+    @mock.patch('seqr.utils.elasticsearch.utils.logger')
+    @urllib3_responses.activate
+    def test_profiled_get_es_variants(self, mock_logger):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+
+        profiler = SearchProfiler()
+        variants, _ = get_es_variants(results_model, num_results=2, profiler=profiler)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'])
+
+        profile = profiler.to_json()
+        self.assertSetEqual(set(profile['phasesMs'].keys()), {
+            'cacheRead', 'context', 'indexMetadata', 'queryCompile', 'esSearch', 'parse', 'cacheWrite'})
+        self.assertEqual(profile['esRequests'], 1)
+        self.assertEqual(profile['esTookMs'], 1)
+        self.assertNotIn('esProfiles', profile)
+        mock_logger.info.assert_called_with(
+            'Search profile for search_results__{}__xpos'.format(results_model.guid), extra={'search_profile': profile})
+
+        # test elasticsearch query profile is requested
+        profiler = SearchProfiler(include_es_profile=True)
+        get_es_variants(results_model, page=2, num_results=2, profiler=profiler)
+        self.assertTrue(urllib3_responses.call_request_json()['profile'])
+        profile = profiler.to_json()
+        self.assertEqual(profile['esRequests'], 1)
+        self.assertListEqual(profile['esProfiles'], [])
+
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.logger')
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.connections')
+    @mock.patch('seqr.utils.elasticsearch.search_jobs._get_executor')
+    @urllib3_responses.activate
+    def test_search_jobs(self, mock_get_executor, mock_connections, mock_logger):
+        setup_responses()
+        mock_get_executor.return_value = _InlineExecutor()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+
+        self.assertIsNone(get_search_job_status(results_model, num_results=2))
+        self.assertTupleEqual(get_cached_es_variants(results_model, num_results=2), (None, None))
+
+        job_status = submit_search_job(results_model, num_results=2)
+        self.assertDictEqual(job_status, {'status': 'complete', 'page': 1, 'numResults': 2, 'totalResults': 5})
+        self.assertDictEqual(get_search_job_status(results_model, num_results=2), job_status)
+        self.assertNotIn('search_results__{}__xpos__loading'.format(results_model.guid), REDIS_CACHE)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'])
+        mock_connections.close_all.assert_called_once()
+
+        variants, total_results = get_cached_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(total_results, 5)
+
+        # Test prefetching the next page
+        num_calls = len(urllib3_responses.calls)
+        self.assertDictEqual(prefetch_search_page(results_model, 5, num_results=2), {
+            'status': 'complete', 'page': 2, 'numResults': 2, 'totalResults': 5})
+        self.assertEqual(len(urllib3_responses.calls), num_calls + 1)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'], start_index=2, size=2)
+        variants, _ = get_cached_es_variants(results_model, page=2, num_results=2)
+        self.assertEqual(len(variants), 2)
+
+        # Job status is tracked separately for each page
+        self.assertDictEqual(get_search_job_status(results_model, num_results=2), job_status)
+        self.assertDictEqual(get_search_job_status(results_model, page=2, num_results=2), {
+            'status': 'complete', 'page': 2, 'numResults': 2, 'totalResults': 5})
+        self.assertIsNone(get_search_job_status(results_model, page=2, num_results=10))
+
+        self.assertIsNone(prefetch_search_page(results_model, 5, page=3, num_results=2))
+        self.assertEqual(len(urllib3_responses.calls), num_calls + 1)
+
+        # Test in progress jobs with no heartbeat are reported as failed
+        job_cache_key = 'search_results__{}__xpos__job__3__2'.format(results_model.guid)
+        _set_cache(job_cache_key, json.dumps({'status': 'running', 'page': 3, 'numResults': 2}))
+        self.assertDictEqual(get_search_job_status(results_model, page=3, num_results=2), {
+            'status': 'error', 'page': 3, 'numResults': 2, 'error': 'Search job was interrupted',
+        })
+
+        # Test progress is returned for in progress jobs
+        _set_cache('{}__heartbeat'.format(job_cache_key), json.dumps(True))
+        self.assertDictEqual(get_search_job_status(results_model, page=3, num_results=2), {
+            'status': 'running', 'page': 3, 'numResults': 2, 'totalResults': 5, 'loadedVariantCounts': {},
+        })
+        loaded_variant_counts = {
+            SECOND_INDEX_NAME: {'loaded': 2, 'total': 5}, INDEX_NAME: {'loaded': 4, 'total': 5},
+        }
+        _set_cache('search_results__{}__xpos'.format(results_model.guid), json.dumps({
+            'total_results': 10, 'loaded_variant_counts': loaded_variant_counts}))
+        self.assertDictEqual(get_search_job_status(results_model, page=3, num_results=2), {
+            'status': 'running', 'page': 3, 'numResults': 2, 'totalResults': 10,
+            'loadedVariantCounts': loaded_variant_counts,
+        })
+
+        # Test failed searches
+        search_model.search = {'locus': {'rawVariantItems': 'chr2-A-C'}}
+        search_model.save()
+        job_status = submit_search_job(results_model, sort='protein_consequence', num_results=2)
+        self.assertDictEqual(job_status, {
+            'status': 'error', 'page': 1, 'numResults': 2, 'error': 'Invalid variants: chr2-A-C'})
+        mock_logger.error.assert_called_with('Search job for search_results__{}__protein_consequence failed: '
+                                             'Invalid variants: chr2-A-C'.format(results_model.guid))
+
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.os.getpid')
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.Thread')
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.ThreadPoolExecutor')
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.SEARCH_JOB_EXECUTOR_PID', None)
+    @mock.patch('seqr.utils.elasticsearch.search_jobs.SEARCH_JOB_EXECUTOR', None)
+    @mock.patch.dict('seqr.utils.elasticsearch.search_jobs.SEARCH_JOBS', clear=True)
+    def test_search_job_executor(self, mock_executor_cls, mock_thread_cls, mock_getpid):
+        mock_getpid.return_value = 1
+        mock_executor_cls.side_effect = lambda **kwargs: mock.MagicMock()
+        executor = _get_search_job_executor()
+        mock_executor_cls.assert_called_once_with(max_workers=2, thread_name_prefix='search_job')
+        mock_thread_cls.assert_called_once_with(target=mock.ANY, name='search_job_heartbeat', daemon=True)
+        mock_thread_cls.return_value.start.assert_called_once()
+        self.assertIs(_get_search_job_executor(), executor)
+        self.assertEqual(mock_executor_cls.call_count, 1)
+        self.assertEqual(mock_thread_cls.call_count, 1)
+
+        # Test a new executor is created in forked processes, and jobs from the parent process are not tracked
+        SEARCH_JOBS[('search_results__test', 1, 100)] = mock.MagicMock()
+        mock_getpid.return_value = 2
+        forked_executor = _get_search_job_executor()
+        self.assertIsNot(forked_executor, executor)
+        self.assertEqual(mock_executor_cls.call_count, 2)
+        self.assertDictEqual(SEARCH_JOBS, {})
+        self.assertIs(_get_search_job_executor(), forked_executor)
+        self.assertEqual(mock_thread_cls.call_count, 2)
+
+    @mock.patch.dict(REDIS_CACHE, clear=True)
+    @mock.patch.dict('seqr.utils.elasticsearch.search_jobs.SEARCH_JOBS', clear=True)
+    def test_search_job_heartbeats(self):
+        _refresh_search_job_heartbeats()
+        self.assertDictEqual(REDIS_CACHE, {})
+
+        running_future = Future()
+        completed_future = Future()
+        completed_future.set_result(None)
+        SEARCH_JOBS[('search_results__test__xpos', 2, 100)] = running_future
+        SEARCH_JOBS[('search_results__test__xpos', 1, 100)] = completed_future
+        MOCK_REDIS.pipeline.return_value.set.reset_mock()
+        _refresh_search_job_heartbeats()
+        self.assertDictEqual(REDIS_CACHE, {'search_results__test__xpos__job__2__100__heartbeat': 'true'})
+        MOCK_REDIS.pipeline.return_value.set.assert_called_once_with(
+            'search_results__test__xpos__job__2__100__heartbeat', 'true', ex=timedelta(seconds=30))
+
+    @mock.patch('seqr.utils.elasticsearch.utils.time')
+    @urllib3_responses.activate
+    def test_search_loading_lock(self, mock_time):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+        cache_key = 'search_results__{}__xpos'.format(results_model.guid)
+        lock_key = '{}__loading'.format(cache_key)
+
+        # Test waiting for a search which is being loaded by another request returns the results it loaded
+        _set_cache(lock_key, json.dumps('other_request'))
+        mock_time.monotonic.return_value = 0
+        def _finish_other_request(*args):
+            _set_cache(cache_key, json.dumps({'all_results': PARSED_VARIANTS, 'total_results': 2}))
+            del REDIS_CACHE[lock_key]
+        mock_time.sleep.side_effect = _finish_other_request
+
+        # Test requests which do not wait fail fast
+        num_calls = len(urllib3_responses.calls)
+        with self.assertRaises(SearchLoadingException) as cm:
+            get_es_variants(results_model, num_results=2)
+        self.assertEqual(str(cm.exception), 'This search is already being loaded. Please try again shortly')
+        mock_time.sleep.assert_not_called()
+        self.assertEqual(REDIS_CACHE[lock_key], json.dumps('other_request'))
+
+        variants, total_results = get_es_variants(results_model, num_results=2, wait_for_loading=True)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(total_results, 2)
+        self.assertEqual(len(urllib3_responses.calls), num_calls)
+        mock_time.sleep.assert_called_once_with(0.5)
+        self.assertNotIn(lock_key, REDIS_CACHE)
+
+        # Test the search is loaded if the other request finishes without loading it
+        del REDIS_CACHE[cache_key]
+        _set_cache(lock_key, json.dumps('other_request'))
+        mock_time.sleep.side_effect = lambda *args: REDIS_CACHE.pop(lock_key)
+        variants, total_results = get_es_variants(results_model, num_results=2, wait_for_loading=True)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(total_results, 5)
+        self.assertExecutedSearch(filters=[ANNOTATION_QUERY, ALL_INHERITANCE_QUERY], sort=['xpos'])
+        self.assertNotIn(lock_key, REDIS_CACHE)
+
+        # Test the search is loaded once the lock times out
+        del REDIS_CACHE[cache_key]
+        _set_cache(lock_key, json.dumps('other_request'))
+        mock_time.sleep.reset_mock()
+        mock_time.sleep.side_effect = None
+        mock_time.monotonic.side_effect = [0, 200, 400]
+        with mock.patch('seqr.utils.elasticsearch.utils.logger') as mock_logger:
+            variants, _ = get_es_variants(results_model, num_results=2, wait_for_loading=True)
+        self.assertListEqual(variants, PARSED_VARIANTS)
+        self.assertEqual(mock_time.sleep.call_count, 1)
+        mock_logger.warning.assert_called_with('Timed out waiting for {} to load'.format(cache_key))
+        # Locks held by other requests are not released
+        self.assertEqual(REDIS_CACHE[lock_key], json.dumps('other_request'))
+
     @urllib3_responses.activate
     def test_filtered_get_es_variants(self):
         setup_responses()
@@ -1556,6 +2025,53 @@ class EsUtilsTest(TestCase):
         urllib3_responses.reset()
         get_es_variants(results_model, page=2, num_results=2)
 
+    @mock.patch('seqr.utils.elasticsearch.es_search.COMPOUND_HET_GENE_PAGE_SIZE', 1)
+    @mock.patch('seqr.utils.elasticsearch.es_search.COMPOUND_HET_GENE_PAGE_SIZE', 1)
+    @urllib3_responses.activate
+    def test_paged_compound_het_get_es_variants(self):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={
+            'qualityFilter': {'min_gq': 10},
+            'annotations': {'frameshift': ['frameshift_variant']},
+            'inheritance': {'mode': 'compound_het'},
+        })
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(self.families)
+
+        variants, total_results = get_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, [PARSED_COMPOUND_HET_VARIANTS])
+        self.assertEqual(total_results, 1)
+
+        self.assertCachedResults(results_model, {
+            'grouped_results': [{'ENSG00000228198': PARSED_COMPOUND_HET_VARIANTS}],
+            'total_results': 1,
+        })
+
+        # The initial search loads the first page of genes, and each following page is loaded with the same search
+        searches = [
+            json.loads(call.request.body) for call in urllib3_responses.calls if call.request.url.endswith('/_search')]
+        self.assertEqual(len(searches), 3)
+        self.assertListEqual([search['size'] for search in searches], [1, 0, 0])
+        for search in searches:
+            self.assertDictEqual(search['query'], searches[0]['query'])
+            self.assertListEqual(search['aggs']['genes']['composite']['sources'], [
+                {'gene_id': {'terms': {'field': 'geneIds'}}}])
+            self.assertEqual(search['aggs']['genes']['composite']['size'], 1)
+            self.assertDictEqual(search['aggs']['genes']['aggs']['vars_by_gene'], {
+                'top_hits': {'_source': mock.ANY, 'size': 100, 'sort': ['xpos']}})
+        self.assertListEqual([search['aggs']['genes']['composite'].get('after') for search in searches], [
+            None, {'gene_id': 'ENSG00000135953'}, {'gene_id': 'ENSG00000228198'},
+        ])
+
+        results_model = VariantSearchResults.objects.create(variant_search=search_model, search_hash='too_many_genes')
+        results_model.families.set(self.families)
+        with mock.patch('seqr.utils.elasticsearch.es_search.MAX_VARIANTS', 0):
+            with self.assertRaises(InvalidSearchException) as cm:
+                get_es_variants(results_model, num_results=2)
+        self.assertEqual(
+            str(cm.exception),
+            'This search returned too many compound heterozygous variants. Please add stricter filters')
+
     @urllib3_responses.activate
     def test_compound_het_get_es_variants_secondary_annotation(self):
         setup_responses()
@@ -1995,6 +2511,7 @@ class EsUtilsTest(TestCase):
                 '{}_compound_het'.format(INDEX_NAME): {'total': 1, 'loaded': 1},
             },
             'total_results': 11,
+            'loaded_variant_keys': ['1-248367227-TC-T', '2-103343353-GAGA-G'],
         })
         self.assertTrue('index_metadata__{}'.format(INDEX_NAME) in REDIS_CACHE)
         self.assertTrue('index_metadata__{}'.format(SECOND_INDEX_NAME) in REDIS_CACHE)
@@ -2054,26 +2571,28 @@ class EsUtilsTest(TestCase):
         # test pagination
         variants, total_results = get_es_variants(results_model, num_results=2, page=2)
         self.assertEqual(len(variants), 2)
-        self.assertListEqual(variants, [PARSED_VARIANTS[0], PARSED_COMPOUND_HET_VARIANTS_MULTI_GENOME_VERSION])
-        self.assertEqual(total_results, 9)
+        # Variants which were already loaded are not returned again
+        self.assertListEqual(variants, [PARSED_COMPOUND_HET_VARIANTS_MULTI_GENOME_VERSION, PARSED_MULTI_GENOME_VERSION_VARIANT])
+        self.assertEqual(total_results, 8)
 
         cache_results = {
             'compound_het_results': [],
-            'variant_results': [PARSED_MULTI_GENOME_VERSION_VARIANT],
+            'variant_results': [],
             'grouped_results': [
                 {'null': [PARSED_VARIANTS[0]]},
                 {'ENSG00000135953': PARSED_COMPOUND_HET_VARIANTS_PROJECT_2},
-                {'null': [PARSED_VARIANTS[0]]},
-                {'ENSG00000228198': PARSED_COMPOUND_HET_VARIANTS_MULTI_GENOME_VERSION}
+                {'ENSG00000228198': PARSED_COMPOUND_HET_VARIANTS_MULTI_GENOME_VERSION},
+                {'null': [PARSED_MULTI_GENOME_VERSION_VARIANT]},
             ],
-            'duplicate_doc_count': 4,
+            'duplicate_doc_count': 5,
             'loaded_variant_counts': {
                 SECOND_INDEX_NAME: {'loaded': 2, 'total': 5},
                 '{}_compound_het'.format(SECOND_INDEX_NAME): {'total': 2, 'loaded': 2},
                 INDEX_NAME: {'loaded': 4, 'total': 5},
                 '{}_compound_het'.format(INDEX_NAME): {'total': 1, 'loaded': 1},
             },
-            'total_results': 9,
+            'total_results': 8,
+            'loaded_variant_keys': ['1-248367227-TC-T', '2-103343353-GAGA-G'],
         }
         self.assertCachedResults(results_model, cache_results)
 
@@ -2090,6 +2609,34 @@ class EsUtilsTest(TestCase):
         project_2_search['size'] = 4
         self.assertExecutedSearches([project_2_search])
 
+    @urllib3_responses.activate
+    def test_parallel_multi_project_get_es_variants(self):
+        setup_responses()
+        search_model = VariantSearch.objects.create(search={'annotations': {'frameshift': ['frameshift_variant']}})
+        families = Family.objects.filter(guid__in=['F000011_11', 'F000003_3', 'F000002_2'])
+        results_model = VariantSearchResults.objects.create(variant_search=search_model)
+        results_model.families.set(families)
+        expected_variants, expected_total = get_es_variants(results_model, num_results=2)
+        self.assertTrue(urllib3_responses.calls[-1].request.url.endswith('/_msearch'))
+        expected_cached_results = {
+            k: list(v) if isinstance(v, CachedResultsList) else v
+            for k, v in load_cached_search_results('search_results__{}__xpos'.format(results_model.guid)).items()
+        }
+
+        urllib3_responses.reset()
+        setup_responses()
+        results_model = VariantSearchResults.objects.create(variant_search=search_model, search_hash='parallel')
+        results_model.families.set(families)
+        with mock.patch('seqr.utils.elasticsearch.es_search.ELASTICSEARCH_SEARCH_THREADS', 4):
+            variants, total_results = get_es_variants(results_model, num_results=2)
+
+        self.assertListEqual(variants, expected_variants)
+        self.assertEqual(total_results, expected_total)
+        self.assertCachedResults(results_model, expected_cached_results)
+
+        searched_urls = sorted(call.request.url for call in urllib3_responses.calls[-2:])
+        self.assertListEqual(searched_urls, ['/{}/_search'.format(INDEX_NAME), '/{}/_search'.format(SECOND_INDEX_NAME)])
+
     @urllib3_responses.activate
     def test_multi_project_all_samples_all_inheritance_get_es_variants(self):
         setup_responses()
@@ -2108,6 +2655,7 @@ class EsUtilsTest(TestCase):
             'all_results': expected_variants,
             'duplicate_doc_count': 1,
             'total_results': 4,
+            'loaded_variant_keys': ['1-248367227-TC-T', '2-103343353-GAGA-G'],
         })
 
         self.assertExecutedSearch(
@@ -2117,16 +2665,16 @@ class EsUtilsTest(TestCase):
             size=4,
         )
 
-        # test pagination
+        # test pagination does not return variants which were already returned
         variants, total_results = get_es_variants(results_model, num_results=2, page=2)
-        expected_variants = [PARSED_VARIANTS[0], PARSED_MULTI_GENOME_VERSION_VARIANT]
-        self.assertListEqual(variants, expected_variants)
-        self.assertEqual(total_results, 3)
+        self.assertListEqual(variants, [])
+        self.assertEqual(total_results, 1)
 
         self.assertCachedResults(results_model, {
-            'all_results': expected_variants + expected_variants,
-            'duplicate_doc_count': 2,
-            'total_results': 3,
+            'all_results': expected_variants,
+            'duplicate_doc_count': 4,
+            'total_results': 1,
+            'loaded_variant_keys': ['1-248367227-TC-T', '2-103343353-GAGA-G'],
         })
 
         self.assertExecutedSearch(
@@ -2205,8 +2753,9 @@ class EsUtilsTest(TestCase):
             size=4,
         )
 
-    @mock.patch('seqr.utils.elasticsearch.es_search.LIFTOVER_GRCH38_TO_GRCH37', None)
-    @mock.patch('seqr.utils.elasticsearch.es_search.LiftOver')
+    @mock.patch('seqr.utils.liftover_utils.LIFTOVERS', {})
+    @mock.patch.dict('seqr.utils.liftover_utils.LIFTOVER_LOAD_FAILURES', clear=True)
+    @mock.patch('seqr.utils.liftover_utils.LiftOver')
     @urllib3_responses.activate
     def test_get_lifted_grch38_variants(self, mock_liftover):
         setup_responses()
@@ -2231,6 +2780,7 @@ class EsUtilsTest(TestCase):
         # Test using python liftover
         _set_cache('search_results__{}__xpos'.format(results_model.guid), None)
         Sample.objects.filter(elasticsearch_index=SECOND_INDEX_NAME).update(elasticsearch_index=NO_LIFT_38_INDEX_NAME)
+        reset_cached_search_context()
 
         mock_liftover.side_effect = Exception()
         expected_no_lift_grch38_variant = deepcopy(expected_grch38_variant)
@@ -2242,22 +2792,34 @@ class EsUtilsTest(TestCase):
         variants, _ = get_es_variants(results_model, num_results=2)
         self.assertEqual(len(variants), 1)
         self.assertListEqual(variants, [expected_no_lift_grch38_variant])
-        self.assertIsNone(_liftover_grch38_to_grch37())
+        self.assertIsNone(liftover_position('38', '1', 100))
         mock_liftover.assert_called_with('hg38', 'hg19')
 
+        # Failed loads are not retried until the backoff has passed
         _set_cache('search_results__{}__xpos'.format(results_model.guid), None)
+        mock_liftover.reset_mock()
         mock_liftover.side_effect = None
         mock_liftover.return_value.convert_coordinate.side_effect = lambda chrom, pos: [[chrom, pos - 10]]
         variants, _ = get_es_variants(results_model, num_results=2)
+        self.assertListEqual(variants, [expected_no_lift_grch38_variant])
+        mock_liftover.assert_not_called()
+
+        _set_cache('search_results__{}__xpos'.format(results_model.guid), None)
+        LIFTOVER_LOAD_FAILURES.clear()
+        variants, _ = get_es_variants(results_model, num_results=2)
         self.assertEqual(len(variants), 1)
         self.assertListEqual(variants, [expected_grch38_variant])
-        self.assertIsNotNone(_liftover_grch38_to_grch37())
+        self.assertTupleEqual(liftover_position('38', 'chr1', 100), ('1', 90))
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 2)
+        # test lifted positions are cached
+        self.assertTupleEqual(liftover_position('38', '1', 100), ('1', 90))
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 2)
         mock_liftover.assert_called_with('hg38', 'hg19')
 
-    @mock.patch('seqr.utils.elasticsearch.es_search.LIFTOVER_GRCH38_TO_GRCH37', None)
-    @mock.patch('seqr.utils.elasticsearch.es_search.LIFTOVER_GRCH37_TO_GRCH38', None)
+    @mock.patch('seqr.utils.liftover_utils.LIFTOVERS', {})
+    @mock.patch.dict('seqr.utils.liftover_utils.LIFTOVER_LOAD_FAILURES', clear=True)
     @mock.patch('seqr.utils.elasticsearch.es_search.MAX_VARIANTS', 3)
-    @mock.patch('seqr.utils.elasticsearch.es_search.LiftOver')
+    @mock.patch('seqr.utils.liftover_utils.LiftOver')
     @urllib3_responses.activate
     def test_multi_project_get_variants_by_id(self, mock_liftover):
         setup_responses()
@@ -2282,6 +2844,7 @@ class EsUtilsTest(TestCase):
         )
 
         # Test liftover variant to hg37
+        LIFTOVER_LOAD_FAILURES.clear()
         mock_liftover.side_effect = None
         mock_liftover.return_value.convert_coordinate.side_effect = lambda chrom, pos: [[chrom, pos - 10]]
         _set_cache('search_results__{}__xpos'.format(results_model.guid), None)
@@ -2293,6 +2856,7 @@ class EsUtilsTest(TestCase):
             'all_results': [PARSED_MULTI_GENOME_VERSION_VARIANT],
             'duplicate_doc_count': 1,
             'total_results': 4,
+            'loaded_variant_keys': ['2-103343353-GAGA-G'],
         })
         self.assertExecutedSearch(
             index='{},{}'.format(INDEX_NAME, SECOND_INDEX_NAME),
@@ -2322,6 +2886,7 @@ class EsUtilsTest(TestCase):
         )
 
         # Test liftover variant to hg38
+        LIFTOVER_LOAD_FAILURES.clear()
         mock_liftover.side_effect = None
         mock_liftover.return_value.convert_coordinate.side_effect = lambda chrom, pos: [[chrom, pos + 10]]
         _set_cache('search_results__{}__xpos'.format(results_model.guid), None)
@@ -2625,15 +3190,157 @@ class EsUtilsTest(TestCase):
     @urllib3_responses.activate
     def test_deduplicate_variants(self):
         setup_responses()
+        es_search = EsSearch(Family.objects.filter(guid__in=['F000011_11', 'F000003_3']))
+
         # Test deduplication works when first variants are build 37 and when they are build 38
-        self.assertListEqual(EsSearch._deduplicate_multi_genome_variant_results(
-            [PARSED_VARIANTS[1],  PARSED_VARIANTS[1], PARSED_MULTI_GENOME_VERSION_VARIANT]
+        es_search.previous_search_results['total_results'] = 3
+        self.assertListEqual(es_search._deduplicate_results(
+            deepcopy([PARSED_VARIANTS[1],  PARSED_VARIANTS[1], PARSED_MULTI_GENOME_VERSION_VARIANT])
         ), [PARSED_MULTI_GENOME_VERSION_VARIANT])
+        self.assertEqual(es_search.previous_search_results['duplicate_doc_count'], 2)
 
-        self.assertListEqual(EsSearch._deduplicate_multi_genome_variant_results(
-            [PARSED_MULTI_GENOME_VERSION_VARIANT, PARSED_MULTI_GENOME_VERSION_VARIANT, PARSED_VARIANTS[1]]
+        es_search.previous_search_results = {'total_results': 3}
+        self.assertListEqual(es_search._deduplicate_results(
+            deepcopy([PARSED_MULTI_GENOME_VERSION_VARIANT, PARSED_MULTI_GENOME_VERSION_VARIANT, PARSED_VARIANTS[1]])
         ), [PARSED_MULTI_GENOME_VERSION_VARIANT])
 
+        # Test variants are deduplicated against previously loaded results
+        es_search.previous_search_results = {'total_results': 4, 'variant_results': deepcopy([PARSED_VARIANTS[1]])}
+        es_search._add_loaded_variant_keys([PARSED_VARIANTS[0]])
+        self.assertListEqual(es_search.previous_search_results['loaded_variant_keys'], ['1-248367227-TC-T'])
+        self.assertListEqual(es_search._deduplicate_results(
+            deepcopy([PARSED_VARIANTS[0], PARSED_MULTI_GENOME_VERSION_VARIANT, PARSED_VARIANTS[1]])
+        ), [])
+        self.assertEqual(es_search.previous_search_results['duplicate_doc_count'], 3)
+        self.assertSetEqual(
+            set(es_search.previous_search_results['variant_results'][0]['genotypes'].keys()),
+            set(PARSED_VARIANTS[1]['genotypes'].keys()) | set(PARSED_MULTI_GENOME_VERSION_VARIANT['genotypes'].keys()),
+        )
+
+    @urllib3_responses.activate
+    def test_parse_hit_shared_sample_id(self):
+        setup_responses()
+        # The same sample ID is loaded in one index for individuals in two different families
+        individual = Individual.objects.get(guid='I000009_na20874')
+        Sample.objects.create(
+            guid='S_shared_hg00733', individual=individual, sample_id='HG00733', elasticsearch_index=INDEX_NAME,
+            sample_type=Sample.SAMPLE_TYPE_WES, dataset_type=Sample.DATASET_TYPE_VARIANT_CALLS, is_active=True,
+            loaded_date=timezone.now(),
+        )
+        es_search = EsSearch(self.families)
+
+        hit = mock_hits(ES_VARIANTS[1:2], include_matched_queries=False)[0]
+        variant = es_search._parse_hit(Hit(hit))
+        self.assertListEqual(variant['familyGuids'], ['F000002_2', 'F000003_3', 'F000005_5'])
+        self.assertSetEqual(set(variant['genotypes'].keys()), {
+            'I000004_hg00731', 'I000005_hg00732', 'I000006_hg00733', 'I000007_na20870', 'I000009_na20874'})
+        self.assertDictEqual(variant['genotypes']['I000009_na20874'], variant['genotypes']['I000006_hg00733'])
+        self.assertEqual(variant['genotypes']['I000009_na20874']['numAlt'], 1)
+
+        # Genotypes are only attributed to the matched families
+        hit['matched_queries'] = ['F000005_5']
+        variant = es_search._parse_hit(Hit(hit))
+        self.assertListEqual(variant['familyGuids'], ['F000005_5'])
+        self.assertListEqual(list(variant['genotypes'].keys()), ['I000009_na20874'])
+
+    def test_cached_search_context(self):
+        with self.assertNumQueries(2):
+            samples_by_family_index = get_samples_by_family_index(self.families)
+        self.assertSetEqual(set(samples_by_family_index.keys()), {INDEX_NAME, SV_INDEX_NAME})
+        self.assertSetEqual(set(samples_by_family_index[INDEX_NAME].keys()), {'F000003_3', 'F000002_2', 'F000005_5'})
+        self.assertSetEqual(set(samples_by_family_index[INDEX_NAME]['F000002_2'].keys()), {'HG00731', 'HG00732', 'HG00733'})
+
+        # Changes made by the caller do not change the cached samples
+        del samples_by_family_index[INDEX_NAME]['F000002_2']
+        samples_by_family_index[SV_INDEX_NAME]['F000002_2'].pop('HG00731')
+
+        with self.assertNumQueries(1):
+            cached_samples_by_family_index = get_samples_by_family_index(self.families)
+        self.assertSetEqual(set(cached_samples_by_family_index[INDEX_NAME].keys()), {'F000003_3', 'F000002_2', 'F000005_5'})
+        self.assertSetEqual(set(cached_samples_by_family_index[SV_INDEX_NAME]['F000002_2'].keys()), {'HG00731', 'HG00732'})
+
+        Sample.objects.filter(sample_id='HG00733').update(is_active=False)
+        with self.assertNumQueries(1):
+            samples_by_family_index = get_samples_by_family_index(self.families)
+        self.assertSetEqual(set(samples_by_family_index[INDEX_NAME]['F000002_2'].keys()), {'HG00731', 'HG00732', 'HG00733'})
+
+        reset_cached_search_context()
+        with self.assertNumQueries(2):
+            samples_by_family_index = get_samples_by_family_index(self.families)
+        self.assertSetEqual(set(samples_by_family_index[INDEX_NAME]['F000002_2'].keys()), {'HG00731', 'HG00732'})
+
+    @mock.patch.dict(REDIS_CACHE, clear=True)
+    @mock.patch('seqr.utils.elasticsearch.index_metadata_cache.time')
+    def test_cached_index_metadata(self, mock_time):
+        mock_time.monotonic.return_value = 1000
+        reset_index_metadata_cache()
+        initial_version = REDIS_CACHE['index_metadata_cache__version']
+        set_cached_index_value('index_metadata__test_cache', {'test_index': {'genomeVersion': '37'}})
+        self.assertDictEqual(json.loads(REDIS_CACHE['index_metadata__test_cache']), {'test_index': {'genomeVersion': '37'}})
+
+        # Values are served from the process cache until they expire, without loading from redis
+        _set_cache('index_metadata__test_cache', json.dumps({'test_index': {'genomeVersion': '38'}}))
+        MOCK_REDIS.reset_mock()
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '37'}})
+        MOCK_REDIS.get.assert_not_called()
+
+        mock_time.monotonic.return_value = 1301
+        MOCK_REDIS.reset_mock()
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '38'}})
+        self.assertListEqual(
+            [call.args[0] for call in MOCK_REDIS.get.call_args_list],
+            ['index_metadata_cache__version', 'index_metadata__test_cache'])
+
+        # Resetting the cache in another process reloads from redis once the shared cache version is rechecked
+        _set_cache('index_metadata__test_cache', json.dumps({'test_index': {'genomeVersion': '37'}}))
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '38'}})
+        _set_cache('index_metadata_cache__version', json.dumps('other_process_version'))
+        mock_time.monotonic.return_value = 1305
+        MOCK_REDIS.reset_mock()
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '38'}})
+        MOCK_REDIS.get.assert_not_called()
+        mock_time.monotonic.return_value = 1306
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '37'}})
+
+        # Resetting the cache reloads from redis and changes the shared cache version
+        _set_cache('index_metadata__test_cache', None)
+        self.assertDictEqual(get_cached_index_value('index_metadata__test_cache'), {'test_index': {'genomeVersion': '37'}})
+        reset_index_metadata_cache()
+        self.assertNotIn(REDIS_CACHE['index_metadata_cache__version'], {initial_version, json.dumps('other_process_version')})
+        self.assertIsNone(get_cached_index_value('index_metadata__test_cache'))
+
+    @urllib3_responses.activate
+    def test_compiled_genotype_queries(self):
+        setup_responses()
+        _compiled_family_sample_query.cache_clear()
+
+        def _get_genotype_filter(inheritance, quality_filter=None):
+            es_search = EsSearch(self.families)
+            es_search.filter_by_annotation_and_genotype(inheritance, quality_filter=quality_filter)
+            return es_search._index_searches[INDEX_NAME][-1].to_dict()['query']
+
+        # Queries are compiled for each family in each searched index
+        recessive_filter = _get_genotype_filter({'mode': 'recessive'}, quality_filter={'min_gq': 10})
+        self.assertEqual(_compiled_family_sample_query.cache_info().misses, 4)
+        self.assertEqual(_compiled_family_sample_query.cache_info().hits, 0)
+        self.assertListEqual(
+            [family_q['bool']['_name'] for family_q in recessive_filter['bool']['filter'][0]['bool']['should']],
+            ['F000002_2', 'F000003_3', 'F000005_5'],
+        )
+
+        self.assertDictEqual(_get_genotype_filter({'mode': 'recessive'}, quality_filter={'min_gq': 10}), recessive_filter)
+        self.assertEqual(_compiled_family_sample_query.cache_info().misses, 4)
+        self.assertEqual(_compiled_family_sample_query.cache_info().hits, 4)
+
+        # Queries are recompiled when the inheritance, quality filter, or affected status changes
+        self.assertNotEqual(_get_genotype_filter({'mode': 'recessive'}), recessive_filter)
+        self.assertNotEqual(_get_genotype_filter({'mode': 'de_novo'}, quality_filter={'min_gq': 10}), recessive_filter)
+        self.assertNotEqual(_get_genotype_filter(
+            {'mode': 'recessive', 'filter': {'affected': {'I000005_hg00732': 'A'}}}, quality_filter={'min_gq': 10},
+        ), recessive_filter)
+        self.assertEqual(_compiled_family_sample_query.cache_info().misses, 14)
+        self.assertEqual(_compiled_family_sample_query.cache_info().hits, 6)
+
     @urllib3_responses.activate
     def test_genotype_inheritance_filter(self):
         setup_responses()
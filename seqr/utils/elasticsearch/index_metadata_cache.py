@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+import uuid
+
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json
+
+# Index metadata and aliases are loaded to construct every search, but rarely change. They are cached for a short time in
+# each process in front of the shared redis cache. Process cached values are stored with the shared cache version, and
+# resetting the cache changes the version, which invalidates the cached values in all processes. The version is only
+# reloaded from redis every few seconds, so a reset in another process is picked up after at most that delay. If the
+# version can not be loaded from redis, process cached values are only invalidated once they expire
+INDEX_METADATA_VERSION_KEY = 'index_metadata_cache__version'
+INDEX_METADATA_VERSION_CHECK_SECONDS = 5
+INDEX_METADATA_CACHE_SIZE = 100
+INDEX_METADATA_CACHE_TTL_SECONDS = 300
+INDEX_METADATA = OrderedDict()
+INDEX_METADATA_LOCK = Lock()
+INDEX_METADATA_VERSION = {'version': None, 'checked': None}
+
+
+def get_cached_index_value(cache_key):
+    """
+    Returns the cached value for the given key from the process cache if it has not expired or been reset, otherwise
+    from redis
+    """
+    version = _get_cache_version()
+    with INDEX_METADATA_LOCK:
+        cached = INDEX_METADATA.get(cache_key)
+        if cached:
+            expires, cached_version, value = cached
+            if expires > time.monotonic() and cached_version == version:
+                INDEX_METADATA.move_to_end(cache_key)
+                return value
+            del INDEX_METADATA[cache_key]
+
+    value = safe_redis_get_json(cache_key)
+    if value:
+        _set_process_cache_value(cache_key, value, version)
+    return value
+
+
+def set_cached_index_value(cache_key, value):
+    safe_redis_set_json(cache_key, value)
+    _set_process_cache_value(cache_key, value, _get_cache_version())
+
+
+def reset_index_metadata_cache():
+    """Invalidates the process cached index metadata in all processes"""
+    version = uuid.uuid4().hex
+    with INDEX_METADATA_LOCK:
+        INDEX_METADATA.clear()
+        INDEX_METADATA_VERSION.update({'version': version, 'checked': time.monotonic()})
+    safe_redis_set_json(INDEX_METADATA_VERSION_KEY, version)
+
+
+def _get_cache_version():
+    with INDEX_METADATA_LOCK:
+        checked = INDEX_METADATA_VERSION['checked']
+        if checked is not None and checked + INDEX_METADATA_VERSION_CHECK_SECONDS > time.monotonic():
+            return INDEX_METADATA_VERSION['version']
+
+    version = safe_redis_get_json(INDEX_METADATA_VERSION_KEY)
+    with INDEX_METADATA_LOCK:
+        INDEX_METADATA_VERSION.update({'version': version, 'checked': time.monotonic()})
+    return version
+
+
+def _set_process_cache_value(cache_key, value, version):
+    with INDEX_METADATA_LOCK:
+        INDEX_METADATA[cache_key] = (time.monotonic() + INDEX_METADATA_CACHE_TTL_SECONDS, version, value)
+        INDEX_METADATA.move_to_end(cache_key)
+        while len(INDEX_METADATA) > INDEX_METADATA_CACHE_SIZE:
+            INDEX_METADATA.popitem(last=False)
@@ -0,0 +1,76 @@
+from collections import defaultdict, OrderedDict
+import hashlib
+from threading import Lock
+import uuid
+
+from django.db.models import QuerySet
+
+from seqr.models import Sample
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json
+
+# Loading the active samples for a search's families is repeated for every page of every search, and is the dominant
+# database cost for searches across many projects. The loaded samples are cached in each process for the set of
+# searched families, and are invalidated across all processes by changing the shared sample load version
+SAMPLE_LOAD_VERSION_KEY = 'search_context__sample_load_version'
+SEARCH_CONTEXT_CACHE_SIZE = 20
+SEARCH_CONTEXTS = OrderedDict()
+SEARCH_CONTEXTS_LOCK = Lock()
+
+
+def get_samples_by_family_index(families):
+    """
+    Returns the active samples for the given families, keyed by elasticsearch index and family guid. The returned
+    mapping is a copy which may be modified by the caller
+    """
+    version = _get_sample_load_version()
+    if version is None:
+        return _copy_samples_by_family_index(_load_samples_by_family_index(families))
+
+    family_guids = families.values_list('guid', flat=True) if isinstance(families, QuerySet) else \
+        [family.guid for family in families]
+    families_hash = hashlib.md5(','.join(sorted(family_guids)).encode('utf-8')).hexdigest()
+    cache_key = (families_hash, version)
+
+    with SEARCH_CONTEXTS_LOCK:
+        samples_by_family_index = SEARCH_CONTEXTS.get(cache_key)
+        if samples_by_family_index is not None:
+            SEARCH_CONTEXTS.move_to_end(cache_key)
+
+    if samples_by_family_index is None:
+        samples_by_family_index = _load_samples_by_family_index(families)
+        with SEARCH_CONTEXTS_LOCK:
+            SEARCH_CONTEXTS[cache_key] = samples_by_family_index
+            while len(SEARCH_CONTEXTS) > SEARCH_CONTEXT_CACHE_SIZE:
+                SEARCH_CONTEXTS.popitem(last=False)
+
+    return _copy_samples_by_family_index(samples_by_family_index)
+
+
+def reset_cached_search_context():
+    """Invalidates the cached search context in all processes. Should be called whenever samples are loaded or changed"""
+    safe_redis_set_json(SAMPLE_LOAD_VERSION_KEY, uuid.uuid4().hex)
+
+
+def _get_sample_load_version():
+    version = safe_redis_get_json(SAMPLE_LOAD_VERSION_KEY)
+    if version is None:
+        # If the version can not be shared through redis, cached contexts could not be invalidated in other processes
+        reset_cached_search_context()
+        version = safe_redis_get_json(SAMPLE_LOAD_VERSION_KEY)
+    return version
+
+
+def _load_samples_by_family_index(families):
+    samples_by_family_index = defaultdict(lambda: defaultdict(dict))
+    samples = Sample.objects.filter(is_active=True, individual__family__in=families)
+    for s in samples.select_related('individual__family'):
+        samples_by_family_index[s.elasticsearch_index][s.individual.family.guid][s.sample_id] = s
+    return samples_by_family_index
+
+
+def _copy_samples_by_family_index(samples_by_family_index):
+    copied_samples_by_family_index = defaultdict(lambda: defaultdict(dict))
+    for index, family_samples in samples_by_family_index.items():
+        for family_guid, samples_by_id in family_samples.items():
+            copied_samples_by_family_index[index][family_guid] = dict(samples_by_id)
+    return copied_samples_by_family_index
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.db import connections
+import logging
+import os
+from threading import Lock, Thread
+import time
+
+from settings import SEARCH_JOB_WORKERS, SEARCH_JOB_ES_TIMEOUT
+from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY
+from seqr.utils.elasticsearch.search_results_cache import load_cached_search_results
+from seqr.utils.elasticsearch.utils import get_es_variants, get_search_results_cache_key
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json, safe_redis_mset_json
+
+logger = logging.getLogger(__name__)
+
+SEARCH_JOB_QUEUED = 'queued'
+SEARCH_JOB_RUNNING = 'running'
+SEARCH_JOB_COMPLETE = 'complete'
+SEARCH_JOB_ERROR = 'error'
+IN_PROGRESS_STATUSES = {SEARCH_JOB_QUEUED, SEARCH_JOB_RUNNING}
+
+# Job status is shared through redis for each page of a search so it can be polled from any process, and is stored
+# alongside the cached search results so it is reset with them. Loaded results are written to the cached search results
+# as for any other search, so once a job completes its page is returned from the cache
+SEARCH_JOB_STATUS_EXPIRE = timedelta(days=1)
+
+# Jobs are lost if the process running them exits, so while a job is in progress its process refreshes a short lived
+# heartbeat for it. In progress jobs with no heartbeat are reported as failed
+SEARCH_JOB_HEARTBEAT_SECONDS = 10
+SEARCH_JOB_HEARTBEAT_EXPIRE = timedelta(seconds=SEARCH_JOB_HEARTBEAT_SECONDS * 3)
+SEARCH_JOB_INTERRUPTED_ERROR = 'Search job was interrupted'
+
+SEARCH_JOBS = {}
+SEARCH_JOBS_LOCK = Lock()
+SEARCH_JOB_EXECUTOR = None
+SEARCH_JOB_EXECUTOR_PID = None
+
+
+def submit_search_job(search_model, sort=XPOS_SORT_KEY, page=1, num_results=100, skip_genotype_filter=False):
+    """
+    Runs the search for the given page in a background thread and returns the job status. If the same page of the search
+    is already being loaded in this process, the status of the existing job is returned instead
+    """
+    cache_key = get_search_results_cache_key(search_model, sort)
+    job_key = (cache_key, page, num_results)
+    with SEARCH_JOBS_LOCK:
+        future = SEARCH_JOBS.get(job_key)
+        if future and not future.done():
+            return get_search_job_status(search_model, sort, page=page, num_results=num_results)
+
+        _set_search_job_status(cache_key, SEARCH_JOB_QUEUED, page, num_results)
+        future = _get_executor().submit(
+            _run_search_job, search_model, sort, page, num_results, skip_genotype_filter)
+        SEARCH_JOBS[job_key] = future
+    future.add_done_callback(lambda f: _remove_search_job(job_key, f))
+
+    return get_search_job_status(search_model, sort, page=page, num_results=num_results)
+
+
+def prefetch_search_page(search_model, total_results, sort=XPOS_SORT_KEY, page=1, num_results=100,
+                         skip_genotype_filter=False):
+    """Loads the page after the given page in the background, if there are any further results"""
+    if total_results is None or page * num_results >= total_results:
+        return None
+    return submit_search_job(
+        search_model, sort=sort, page=page + 1, num_results=num_results, skip_genotype_filter=skip_genotype_filter)
+
+
+def get_search_job_status(search_model, sort=XPOS_SORT_KEY, page=1, num_results=100):
+    """
+    Returns the status of the most recent background job for the given page of the search, or None if no job has been
+    run. While a job is in progress, the status includes the total results and the variant counts loaded so far from
+    each index for previously loaded pages
+    """
+    cache_key = get_search_results_cache_key(search_model, sort)
+    job_cache_key = _search_job_cache_key(cache_key, page, num_results)
+    status = safe_redis_get_json(job_cache_key)
+    if status and status['status'] in IN_PROGRESS_STATUSES:
+        if not safe_redis_get_json(_search_job_heartbeat_key(job_cache_key)):
+            return {'status': SEARCH_JOB_ERROR, 'page': page, 'numResults': num_results,
+                    'error': SEARCH_JOB_INTERRUPTED_ERROR}
+        previous_search_results = load_cached_search_results(cache_key)
+        status['totalResults'] = previous_search_results.get('total_results')
+        status['loadedVariantCounts'] = previous_search_results.get('loaded_variant_counts') or {}
+    return status
+
+
+def _run_search_job(search_model, sort, page, num_results, skip_genotype_filter):
+    cache_key = get_search_results_cache_key(search_model, sort)
+    _set_search_job_status(cache_key, SEARCH_JOB_RUNNING, page, num_results)
+    try:
+        _, total_results = get_es_variants(
+            search_model, sort=sort, page=page, num_results=num_results, skip_genotype_filter=skip_genotype_filter,
+            es_timeout=SEARCH_JOB_ES_TIMEOUT, wait_for_loading=True)
+        _set_search_job_status(cache_key, SEARCH_JOB_COMPLETE, page, num_results, totalResults=total_results)
+    except Exception as e:
+        logger.error('Search job for {} failed: {}'.format(cache_key, str(e)))
+        _set_search_job_status(cache_key, SEARCH_JOB_ERROR, page, num_results, error=str(e))
+    finally:
+        # Database connections are opened per thread, and are not closed by the request cycle for pool threads
+        connections.close_all()
+
+
+def _set_search_job_status(cache_key, status, page, num_results, **kwargs):
+    job_status = {'status': status, 'page': page, 'numResults': num_results}
+    job_status.update(kwargs)
+    job_cache_key = _search_job_cache_key(cache_key, page, num_results)
+    if status in IN_PROGRESS_STATUSES:
+        safe_redis_set_json(_search_job_heartbeat_key(job_cache_key), True, expire=SEARCH_JOB_HEARTBEAT_EXPIRE)
+    safe_redis_set_json(job_cache_key, job_status, expire=SEARCH_JOB_STATUS_EXPIRE)
+
+
+def _search_job_cache_key(cache_key, page, num_results):
+    return '{}__job__{}__{}'.format(cache_key, page, num_results)
+
+
+def _search_job_heartbeat_key(job_cache_key):
+    return '{}__heartbeat'.format(job_cache_key)
+
+
+def _refresh_search_job_heartbeats():
+    with SEARCH_JOBS_LOCK:
+        job_keys = [job_key for job_key, future in SEARCH_JOBS.items() if not future.done()]
+    safe_redis_mset_json({
+        _search_job_heartbeat_key(_search_job_cache_key(*job_key)): True for job_key in job_keys
+    }, expire=SEARCH_JOB_HEARTBEAT_EXPIRE)
+
+
+def _run_search_job_heartbeats():
+    while True:
+        time.sleep(SEARCH_JOB_HEARTBEAT_SECONDS)
+        try:
+            _refresh_search_job_heartbeats()
+        except Exception as e:
+            logger.error('Unable to refresh search job heartbeats: {}'.format(str(e)))
+
+
+def _remove_search_job(job_key, future):
+    with SEARCH_JOBS_LOCK:
+        if SEARCH_JOBS.get(job_key) is future:
+            del SEARCH_JOBS[job_key]
+
+
+def _get_executor():
+    global SEARCH_JOB_EXECUTOR, SEARCH_JOB_EXECUTOR_PID
+    if SEARCH_JOB_EXECUTOR_PID != os.getpid():
+        # Worker threads are not copied into forked processes
+        SEARCH_JOB_EXECUTOR = ThreadPoolExecutor(max_workers=SEARCH_JOB_WORKERS, thread_name_prefix='search_job')
+        SEARCH_JOB_EXECUTOR_PID = os.getpid()
+        SEARCH_JOBS.clear()
+        Thread(target=_run_search_job_heartbeats, name='search_job_heartbeat', daemon=True).start()
+    return SEARCH_JOB_EXECUTOR
@@ -0,0 +1,75 @@
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from threading import Lock
+import time
+
+# Phases of a search which are timed by the profiler
+CONTEXT_PHASE = 'context'
+INDEX_METADATA_PHASE = 'indexMetadata'
+QUERY_COMPILE_PHASE = 'queryCompile'
+ES_SEARCH_PHASE = 'esSearch'
+PARSE_PHASE = 'parse'
+MERGE_PHASE = 'merge'
+COMPOUND_HET_PHASE = 'compoundHets'
+CACHE_READ_PHASE = 'cacheRead'
+CACHE_WRITE_PHASE = 'cacheWrite'
+
+
+class SearchProfiler(object):
+    """
+    Records the wall time spent in each phase of a search, and the time elasticsearch reports spending on each request.
+    Phase times are cumulative, so nested phases (i.e. compound het processing while parsing a response) and phases run
+    concurrently in separate threads may overlap. Comparing the elasticsearch wall time with the reported elasticsearch
+    took time shows whether a slow search is bound by elasticsearch or by request overhead and processing in seqr
+    """
+
+    def __init__(self, include_es_profile=False):
+        self.include_es_profile = include_es_profile
+        self._phase_seconds = defaultdict(float)
+        self._es_took_ms = 0
+        self._es_requests = 0
+        self._es_profiles = []
+        self._lock = Lock()
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._phase_seconds[phase] += elapsed
+
+    def record_es_response(self, response):
+        profile = getattr(response, 'profile', None) if self.include_es_profile else None
+        with self._lock:
+            self._es_requests += 1
+            self._es_took_ms += response.took
+            if profile:
+                self._es_profiles.append(profile.to_dict())
+
+    def to_json(self):
+        with self._lock:
+            phases_ms = {phase: _to_ms(seconds) for phase, seconds in self._phase_seconds.items()}
+            es_wall_ms = phases_ms.get(ES_SEARCH_PHASE, 0)
+            profile_json = {
+                'phasesMs': phases_ms,
+                'esRequests': self._es_requests,
+                'esTookMs': self._es_took_ms,
+                'esOverheadMs': round(max(es_wall_ms - self._es_took_ms, 0), 3),
+            }
+            if self.include_es_profile:
+                profile_json['esProfiles'] = list(self._es_profiles)
+        return profile_json
+
+
+def timed_phase(profiler, phase):
+    """Returns a context manager which times the given phase, or does nothing if the search is not being profiled"""
+    if profiler is None:
+        return nullcontext()
+    return profiler.timed(phase)
+
+
+def _to_ms(seconds):
+    return round(seconds * 1000, 3)
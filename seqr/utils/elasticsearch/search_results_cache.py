@@ -0,0 +1,158 @@
+import logging
+
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_mget_json, safe_redis_mset_json
+
+logger = logging.getLogger(__name__)
+
+# Result lists can grow to thousands of parsed variants, so instead of caching them inline with the rest of the search
+# state they are stored as fixed size chunks and only the chunks needed for the requested page are loaded
+CHUNKED_RESULTS_KEYS = [
+    'all_results', 'variant_results', 'grouped_results', 'compound_het_results', 'loaded_variant_keys',
+]
+CHUNKED_RESULTS_COUNTS_KEY = 'chunked_results_counts'
+RESULTS_CHUNK_SIZE = 100
+
+
+class MissingCachedResultsException(Exception):
+    pass
+
+
+class CachedResultsList(object):
+    """
+    List-like view of results stored in redis in chunks. Chunks are loaded lazily when they are accessed, and only
+    chunks which have been changed are written back to the cache
+    """
+
+    def __init__(self, cache_key, length):
+        self.cache_key = cache_key
+        self._length = length
+        self._chunks = {}
+        self._updated_chunks = set()
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+    def __iter__(self):
+        num_chunks = _num_chunks(self._length)
+        self._load_chunks(range(num_chunks))
+        for chunk_index in range(num_chunks):
+            for result in self._chunks[chunk_index]:
+                yield result
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step != 1:
+                return list(self)[key]
+            if start >= stop:
+                return []
+            first_chunk = start // RESULTS_CHUNK_SIZE
+            last_chunk = (stop - 1) // RESULTS_CHUNK_SIZE
+            self._load_chunks(range(first_chunk, last_chunk + 1))
+            results = []
+            for chunk_index in range(first_chunk, last_chunk + 1):
+                results += self._chunks[chunk_index]
+            offset = first_chunk * RESULTS_CHUNK_SIZE
+            return results[start - offset:stop - offset]
+
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError('list index out of range')
+        chunk_index = key // RESULTS_CHUNK_SIZE
+        self._load_chunks([chunk_index])
+        return self._chunks[chunk_index][key % RESULTS_CHUNK_SIZE]
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def append(self, result):
+        self.extend([result])
+
+    def extend(self, results):
+        results = list(results)
+        if not results:
+            return
+        chunk_index = self._length // RESULTS_CHUNK_SIZE
+        if self._length % RESULTS_CHUNK_SIZE:
+            # Only the trailing partial chunk needs to be loaded to add new results
+            self._load_chunks([chunk_index])
+        for result in results:
+            chunk_index = self._length // RESULTS_CHUNK_SIZE
+            self._chunks.setdefault(chunk_index, []).append(result)
+            self._updated_chunks.add(chunk_index)
+            self._length += 1
+
+    def updated_chunks(self):
+        return {
+            _chunk_cache_key(self.cache_key, chunk_index): self._chunks[chunk_index]
+            for chunk_index in sorted(self._updated_chunks)
+        }
+
+    def _load_chunks(self, chunk_indices):
+        chunk_keys = {
+            _chunk_cache_key(self.cache_key, chunk_index): chunk_index
+            for chunk_index in chunk_indices if chunk_index not in self._chunks
+        }
+        if not chunk_keys:
+            return
+        cached_chunks = safe_redis_mget_json(list(chunk_keys.keys()))
+        missing_keys = [key for key in chunk_keys.keys() if key not in cached_chunks]
+        if missing_keys:
+            raise MissingCachedResultsException('Unable to load cached results {}'.format(', '.join(missing_keys)))
+        for chunk_key, chunk in cached_chunks.items():
+            self._chunks[chunk_keys[chunk_key]] = chunk
+
+
+def load_cached_search_results(cache_key):
+    """Loads the cached search state. Results lists are returned as lazily loaded CachedResultsList objects"""
+    previous_search_results = safe_redis_get_json(cache_key) or {}
+    results_counts = previous_search_results.pop(CHUNKED_RESULTS_COUNTS_KEY, None)
+    # Search results cached before results were chunked are stored inline, and are used as is
+    for results_key, count in (results_counts or {}).items():
+        previous_search_results[results_key] = CachedResultsList(_results_cache_key(cache_key, results_key), count)
+    return previous_search_results
+
+
+def save_cached_search_results(cache_key, previous_search_results, expire=None):
+    """Caches the search state, writing only the result chunks which were added or changed in a single round trip"""
+    search_state = {}
+    results_counts = {}
+    values_by_key = {}
+    for key, value in previous_search_results.items():
+        if key not in CHUNKED_RESULTS_KEYS:
+            search_state[key] = value
+            continue
+
+        results_counts[key] = len(value)
+        results_cache_key = _results_cache_key(cache_key, key)
+        if isinstance(value, CachedResultsList) and value.cache_key == results_cache_key:
+            values_by_key.update(value.updated_chunks())
+        else:
+            values_by_key.update({
+                _chunk_cache_key(results_cache_key, chunk_index):
+                    value[chunk_index * RESULTS_CHUNK_SIZE:(chunk_index + 1) * RESULTS_CHUNK_SIZE]
+                for chunk_index in range(_num_chunks(len(value)))
+            })
+
+    search_state[CHUNKED_RESULTS_COUNTS_KEY] = results_counts
+    values_by_key[cache_key] = search_state
+    safe_redis_mset_json(values_by_key, expire=expire)
+
+
+def _results_cache_key(cache_key, results_key):
+    return '{}__{}'.format(cache_key, results_key)
+
+
+def _chunk_cache_key(results_cache_key, chunk_index):
+    return '{}__{}'.format(results_cache_key, chunk_index)
+
+
+def _num_chunks(length):
+    return (length + RESULTS_CHUNK_SIZE - 1) // RESULTS_CHUNK_SIZE
@@ -1,19 +1,39 @@
+from contextlib import contextmanager
 from datetime import timedelta
 import elasticsearch
+from elasticsearch.connection import Urllib3HttpConnection
 from elasticsearch_dsl import Q
 import logging
-
-from settings import ELASTICSEARCH_SERVICE_HOSTNAME, ELASTICSEARCH_SERVICE_PORT, ELASTICSEARCH_CREDENTIALS, ELASTICSEARCH_PROTOCOL, ES_SSL_CONTEXT
+import os
+from threading import Lock
+import time
+import uuid
+
+from settings import ELASTICSEARCH_SERVICE_HOSTNAME, ELASTICSEARCH_SERVICE_PORT, ELASTICSEARCH_CREDENTIALS, \
+    ELASTICSEARCH_PROTOCOL, ES_SSL_CONTEXT, ELASTICSEARCH_CONNECTION_POOL_SIZE, ELASTICSEARCH_SNIFFER_TIMEOUT, \
+    SEARCH_JOB_ES_TIMEOUT
 from seqr.models import Sample
-from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json
-from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY
+from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY, SAMPLES_LOOKUP_INDEX
 from seqr.utils.elasticsearch.es_gene_agg_search import EsGeneAggSearch
-from seqr.utils.elasticsearch.es_search import EsSearch
+from seqr.utils.elasticsearch.es_search import EsSearch, SAMPLES_LOOKUP_CACHE_EXPIRE, SAMPLES_LOOKUP_MAX_AGE
+from seqr.utils.elasticsearch.index_metadata_cache import get_cached_index_value, set_cached_index_value
+from seqr.utils.elasticsearch.search_results_cache import load_cached_search_results, save_cached_search_results, \
+    MissingCachedResultsException
+from seqr.utils.elasticsearch.search_profiler import timed_phase, CACHE_READ_PHASE, CACHE_WRITE_PHASE, \
+    QUERY_COMPILE_PHASE
 from seqr.utils.gene_utils import parse_locus_list_items
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json_if_missing, \
+    safe_redis_delete
 from seqr.utils.xpos_utils import get_xpos, get_chrom_pos
 
 logger = logging.getLogger(__name__)
 
+# Only one request loads a given search at a time. Background search jobs wait for a search which is already being loaded
+# and then return the cached results, while synchronous requests fail fast instead of tying up a web worker. The lock
+# expires in case its holder exits
+SEARCH_LOADING_LOCK_EXPIRE = timedelta(seconds=SEARCH_JOB_ES_TIMEOUT)
+SEARCH_LOADING_LOCK_POLL_SECONDS = 0.5
+
 
 class InvalidIndexException(Exception):
     pass
@@ -21,11 +41,52 @@ class InvalidIndexException(Exception):
 class InvalidSearchException(Exception):
     pass
 
+class SearchLoadingException(Exception):
+    pass
+
+
+class PooledHttpConnection(Urllib3HttpConnection):
+    """Keep-alive connection which records how long requests wait to check out a socket from its pool"""
+
+    def __init__(self, *args, **kwargs):
+        super(PooledHttpConnection, self).__init__(*args, **kwargs)
+        self.pool_wait_seconds = 0.0
+
+        get_conn = self.pool._get_conn
+        def _timed_get_conn(timeout=None):
+            start = time.time()
+            try:
+                return get_conn(timeout=timeout)
+            finally:
+                self.pool_wait_seconds += time.time() - start
+        self.pool._get_conn = _timed_get_conn
+
+
+ES_CLIENTS = {}
+ES_CLIENTS_PID = None
+ES_CLIENTS_LOCK = Lock()
+
 
 def get_es_client(timeout=60, **kwargs):
+    """Returns a shared client for the given options, so each process reuses its open elasticsearch connections"""
+    global ES_CLIENTS_PID
+    client_key = (timeout, tuple(sorted((k, repr(v)) for k, v in kwargs.items())))
+    with ES_CLIENTS_LOCK:
+        if ES_CLIENTS_PID != os.getpid():
+            # Connections can not be shared across forked processes
+            ES_CLIENTS.clear()
+            ES_CLIENTS_PID = os.getpid()
+        if client_key not in ES_CLIENTS:
+            ES_CLIENTS[client_key] = _create_es_client(timeout, **kwargs)
+        return ES_CLIENTS[client_key]
+
+
+def _create_es_client(timeout, **kwargs):
     client_kwargs = {
         'hosts': [{'host': ELASTICSEARCH_SERVICE_HOSTNAME, 'port': ELASTICSEARCH_SERVICE_PORT}],
         'timeout': timeout,
+        'connection_class': PooledHttpConnection,
+        'maxsize': ELASTICSEARCH_CONNECTION_POOL_SIZE,
     }
     if ELASTICSEARCH_CREDENTIALS:
         client_kwargs['http_auth'] = ELASTICSEARCH_CREDENTIALS
@@ -33,13 +94,55 @@ def get_es_client(timeout=60, **kwargs):
         client_kwargs['scheme'] = ELASTICSEARCH_PROTOCOL
     if ES_SSL_CONTEXT:
         client_kwargs['ssl_context'] = ES_SSL_CONTEXT
-    return elasticsearch.Elasticsearch(**client_kwargs, **kwargs)
+    if ELASTICSEARCH_SNIFFER_TIMEOUT:
+        client_kwargs.update({
+            'sniff_on_connection_fail': True,
+            'sniffer_timeout': float(ELASTICSEARCH_SNIFFER_TIMEOUT),
+        })
+    client_kwargs.update(kwargs)
+    return elasticsearch.Elasticsearch(**client_kwargs)
+
+
+def get_es_client_pool_stats():
+    stats = []
+    with ES_CLIENTS_LOCK:
+        clients = list(ES_CLIENTS.items())
+    for (timeout, options), client in clients:
+        for connection in client.transport.connection_pool.connections:
+            pool = connection.pool
+            num_requests = pool.num_requests
+            stats.append({
+                'host': connection.host,
+                'timeout': timeout,
+                'options': dict(options),
+                'openConnections': len([conn for conn in pool.pool.queue if conn]) if pool.pool else 0,
+                'createdConnections': pool.num_connections,
+                'requests': num_requests,
+                'reuseRatio': (1 - pool.num_connections / num_requests) if num_requests else None,
+                'waitSeconds': getattr(connection, 'pool_wait_seconds', None),
+            })
+    return stats
+
+
+def delete_stale_samples_lookups(max_age=SAMPLES_LOOKUP_MAX_AGE):
+    """
+    Deletes stored samples lookups which have not been used by a search for longer than the given max age
+    :return: the number of deleted lookups
+    """
+    if max_age <= SAMPLES_LOOKUP_CACHE_EXPIRE:
+        raise ValueError('Samples lookups can only be deleted once their cache markers expire after {}'.format(
+            SAMPLES_LOOKUP_CACHE_EXPIRE))
+    last_used = int(time.time() - max_age.total_seconds())
+    response = get_es_client().delete_by_query(
+        index=SAMPLES_LOOKUP_INDEX, body={'query': {'range': {'last_used': {'lt': last_used}}}}, ignore=404,
+    )
+    return response.get('deleted', 0)
 
 
 def get_index_metadata(index_name, client, include_fields=False, use_cache=True):
     if use_cache:
         cache_key = 'index_metadata__{}'.format(index_name)
-        cached_metadata = safe_redis_get_json(cache_key)
+        cached_metadata = get_cached_index_value(cache_key)
         if cached_metadata:
             return cached_metadata
 
@@ -58,7 +161,7 @@ def get_index_metadata(index_name, client, include_fields=False, use_cache=True)
             }
     if use_cache and include_fields:
         # Only cache metadata with fields
-        safe_redis_set_json(cache_key, index_metadata)
+        set_cached_index_value(cache_key, index_metadata)
     return index_metadata
 
 
@@ -88,14 +191,101 @@ def get_es_variants_for_variant_tuples(families, xpos_ref_alt_tuples):
     return get_es_variants_for_variant_ids(families, variant_ids, dataset_type=Sample.DATASET_TYPE_VARIANT_CALLS)
 
 
-def get_es_variants(search_model, es_search_cls=EsSearch, sort=XPOS_SORT_KEY, skip_genotype_filter=False, **kwargs):
-    cache_key = 'search_results__{}__{}'.format(search_model.guid, sort or XPOS_SORT_KEY)
-    previous_search_results = safe_redis_get_json(cache_key) or {}
+def get_search_results_cache_key(search_model, sort=XPOS_SORT_KEY):
+    return 'search_results__{}__{}'.format(search_model.guid, sort or XPOS_SORT_KEY)
+
 
-    previously_loaded_results, search_kwargs = es_search_cls.process_previous_results(previous_search_results,  **kwargs)
+def get_cached_es_variants(search_model, es_search_cls=EsSearch, sort=XPOS_SORT_KEY, **kwargs):
+    """Returns the requested page of results if it has already been loaded, without running a search"""
+    previous_search_results = load_cached_search_results(get_search_results_cache_key(search_model, sort))
+    try:
+        previously_loaded_results, _ = es_search_cls.process_previous_results(previous_search_results, **kwargs)
+    except MissingCachedResultsException:
+        return None, None
+    if previously_loaded_results is None:
+        return None, None
+    return previously_loaded_results, previous_search_results.get('total_results')
+
+
+def get_es_variants(search_model, es_search_cls=EsSearch, sort=XPOS_SORT_KEY, skip_genotype_filter=False, profiler=None,
+                    es_timeout=None, wait_for_loading=False, **kwargs):
+    """
+    Loads the requested page of results for the given search. If a SearchProfiler is provided, the time spent in each
+    phase of the search is recorded on it and logged once the search completes. If the search is already being loaded
+    elsewhere, waits for it to load if wait_for_loading is set and otherwise raises a SearchLoadingException
+    """
+    cache_key = get_search_results_cache_key(search_model, sort)
+    with timed_phase(profiler, CACHE_READ_PHASE):
+        previous_search_results = load_cached_search_results(cache_key)
+    try:
+        results = _get_es_variants(
+            cache_key, previous_search_results, search_model, es_search_cls, sort, skip_genotype_filter, profiler,
+            es_timeout, wait_for_loading, **kwargs)
+    except MissingCachedResultsException as e:
+        # Individual result chunks may be evicted from redis, in which case the search is rerun from scratch
+        logger.warning('{}. Reloading search results'.format(e))
+        results = _get_es_variants(
+            cache_key, {}, search_model, es_search_cls, sort, skip_genotype_filter, profiler, es_timeout,
+            wait_for_loading, **kwargs)
+
+    if profiler:
+        logger.info('Search profile for {}'.format(cache_key), extra={'search_profile': profiler.to_json()})
+    return results
+
+
+def _get_es_variants(cache_key, previous_search_results, search_model, es_search_cls, sort, skip_genotype_filter, profiler,
+                     es_timeout, wait_for_loading, **kwargs):
+    with timed_phase(profiler, CACHE_READ_PHASE):
+        previously_loaded_results, search_kwargs = es_search_cls.process_previous_results(
+            previous_search_results,  **kwargs)
     if previously_loaded_results is not None:
         return previously_loaded_results, previous_search_results.get('total_results')
 
+    with _search_loading_lock(cache_key, wait=wait_for_loading) as waited:
+        if waited:
+            # The search was loaded by another request while waiting, so its results may now be cached
+            with timed_phase(profiler, CACHE_READ_PHASE):
+                previous_search_results = load_cached_search_results(cache_key)
+                previously_loaded_results, search_kwargs = es_search_cls.process_previous_results(
+                    previous_search_results, **kwargs)
+            if previously_loaded_results is not None:
+                return previously_loaded_results, previous_search_results.get('total_results')
+
+        return _load_es_variants(
+            cache_key, previous_search_results, search_kwargs, search_model, es_search_cls, sort, skip_genotype_filter,
+            profiler, es_timeout)
+
+
+@contextmanager
+def _search_loading_lock(cache_key, wait=False):
+    """
+    Holds a lock shared across processes while the given search is loaded. If another request is loading the same search,
+    waits for it to finish first if wait is set and otherwise raises a SearchLoadingException. Yields whether it had to
+    wait. If redis is unavailable, the search is loaded without a lock
+    """
+    lock_key = '{}__loading'.format(cache_key)
+    lock_id = uuid.uuid4().hex
+    waited = False
+    deadline = time.monotonic() + SEARCH_LOADING_LOCK_EXPIRE.total_seconds()
+    acquired = safe_redis_set_json_if_missing(lock_key, lock_id, expire=SEARCH_LOADING_LOCK_EXPIRE)
+    if acquired is False and not wait:
+        raise SearchLoadingException('This search is already being loaded. Please try again shortly')
+    while acquired is False and time.monotonic() < deadline:
+        waited = True
+        time.sleep(SEARCH_LOADING_LOCK_POLL_SECONDS)
+        acquired = safe_redis_set_json_if_missing(lock_key, lock_id, expire=SEARCH_LOADING_LOCK_EXPIRE)
+    if acquired is False:
+        logger.warning('Timed out waiting for {} to load'.format(cache_key))
+
+    try:
+        yield waited
+    finally:
+        if acquired and safe_redis_get_json(lock_key) == lock_id:
+            safe_redis_delete(lock_key)
+
+
+def _load_es_variants(cache_key, previous_search_results, search_kwargs, search_model, es_search_cls, sort,
+                      skip_genotype_filter, profiler, es_timeout):
     search = search_model.variant_search.search
 
     genes, intervals, invalid_items = parse_locus_list_items(search.get('locus', {}))
@@ -109,38 +299,42 @@ def get_es_variants(search_model, es_search_cls=EsSearch, sort=XPOS_SORT_KEY, sk
         search_model.families.all(),
         previous_search_results=previous_search_results,
         skip_unaffected_families=search.get('inheritance'),
+        profiler=profiler,
+        es_timeout=es_timeout,
     )
 
-    if search.get('customQuery'):
-        custom_q = search['customQuery']
-        if not isinstance(custom_q, list):
-            custom_q = [custom_q]
-        for q_dict in custom_q:
-            es_search.filter(Q(q_dict))
+    with timed_phase(profiler, QUERY_COMPILE_PHASE):
+        if search.get('customQuery'):
+            custom_q = search['customQuery']
+            if not isinstance(custom_q, list):
+                custom_q = [custom_q]
+            for q_dict in custom_q:
+                es_search.filter(Q(q_dict))
 
-    if sort:
-        es_search.sort(sort)
+        if sort:
+            es_search.sort(sort)
 
-    if genes or intervals or rs_ids or variant_ids:
-        es_search.filter_by_location(
-            genes=genes, intervals=intervals, rs_ids=rs_ids, variant_ids=variant_ids, locus=search['locus'])
-        if (variant_ids or rs_ids) and not (genes or intervals) and not search['locus'].get('excludeLocations'):
-            search_kwargs['num_results'] = len(variant_ids) + len(rs_ids)
+        if genes or intervals or rs_ids or variant_ids:
+            es_search.filter_by_location(
+                genes=genes, intervals=intervals, rs_ids=rs_ids, variant_ids=variant_ids, locus=search['locus'])
+            if (variant_ids or rs_ids) and not (genes or intervals) and not search['locus'].get('excludeLocations'):
+                search_kwargs['num_results'] = len(variant_ids) + len(rs_ids)
 
-    if search.get('freqs'):
-        es_search.filter_by_frequency(search['freqs'])
+        if search.get('freqs'):
+            es_search.filter_by_frequency(search['freqs'])
 
-    es_search.filter_by_annotation_and_genotype(
-        search.get('inheritance'), quality_filter=search.get('qualityFilter'),
-        annotations=search.get('annotations'), annotations_secondary=search.get('annotations_secondary'),
-        pathogenicity=search.get('pathogenicity'), skip_genotype_filter=skip_genotype_filter)
+        es_search.filter_by_annotation_and_genotype(
+            search.get('inheritance'), quality_filter=search.get('qualityFilter'),
+            annotations=search.get('annotations'), annotations_secondary=search.get('annotations_secondary'),
+            pathogenicity=search.get('pathogenicity'), skip_genotype_filter=skip_genotype_filter)
 
-    if hasattr(es_search, 'aggregate_by_gene'):
-        es_search.aggregate_by_gene()
+        if hasattr(es_search, 'aggregate_by_gene'):
+            es_search.aggregate_by_gene()
 
     variant_results = es_search.search(**search_kwargs)
 
-    safe_redis_set_json(cache_key, es_search.previous_search_results, expire=timedelta(weeks=2))
+    with timed_phase(profiler, CACHE_WRITE_PHASE):
+        save_cached_search_results(cache_key, es_search.previous_search_results, expire=timedelta(weeks=2))
 
     return variant_results, es_search.previous_search_results.get('total_results')
 
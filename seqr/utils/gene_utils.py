@@ -1,12 +1,31 @@
 import re
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from copy import deepcopy
+from datetime import timedelta
 from django.db.models import Q
 from django.db.models.functions import Length
+from threading import Lock
+import uuid
 
+from reference_data.gene_reference_snapshot import get_gene_reference_snapshot, write_gene_reference_snapshot
 from reference_data.models import GeneInfo
+from settings import GENE_REFERENCE_SNAPSHOT_PATH
+from seqr.utils.redis_utils import safe_redis_get_json, safe_redis_set_json, safe_redis_mget_json, \
+    safe_redis_mset_json
 from seqr.utils.xpos_utils import get_xpos
 from seqr.views.utils.orm_to_json_utils import get_json_for_genes, get_json_for_gene
 
+# Gene annotations only change when reference data is reloaded, so the json for each gene and set of requested
+# annotations is cached in each process and in redis for the current reference data version. Reloading reference data
+# changes the version, which invalidates the cached genes in all processes
+REFERENCE_DATA_VERSION_KEY = 'reference_data__version'
+GENE_JSON_CACHE_SIZE = 20000
+GENE_JSON_CACHE_EXPIRE = timedelta(weeks=2)
+GENE_JSON_CACHE = OrderedDict()
+GENE_JSON_CACHE_LOCK = Lock()
+# Gene notes are user specific and may change at any time, so are never cached
+UNCACHED_GENE_JSON_OPTIONS = ['user', 'add_notes']
+
 
 def get_gene(gene_id, user):
     gene = GeneInfo.objects.get(gene_id=gene_id)
@@ -17,14 +36,113 @@ def get_gene(gene_id, user):
 
 
 def get_genes(gene_ids, **kwargs):
+    if gene_ids is None or any(kwargs.get(option) for option in UNCACHED_GENE_JSON_OPTIONS):
+        return _load_genes(gene_ids, **kwargs)
+
+    version = _get_reference_data_version()
+    if version is None:
+        return _load_genes(gene_ids, **kwargs)
+
+    annotations = ','.join(sorted(option for option, value in kwargs.items() if value))
+    cache_keys = {
+        gene_id: 'gene_json__{}__{}__{}'.format(version, annotations, gene_id) for gene_id in set(gene_ids)
+    }
+
+    genes = {}
+    with GENE_JSON_CACHE_LOCK:
+        for gene_id, cache_key in cache_keys.items():
+            gene = GENE_JSON_CACHE.get(cache_key)
+            if gene is not None:
+                GENE_JSON_CACHE.move_to_end(cache_key)
+                genes[gene_id] = gene
+
+    new_cached_genes = safe_redis_mget_json(
+        [cache_key for gene_id, cache_key in cache_keys.items() if gene_id not in genes])
+    missing_gene_ids = [
+        gene_id for gene_id, cache_key in cache_keys.items()
+        if gene_id not in genes and cache_key not in new_cached_genes
+    ]
+    if missing_gene_ids:
+        loaded_genes = {
+            cache_keys[gene_id]: gene for gene_id, gene in _load_genes(missing_gene_ids, **kwargs).items()
+        }
+        safe_redis_mset_json(loaded_genes, expire=GENE_JSON_CACHE_EXPIRE)
+        new_cached_genes.update(loaded_genes)
+
+    with GENE_JSON_CACHE_LOCK:
+        for cache_key, gene in new_cached_genes.items():
+            GENE_JSON_CACHE[cache_key] = gene
+            GENE_JSON_CACHE.move_to_end(cache_key)
+        while len(GENE_JSON_CACHE) > GENE_JSON_CACHE_SIZE:
+            GENE_JSON_CACHE.popitem(last=False)
+
+    genes.update({gene['geneId']: gene for gene in new_cached_genes.values()})
+    # Callers may add request specific fields to the returned genes, so the cached json is never returned directly
+    return {gene_id: deepcopy(gene) for gene_id, gene in genes.items()}
+
+
+def reset_cached_genes():
+    """Invalidates the cached gene json in all processes. Should be called whenever reference data is reloaded"""
+    safe_redis_set_json(REFERENCE_DATA_VERSION_KEY, uuid.uuid4().hex)
+
+
+def update_gene_reference_snapshot():
+    """
+    Rebuilds the gene reference snapshot for the current reference data version, if one is configured. Should be called
+    after the cached genes are reset whenever reference data is reloaded, as snapshots for other versions are not used
+    """
+    if GENE_REFERENCE_SNAPSHOT_PATH:
+        write_gene_reference_snapshot(GENE_REFERENCE_SNAPSHOT_PATH, _get_reference_data_version())
+
+
+def handle_reference_data_updated(**kwargs):
+    """Receives the reference_data_updated signal, which is sent whenever reference data is reloaded"""
+    reset_cached_genes()
+    update_gene_reference_snapshot()
+
+
+def _get_reference_data_version():
+    version = safe_redis_get_json(REFERENCE_DATA_VERSION_KEY)
+    if version is None:
+        # If the version can not be shared through redis, cached genes could not be invalidated in other processes
+        reset_cached_genes()
+        version = safe_redis_get_json(REFERENCE_DATA_VERSION_KEY)
+    return version
+
+
+def _get_gene_reference_snapshot():
+    snapshot = get_gene_reference_snapshot(GENE_REFERENCE_SNAPSHOT_PATH)
+    if not snapshot or not snapshot.reference_data_version:
+        return None
+    if snapshot.reference_data_version != safe_redis_get_json(REFERENCE_DATA_VERSION_KEY):
+        # Genes are looked up in the database if the snapshot may not match the current reference data
+        return None
+    return snapshot
+
+
+def _load_genes(gene_ids, **kwargs):
     gene_filter = {}
     if gene_ids is not None:
+        snapshot = _get_gene_reference_snapshot()
+        if snapshot:
+            gene_ids = [gene_id for gene_id in gene_ids if snapshot.has_gene(gene_id)]
+            if not gene_ids:
+                return {}
         gene_filter['gene_id__in'] = gene_ids
     genes = GeneInfo.objects.filter(**gene_filter)
     return {gene['geneId']: gene for gene in get_json_for_genes(genes, **kwargs)}
 
 
 def get_gene_ids_for_gene_symbols(gene_symbols):
+    snapshot = _get_gene_reference_snapshot()
+    if snapshot:
+        symbols_to_ids = defaultdict(list)
+        for gene_symbol in gene_symbols:
+            gene_ids = snapshot.get_gene_ids_for_symbol(gene_symbol)
+            if gene_ids:
+                symbols_to_ids[gene_symbol] = gene_ids
+        return symbols_to_ids
+
     genes = GeneInfo.objects.filter(gene_symbol__in=gene_symbols).only('gene_symbol', 'gene_id').order_by('-gencode_release')
     symbols_to_ids = defaultdict(list)
     for gene in genes:
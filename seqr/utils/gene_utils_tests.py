@@ -0,0 +1,123 @@
+import json
+import mock
+import os
+import shutil
+import tempfile
+from django.test import TestCase
+
+from reference_data.gene_reference_snapshot import get_gene_reference_snapshot
+from reference_data.models import GeneInfo
+from reference_data.signals import reference_data_updated
+from seqr.utils.gene_utils import get_gene_ids_for_gene_symbols, get_genes, reset_cached_genes, \
+    update_gene_reference_snapshot
+
+GENE_ID = 'ENSG00000223972'
+GENE_IDS = [GENE_ID, 'ENSG00000227232']
+
+REDIS_CACHE = {}
+def _set_cache(k, v, ex=None):
+    REDIS_CACHE[k] = v
+MOCK_REDIS = mock.MagicMock()
+MOCK_REDIS.get.side_effect = lambda k: REDIS_CACHE.get(k)
+MOCK_REDIS.set.side_effect = _set_cache
+MOCK_REDIS.mget.side_effect = lambda keys: [REDIS_CACHE.get(k) for k in keys]
+MOCK_REDIS.pipeline.return_value.set.side_effect = _set_cache
+
+
+@mock.patch.dict('seqr.utils.gene_utils.GENE_JSON_CACHE', clear=True)
+@mock.patch('seqr.utils.redis_utils.redis.StrictRedis', lambda **kwargs: MOCK_REDIS)
+class GeneUtilsTest(TestCase):
+    databases = '__all__'
+    fixtures = ['users', 'reference_data']
+
+    def setUp(self):
+        REDIS_CACHE.clear()
+
+    def test_get_cached_genes(self):
+        with self.assertNumQueries(6, using='reference_data'):
+            genes = get_genes(GENE_IDS, add_dbnsfp=True, add_omim=True, add_constraints=True, add_primate_ai=True)
+        self.assertSetEqual(set(genes.keys()), set(GENE_IDS))
+        gene = genes[GENE_ID]
+        self.assertEqual(gene['geneSymbol'], 'DDX11L1')
+        self.assertTrue({'constraints', 'omimPhenotypes', 'mimNumber', 'primateAi'}.issubset(gene.keys()))
+
+        version = json.loads(REDIS_CACHE['reference_data__version'])
+        cache_key = 'gene_json__{}__add_constraints,add_dbnsfp,add_omim,add_primate_ai__{}'.format(version, GENE_ID)
+        self.assertDictEqual(json.loads(REDIS_CACHE[cache_key]), gene)
+
+        # Test cached genes are returned without querying the database, and changes to returned genes are not cached
+        gene['locusListGuids'] = []
+        with self.assertNumQueries(0, using='reference_data'):
+            cached_genes = get_genes(
+                GENE_IDS, add_dbnsfp=True, add_omim=True, add_constraints=True, add_primate_ai=True)
+        self.assertNotIn('locusListGuids', cached_genes[GENE_ID])
+        del gene['locusListGuids']
+        self.assertDictEqual(cached_genes, genes)
+
+        # Test only uncached genes are loaded
+        with self.assertNumQueries(6, using='reference_data'):
+            genes = get_genes(
+                GENE_IDS + ['ENSG00000135953'], add_dbnsfp=True, add_omim=True, add_constraints=True,
+                add_primate_ai=True)
+        self.assertSetEqual(set(genes.keys()), set(GENE_IDS + ['ENSG00000135953']))
+
+        # Test genes are cached separately for different annotations
+        with self.assertNumQueries(2, using='reference_data'):
+            genes = get_genes(GENE_IDS)
+        self.assertNotIn('constraints', genes[GENE_ID])
+
+        # Test genes cached by other processes are loaded from redis
+        with mock.patch.dict('seqr.utils.gene_utils.GENE_JSON_CACHE', clear=True):
+            with self.assertNumQueries(0, using='reference_data'):
+                self.assertDictEqual(get_genes(GENE_IDS), genes)
+
+        # Test resetting the cache
+        reset_cached_genes()
+        with self.assertNumQueries(2, using='reference_data'):
+            self.assertDictEqual(get_genes(GENE_IDS), genes)
+
+        # Test gene notes are not cached
+        with self.assertNumQueries(2, using='reference_data'):
+            genes = get_genes(GENE_IDS, add_notes=True)
+        self.assertListEqual(genes[GENE_ID]['notes'], [])
+
+    @mock.patch.dict('reference_data.gene_reference_snapshot.SNAPSHOTS', clear=True)
+    def test_get_genes_with_snapshot(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.snapshot_path = os.path.join(temp_dir, 'genes.snapshot')
+
+        with mock.patch('seqr.utils.gene_utils.GENE_REFERENCE_SNAPSHOT_PATH', self.snapshot_path):
+            # Reloading reference data resets the cached genes and rebuilds the snapshot
+            reference_data_updated.send(sender=None)
+            self.assertEqual(
+                get_gene_reference_snapshot(self.snapshot_path).reference_data_version,
+                json.loads(REDIS_CACHE['reference_data__version']),
+            )
+
+            with self.assertNumQueries(0, using='reference_data'):
+                symbols_to_ids = get_gene_ids_for_gene_symbols(['DDX11L1', 'WASH7P', 'FOO'])
+            self.assertDictEqual(
+                dict(symbols_to_ids), {'DDX11L1': ['ENSG00000223972'], 'WASH7P': ['ENSG00000227232']})
+
+            with self.assertNumQueries(0, using='reference_data'):
+                self.assertDictEqual(get_genes(['ENSG00000000000']), {})
+
+            # Test the database is used once the reference data has changed and before the snapshot is rebuilt
+            GeneInfo.objects.filter(gene_id='ENSG00000227232').update(gene_symbol='WASH7P_UPDATED')
+            reset_cached_genes()
+            with self.assertNumQueries(1, using='reference_data'):
+                symbols_to_ids = get_gene_ids_for_gene_symbols(['DDX11L1', 'WASH7P', 'WASH7P_UPDATED'])
+            self.assertDictEqual(
+                dict(symbols_to_ids), {'DDX11L1': ['ENSG00000223972'], 'WASH7P_UPDATED': ['ENSG00000227232']})
+
+            update_gene_reference_snapshot()
+            with self.assertNumQueries(0, using='reference_data'):
+                symbols_to_ids = get_gene_ids_for_gene_symbols(['WASH7P', 'WASH7P_UPDATED'])
+            self.assertDictEqual(dict(symbols_to_ids), {'WASH7P_UPDATED': ['ENSG00000227232']})
+
+            # Test the database is used if the reference data version is unavailable
+            del REDIS_CACHE['reference_data__version']
+            with self.assertNumQueries(1, using='reference_data'):
+                symbols_to_ids = get_gene_ids_for_gene_symbols(['WASH7P_UPDATED'])
+            self.assertDictEqual(dict(symbols_to_ids), {'WASH7P_UPDATED': ['ENSG00000227232']})
@@ -0,0 +1,76 @@
+from functools import lru_cache, partial
+import logging
+import time
+from pyliftover.liftover import LiftOver
+
+from reference_data.models import GENOME_VERSION_GRCh37, GENOME_VERSION_GRCh38
+
+logger = logging.getLogger(__name__)
+
+LIFTOVER_CHAINS = {
+    GENOME_VERSION_GRCh37: ('hg19', 'hg38'),
+    GENOME_VERSION_GRCh38: ('hg38', 'hg19'),
+}
+LIFTED_GENOME_VERSIONS = {
+    GENOME_VERSION_GRCh37: GENOME_VERSION_GRCh38,
+    GENOME_VERSION_GRCh38: GENOME_VERSION_GRCh37,
+}
+LIFTOVER_CACHE_SIZE = 100000
+
+LIFTOVER_RETRY_SECONDS = 600
+
+# Chain files are loaded once per process for each source genome version, and lifted positions are cached separately
+# for each genome version. Loading a chain file may download it, so failed loads are only retried after a backoff
+LIFTOVERS = {}
+LIFTOVER_LOAD_FAILURES = {}
+
+
+def _get_liftover(genome_version):
+    """
+    :return: a function which lifts a (chrom, pos) from the given genome version, or None if liftover is unavailable
+    """
+    if not LIFTOVERS.get(genome_version):
+        if LIFTOVER_LOAD_FAILURES.get(genome_version, 0) > time.monotonic():
+            return None
+        try:
+            liftover = LiftOver(*LIFTOVER_CHAINS[genome_version])
+        except Exception as e:
+            logger.error('ERROR: Unable to set up liftover. {}'.format(e))
+            LIFTOVER_LOAD_FAILURES[genome_version] = time.monotonic() + LIFTOVER_RETRY_SECONDS
+            return None
+        LIFTOVER_LOAD_FAILURES.pop(genome_version, None)
+        LIFTOVERS[genome_version] = lru_cache(maxsize=LIFTOVER_CACHE_SIZE)(partial(_lift_position, liftover))
+    return LIFTOVERS[genome_version]
+
+
+def _lift_position(liftover, chrom, pos):
+    lifted_coord = liftover.convert_coordinate('chr{}'.format(chrom), pos)
+    if lifted_coord and lifted_coord[0]:
+        return lifted_coord[0][0].lstrip('chr'), lifted_coord[0][1]
+    return None
+
+
+def liftover_position(genome_version, chrom, pos):
+    """
+    Lifts a position from the given genome version to the other supported genome version
+    :return: the lifted (chrom, pos), or None if the position can not be lifted or liftover is unavailable
+    """
+    lift_position = _get_liftover(genome_version)
+    if not lift_position:
+        return None
+    return lift_position(chrom.lstrip('chr'), int(pos))
+
+
+def liftover_positions(genome_version, positions):
+    """
+    Lifts a batch of (chrom, pos) positions. Positions are deduplicated and lifted in sorted order, so lookups in the
+    chain file's per-contig interval index are localized and repeated positions are only lifted once
+    :return: a dict mapping each position to its lifted (chrom, pos), or to None if it can not be lifted. Returns None
+    if liftover is unavailable
+    """
+    lift_position = _get_liftover(genome_version)
+    if not lift_position:
+        return None
+    sorted_positions = sorted({(chrom.lstrip('chr'), int(pos)) for chrom, pos in positions})
+    lifted_positions = {position: lift_position(*position) for position in sorted_positions}
+    return {(chrom, pos): lifted_positions[(chrom.lstrip('chr'), int(pos))] for chrom, pos in positions}
@@ -0,0 +1,81 @@
+import mock
+from unittest import TestCase
+from seqr.utils.liftover_utils import liftover_position, liftover_positions, LIFTOVERS
+
+
+def _mock_convert_coordinate(chrom, pos):
+    if pos > 1000:
+        return []
+    return [(chrom, pos + 10, '+', 1)]
+
+
+@mock.patch.dict('seqr.utils.liftover_utils.LIFTOVERS', clear=True)
+@mock.patch.dict('seqr.utils.liftover_utils.LIFTOVER_LOAD_FAILURES', clear=True)
+@mock.patch('seqr.utils.liftover_utils.LiftOver')
+class LiftoverUtilsTest(TestCase):
+
+    def test_liftover_position(self, mock_liftover):
+        mock_liftover.return_value.convert_coordinate.side_effect = _mock_convert_coordinate
+
+        self.assertTupleEqual(liftover_position('37', 'chr1', 100), ('1', 110))
+        self.assertTupleEqual(liftover_position('37', '1', '100'), ('1', 110))
+        self.assertIsNone(liftover_position('37', 'X', 2000))
+        mock_liftover.assert_called_once_with('hg19', 'hg38')
+        mock_liftover.return_value.convert_coordinate.assert_has_calls([
+            mock.call('chr1', 100), mock.call('chrX', 2000),
+        ])
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 2)
+
+        self.assertTupleEqual(liftover_position('38', '2', 100), ('2', 110))
+        mock_liftover.assert_called_with('hg38', 'hg19')
+
+        # Loading a genome version does not reset the lifted positions cached for the other genome version
+        self.assertTupleEqual(liftover_position('37', '1', 100), ('1', 110))
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 3)
+
+        # Reloading a genome version resets its cached lifted positions
+        LIFTOVERS.pop('37')
+        self.assertTupleEqual(liftover_position('37', '1', 100), ('1', 110))
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 4)
+
+    def test_liftover_positions(self, mock_liftover):
+        mock_liftover.return_value.convert_coordinate.side_effect = _mock_convert_coordinate
+
+        self.assertDictEqual(liftover_positions('37', [('2', 5), ('chr1', 100), ('1', '100'), ('1', 2000)]), {
+            ('2', 5): ('2', 15),
+            ('chr1', 100): ('1', 110),
+            ('1', '100'): ('1', 110),
+            ('1', 2000): None,
+        })
+        mock_liftover.return_value.convert_coordinate.assert_has_calls([
+            mock.call('chr1', 100), mock.call('chr1', 2000), mock.call('chr2', 5),
+        ])
+        self.assertEqual(mock_liftover.return_value.convert_coordinate.call_count, 3)
+
+        mock_liftover.side_effect = Exception('Unable to load chain file')
+        self.assertIsNone(liftover_positions('38', [('1', 100)]))
+        self.assertIsNone(liftover_position('38', '1', 100))
+
+    @mock.patch('seqr.utils.liftover_utils.time')
+    def test_liftover_load_failure(self, mock_time, mock_liftover):
+        mock_time.monotonic.return_value = 1000
+        mock_liftover.side_effect = Exception('Unable to load chain file')
+        self.assertIsNone(liftover_position('37', '1', 100))
+        mock_liftover.assert_called_once_with('hg19', 'hg38')
+
+        # Failed loads are not retried until the backoff has passed
+        mock_liftover.reset_mock()
+        mock_liftover.side_effect = None
+        mock_liftover.return_value.convert_coordinate.side_effect = _mock_convert_coordinate
+        mock_time.monotonic.return_value = 1599
+        self.assertIsNone(liftover_position('37', '1', 100))
+        self.assertIsNone(liftover_positions('37', [('1', 100)]))
+        mock_liftover.assert_not_called()
+
+        # Other genome versions are still loaded
+        self.assertTupleEqual(liftover_position('38', '1', 100), ('1', 110))
+        mock_liftover.assert_called_once_with('hg38', 'hg19')
+
+        mock_time.monotonic.return_value = 1601
+        self.assertTupleEqual(liftover_position('37', '1', 100), ('1', 110))
+        mock_liftover.assert_called_with('hg19', 'hg38')
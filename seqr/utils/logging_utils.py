@@ -22,6 +22,9 @@ class JsonLogFormatter(logging.Formatter):
         if hasattr(record, 'db_update'):
             log_json['dbUpdate'] = record.db_update
 
+        if hasattr(record, 'search_profile'):
+            log_json['searchProfile'] = record.search_profile
+
         if hasattr(record, 'traceback'):
             log_json['traceback'] = record.traceback
 
@@ -7,7 +7,7 @@ import json
 import logging
 import traceback
 
-from seqr.utils.elasticsearch.utils import InvalidIndexException, InvalidSearchException
+from seqr.utils.elasticsearch.utils import InvalidIndexException, InvalidSearchException, SearchLoadingException
 from seqr.views.utils.json_utils import create_json_response
 from seqr.views.utils.terra_api_utils import TerraAPIException
 from settings import DEBUG
@@ -20,6 +20,7 @@ EXCEPTION_ERROR_MAP = {
     ObjectDoesNotExist: 404,
     InvalidIndexException: 400,
     InvalidSearchException: 400,
+    SearchLoadingException: 409,
     elasticsearch.exceptions.ConnectionError: 504,
     elasticsearch.exceptions.TransportError: lambda e: int(e.status_code) if e.status_code != 'N/A' else 400,
     HTTPError: lambda e: int(e.response.status_code),
@@ -1,19 +1,58 @@
 import json
 import logging
 import redis
+import zlib
 
 from settings import REDIS_SERVICE_HOSTNAME
 
 logger = logging.getLogger(__name__)
 
+REDIS_CONNECTION_POOL = redis.ConnectionPool(host=REDIS_SERVICE_HOSTNAME, socket_connect_timeout=3)
+
+# Large values are compressed before caching. Encoded values are prefixed with a versioned codec tag, which is never
+# valid json, so values written as plain json (small values, or values cached before a codec existed) still decode
+ZLIB_JSON_CODEC = b'\x00zlib-json-v1:'
+CACHE_CODECS = {
+    ZLIB_JSON_CODEC: {
+        'encode': lambda json_value: zlib.compress(json_value.encode('utf-8'), 1),
+        'decode': lambda value: json.loads(zlib.decompress(value)),
+    },
+}
+CACHE_CODEC = ZLIB_JSON_CODEC
+COMPRESSION_THRESHOLD_BYTES = 10 * 1024
+REDIS_DELETE_BATCH_SIZE = 500
+
+
+def _get_redis_client():
+    # Clients are cheap to create, but share a process-wide pool so connections are reused across calls
+    return redis.StrictRedis(connection_pool=REDIS_CONNECTION_POOL)
+
+
+def _encode_value(value):
+    json_value = json.dumps(value)
+    if CACHE_CODEC and len(json_value) > COMPRESSION_THRESHOLD_BYTES:
+        return CACHE_CODEC + CACHE_CODECS[CACHE_CODEC]['encode'](json_value)
+    return json_value
+
+
+def _decode_value(value):
+    if isinstance(value, bytes):
+        for codec_tag, codec in CACHE_CODECS.items():
+            if value.startswith(codec_tag):
+                try:
+                    return codec['decode'](value[len(codec_tag):])
+                except zlib.error as e:
+                    raise ValueError(str(e))
+    return json.loads(value)
+
 
 def safe_redis_get_json(cache_key):
     try:
-        redis_client = redis.StrictRedis(host=REDIS_SERVICE_HOSTNAME, socket_connect_timeout=3)
+        redis_client = _get_redis_client()
         value = redis_client.get(cache_key)
         if value:
             logger.info('Loaded {} from redis'.format(cache_key))
-            return json.loads(value)
+            return _decode_value(value)
     except ValueError as e:
         logger.warning('Unable to fetch "{}" from redis:\t{}'.format(cache_key, str(e)))
     except Exception as e:
@@ -21,11 +60,87 @@ def safe_redis_get_json(cache_key):
     return None
 
 
+def safe_redis_mget_json(cache_keys):
+    """Fetches multiple keys in a single round trip. Returns a dict of the parsed value for each key with a valid value"""
+    if not cache_keys:
+        return {}
+
+    try:
+        redis_client = _get_redis_client()
+        values = redis_client.mget(cache_keys)
+    except Exception as e:
+        logger.error('Unable to connect to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+        return {}
+
+    results = {}
+    for cache_key, value in zip(cache_keys, values):
+        if value:
+            try:
+                results[cache_key] = _decode_value(value)
+            except ValueError as e:
+                logger.warning('Unable to fetch "{}" from redis:\t{}'.format(cache_key, str(e)))
+    if results:
+        logger.info('Loaded {} from redis'.format(', '.join(results.keys())))
+    return results
+
+
 def safe_redis_set_json(cache_key, value, expire=None):
     try:
-        redis_client = redis.StrictRedis(host=REDIS_SERVICE_HOSTNAME, socket_connect_timeout=3)
-        redis_client.set(cache_key, json.dumps(value))
-        if expire:
-            redis_client.expire(cache_key, expire)
+        redis_client = _get_redis_client()
+        redis_client.set(cache_key, _encode_value(value), ex=expire)
+    except Exception as e:
+        logger.error('Unable to write to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+
+
+def safe_redis_mset_json(values_by_key, expire=None):
+    """Writes multiple keys in a single atomic round trip"""
+    if not values_by_key:
+        return
+
+    try:
+        pipeline = _get_redis_client().pipeline()
+        for cache_key, value in values_by_key.items():
+            pipeline.set(cache_key, _encode_value(value), ex=expire)
+        pipeline.execute()
+    except Exception as e:
+        logger.error('Unable to write to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+
+
+def safe_redis_set_json_if_missing(cache_key, value, expire=None):
+    """Writes the key only if it is not already set. Returns whether it was written, or None if redis is unavailable"""
+    try:
+        redis_client = _get_redis_client()
+        return bool(redis_client.set(cache_key, _encode_value(value), ex=expire, nx=True))
+    except Exception as e:
+        logger.error('Unable to write to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+    return None
+
+
+def safe_redis_delete(cache_key):
+    try:
+        redis_client = _get_redis_client()
+        redis_client.delete(cache_key)
+    except Exception as e:
+        logger.error('Unable to write to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+
+
+def safe_redis_delete_matching(pattern):
+    """
+    Deletes all keys matching the given glob-style pattern. Keys are found with SCAN rather than KEYS, which blocks redis
+    while it checks every key, and are deleted in batches. Returns the number of deleted keys
+    """
+    deleted = 0
+    try:
+        redis_client = _get_redis_client()
+        keys = []
+        for key in redis_client.scan_iter(match=pattern):
+            keys.append(key)
+            if len(keys) >= REDIS_DELETE_BATCH_SIZE:
+                deleted += redis_client.delete(*keys)
+                keys = []
+        if keys:
+            deleted += redis_client.delete(*keys)
+        return deleted
     except Exception as e:
         logger.error('Unable to write to redis host {}: {}'.format(REDIS_SERVICE_HOSTNAME, str(e)))
+    return 0
@@ -1,7 +1,10 @@
 import json
 import mock
+import zlib
 from unittest import TestCase
-from seqr.utils.redis_utils import safe_redis_set_json, safe_redis_get_json
+from seqr.utils.redis_utils import safe_redis_set_json, safe_redis_get_json, safe_redis_mget_json, \
+    safe_redis_mset_json, safe_redis_set_json_if_missing, safe_redis_delete, \
+    safe_redis_delete_matching
 
 
 @mock.patch('seqr.utils.redis_utils.logger')
@@ -39,19 +42,123 @@ class RedisUtilsTest(TestCase):
         mock_logger.warning.assert_not_called()
         mock_logger.error.assert_called_with('Unable to connect to redis host localhost: invalid redis')
 
+    def test_compressed_safe_redis_get_json(self, mock_redis, mock_logger):
+        large_value = {'test_key': ['test'] * 5000}
+        mock_redis.return_value.get.side_effect = lambda key: b'\x00zlib-json-v1:' + zlib.compress(
+            json.dumps(large_value).encode('utf-8'))
+        self.assertDictEqual(safe_redis_get_json('test_key'), large_value)
+        mock_logger.warning.assert_not_called()
+
+        # test with corrupted compressed value
+        mock_redis.return_value.get.side_effect = lambda key: b'\x00zlib-json-v1:invalid'
+        self.assertIsNone(safe_redis_get_json('test_key'))
+        self.assertEqual(mock_logger.warning.call_args.args[0].split('\t')[0], 'Unable to fetch "test_key" from redis:')
+        mock_logger.error.assert_not_called()
+
+    def test_safe_redis_mget_json(self, mock_redis, mock_logger):
+        self.assertDictEqual(safe_redis_mget_json([]), {})
+        mock_redis.assert_not_called()
+
+        mock_redis.return_value.mget.side_effect = lambda keys: [json.dumps({'a': 1}), None, 'invalid']
+        self.assertDictEqual(safe_redis_mget_json(['key_1', 'key_2', 'key_3']), {'key_1': {'a': 1}})
+        mock_redis.return_value.mget.assert_called_with(['key_1', 'key_2', 'key_3'])
+        mock_logger.info.assert_called_with('Loaded key_1 from redis')
+        self.assertEqual(mock_logger.warning.call_args.args[0].split('\t')[0], 'Unable to fetch "key_3" from redis:')
+        mock_logger.error.assert_not_called()
+
+        # test with redis connection error
+        mock_logger.reset_mock()
+        mock_redis.side_effect = Exception('invalid redis')
+        self.assertDictEqual(safe_redis_mget_json(['key_1']), {})
+        mock_logger.info.assert_not_called()
+        mock_logger.error.assert_called_with('Unable to connect to redis host localhost: invalid redis')
+
     def test_safe_redis_set_json(self, mock_redis, mock_logger):
         safe_redis_set_json('test_key', {'a': 1})
-        mock_redis.return_value.set.assert_called_with('test_key', '{"a": 1}')
+        mock_redis.return_value.set.assert_called_with('test_key', '{"a": 1}', ex=None)
         mock_redis.return_value.expire.assert_not_called()
         mock_logger.error.assert_not_called()
 
         safe_redis_set_json('test_key', {'a': 1}, expire=100)
-        mock_redis.return_value.set.assert_called_with('test_key', '{"a": 1}')
-        mock_redis.return_value.expire.assert_called_with('test_key', 100)
+        mock_redis.return_value.set.assert_called_with('test_key', '{"a": 1}', ex=100)
+        mock_redis.return_value.expire.assert_not_called()
         mock_logger.error.assert_not_called()
 
+        # test large values are compressed
+        large_value = {'a': list(range(5000))}
+        safe_redis_set_json('test_key', large_value)
+        encoded_value = mock_redis.return_value.set.call_args.args[1]
+        self.assertTrue(encoded_value.startswith(b'\x00zlib-json-v1:'))
+        self.assertLess(len(encoded_value), len(json.dumps(large_value)))
+        mock_redis.return_value.get.side_effect = lambda key: encoded_value
+        self.assertDictEqual(safe_redis_get_json('test_key'), large_value)
+
         # test with redis connection error
         mock_logger.reset_mock()
         mock_redis.side_effect = Exception('invalid redis')
         safe_redis_set_json('test_key', {'a': 1})
         mock_logger.error.assert_called_with('Unable to write to redis host localhost: invalid redis')
+
+    def test_safe_redis_mset_json(self, mock_redis, mock_logger):
+        safe_redis_mset_json({})
+        mock_redis.assert_not_called()
+
+        safe_redis_mset_json({'key_1': {'a': 1}, 'key_2': [1]}, expire=100)
+        mock_pipeline = mock_redis.return_value.pipeline.return_value
+        mock_pipeline.set.assert_has_calls([
+            mock.call('key_1', '{"a": 1}', ex=100), mock.call('key_2', '[1]', ex=100),
+        ])
+        mock_pipeline.execute.assert_called_once()
+        mock_redis.return_value.set.assert_not_called()
+        mock_logger.error.assert_not_called()
+
+        # test with redis connection error
+        mock_redis.side_effect = Exception('invalid redis')
+        safe_redis_mset_json({'key_1': {'a': 1}})
+        mock_logger.error.assert_called_with('Unable to write to redis host localhost: invalid redis')
+
+    def test_safe_redis_set_json_if_missing(self, mock_redis, mock_logger):
+        mock_redis.return_value.set.return_value = True
+        self.assertTrue(safe_redis_set_json_if_missing('test_key', 'abc', expire=100))
+        mock_redis.return_value.set.assert_called_with('test_key', '"abc"', ex=100, nx=True)
+
+        mock_redis.return_value.set.return_value = None
+        self.assertFalse(safe_redis_set_json_if_missing('test_key', 'abc'))
+        mock_redis.return_value.set.assert_called_with('test_key', '"abc"', ex=None, nx=True)
+        mock_logger.error.assert_not_called()
+
+        # test with redis connection error
+        mock_redis.side_effect = Exception('invalid redis')
+        self.assertIsNone(safe_redis_set_json_if_missing('test_key', 'abc'))
+        mock_logger.error.assert_called_with('Unable to write to redis host localhost: invalid redis')
+
+    def test_safe_redis_delete(self, mock_redis, mock_logger):
+        safe_redis_delete('test_key')
+        mock_redis.return_value.delete.assert_called_with('test_key')
+        mock_logger.error.assert_not_called()
+
+        # test with redis connection error
+        mock_redis.side_effect = Exception('invalid redis')
+        safe_redis_delete('test_key')
+        mock_logger.error.assert_called_with('Unable to write to redis host localhost: invalid redis')
+
+    @mock.patch('seqr.utils.redis_utils.REDIS_DELETE_BATCH_SIZE', 2)
+    def test_safe_redis_delete_matching(self, mock_redis, mock_logger):
+        mock_redis.return_value.scan_iter.return_value = iter([])
+        self.assertEqual(safe_redis_delete_matching('test_key*'), 0)
+        mock_redis.return_value.scan_iter.assert_called_with(match='test_key*')
+        mock_redis.return_value.delete.assert_not_called()
+        mock_redis.return_value.keys.assert_not_called()
+
+        mock_redis.return_value.scan_iter.return_value = iter([b'test_key', b'test_key__chunk_0', b'test_key__chunk_1'])
+        mock_redis.return_value.delete.side_effect = lambda *keys: len(keys)
+        self.assertEqual(safe_redis_delete_matching('test_key*'), 3)
+        self.assertListEqual(mock_redis.return_value.delete.call_args_list, [
+            mock.call(b'test_key', b'test_key__chunk_0'), mock.call(b'test_key__chunk_1'),
+        ])
+        mock_logger.error.assert_not_called()
+
+        # test with redis connection error
+        mock_redis.side_effect = Exception('invalid redis')
+        self.assertEqual(safe_redis_delete_matching('test_key*'), 0)
+        mock_logger.error.assert_called_with('Unable to write to redis host localhost: invalid redis')
@@ -245,6 +245,7 @@ SAMPLE_SV_QC_DATA = [
 class DataManagerAPITest(AuthenticationTestCase):
     fixtures = ['users', '1kg_project', 'reference_data']
 
+    @mock.patch('seqr.utils.elasticsearch.utils.ES_CLIENTS', {})
     @urllib3_responses.activate
     def test_elasticsearch_status(self):
         url = reverse(elasticsearch_status)
@@ -260,7 +261,8 @@ class DataManagerAPITest(AuthenticationTestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
         response_json = response.json()
-        self.assertSetEqual(set(response_json.keys()), {'indices', 'errors', 'diskStats', 'elasticsearchHost'})
+        self.assertSetEqual(
+            set(response_json.keys()), {'indices', 'errors', 'diskStats', 'elasticsearchHost', 'connectionPoolStats'})
 
         self.assertEqual(len(response_json['indices']), 5)
         self.assertDictEqual(response_json['indices'][0], TEST_INDEX_EXPECTED_DICT)
@@ -271,6 +273,11 @@ class DataManagerAPITest(AuthenticationTestCase):
 
         self.assertListEqual(response_json['diskStats'], EXPECTED_DISK_ALLOCATION)
 
+        self.assertEqual(len(response_json['connectionPoolStats']), 1)
+        self.assertDictEqual(response_json['connectionPoolStats'][0], {
+            'host': 'http://localhost:9200', 'timeout': 60, 'options': {}, 'openConnections': 0,
+            'createdConnections': 0, 'requests': 0, 'reuseRatio': None, 'waitSeconds': 0.0,
+        })
 
     @mock.patch('seqr.utils.file_utils.subprocess.Popen')
     def test_upload_qc_pipeline_output(self, mock_subprocess):
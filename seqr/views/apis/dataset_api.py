@@ -6,6 +6,8 @@ from django.db.models import prefetch_related_objects
 from django.utils import timezone
 
 from seqr.models import Individual, Sample, Family, IgvSample
+from seqr.utils.elasticsearch.index_metadata_cache import reset_index_metadata_cache
+from seqr.utils.elasticsearch.search_context_cache import reset_cached_search_context
 from seqr.views.utils.dataset_utils import match_sample_ids_to_sample_records, validate_index_metadata, \
     get_elasticsearch_index_samples, load_mapping_file, validate_alignment_dataset_path
 from seqr.views.utils.file_utils import save_uploaded_file
@@ -252,6 +254,9 @@ def _update_variant_samples(matched_sample_id_to_sample_record, user, elasticsea
 
     inactivate_sample_guids = Sample.bulk_update(user, {'is_active': False}, queryset=inactivate_samples)
 
+    reset_cached_search_context()
+    reset_index_metadata_cache()
+
     return inactivate_sample_guids
 
 
@@ -20,6 +20,9 @@ ADD_DATASET_PAYLOAD = json.dumps({'elasticsearchIndex': INDEX_NAME, 'datasetType
 
 class DatasetAPITest(object):
 
+    @mock.patch.dict('seqr.utils.elasticsearch.index_metadata_cache.INDEX_METADATA', clear=True)
+    @mock.patch.dict(
+        'seqr.utils.elasticsearch.index_metadata_cache.INDEX_METADATA_VERSION', {'version': None, 'checked': None})
     @mock.patch('seqr.utils.redis_utils.redis.StrictRedis')
     @mock.patch('seqr.views.utils.dataset_utils.random.randint')
     @mock.patch('seqr.utils.file_utils.open')
@@ -173,7 +176,10 @@ class DatasetAPITest(object):
         self.assertEqual(response.status_code, 200)
         mock_open.assert_called_with('mapping.csv', 'r')
         mock_redis.return_value.get.assert_called_with('index_metadata__test_index')
-        mock_redis.return_value.set.assert_not_called()
+        self.assertListEqual(mock_redis.return_value.set.call_args_list, [
+            mock.call('search_context__sample_load_version', mock.ANY, ex=None),
+            mock.call('index_metadata_cache__version', mock.ANY, ex=None),
+        ])
 
         response_json = response.json()
         self.assertSetEqual(set(response_json.keys()), {'samplesByGuid', 'individualsByGuid', 'familiesByGuid'})
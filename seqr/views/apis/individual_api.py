@@ -9,6 +9,7 @@ from django.contrib.auth.decorators import login_required
 
 from reference_data.models import HumanPhenotypeOntology
 from seqr.models import Individual, Family
+from seqr.utils.elasticsearch.search_context_cache import reset_cached_search_context
 from seqr.views.utils.file_utils import save_uploaded_file, load_uploaded_file
 from seqr.views.utils.json_to_orm_utils import update_individual_from_json, update_model_from_json
 from seqr.views.utils.json_utils import create_json_response
@@ -68,6 +69,7 @@ def update_individual_handler(request, individual_guid):
     request_json = json.loads(request.body)
 
     update_individual_from_json(individual, request_json, user=request.user, allow_unknown_keys=True)
+    reset_cached_search_context()
 
     return create_json_response({
         individual.guid: _get_json_for_individual(individual, request.user)
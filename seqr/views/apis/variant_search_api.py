@@ -6,16 +6,20 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import MultipleObjectsReturned
 from django.db.utils import IntegrityError
 from django.db.models import Q, prefetch_related_objects
+from django.db.models.expressions import RawSQL
 import logging
 
 from reference_data.models import GENOME_VERSION_GRCh37
 from seqr.models import Project, Family, Individual, SavedVariant, VariantSearch, VariantSearchResults, Sample, \
     IgvSample, AnalysisGroup, ProjectCategory, VariantTagType, LocusList
-from seqr.utils.elasticsearch.utils import get_es_variants, get_single_es_variant, get_es_variant_gene_counts
+from seqr.utils.elasticsearch.utils import get_es_variants, get_single_es_variant, get_es_variant_gene_counts, \
+    get_cached_es_variants, InvalidSearchException, SearchLoadingException
 from seqr.utils.elasticsearch.constants import XPOS_SORT_KEY, PATHOGENICTY_SORT_KEY, PATHOGENICTY_HGMD_SORT_KEY
+from seqr.utils.elasticsearch.search_profiler import SearchProfiler
+from seqr.utils.elasticsearch.search_jobs import submit_search_job, prefetch_search_page, get_search_job_status
 from seqr.utils.xpos_utils import get_xpos
 from seqr.views.apis.saved_variant_api import _add_locus_lists
-from seqr.views.utils.export_utils import export_table
+from seqr.views.utils.export_utils import export_table, export_table_stream
 from seqr.utils.gene_utils import get_genes
 from seqr.views.utils.json_utils import create_json_response
 from seqr.views.utils.json_to_orm_utils import update_model_from_json, get_or_create_model_from_json, \
@@ -50,6 +54,14 @@ GENOTYPE_AC_LOOKUP = {
 AFFECTED = Individual.AFFECTED_STATUS_AFFECTED
 UNAFFECTED = Individual.AFFECTED_STATUS_UNAFFECTED
 
+# Streamed exports are loaded from elasticsearch and written to the response one page at a time
+EXPORT_PAGE_SIZE = 500
+STREAMING_EXPORT_FORMATS = {'tsv', 'json'}
+
+# Analysts can request search timings with the "profile" query parameter, and can additionally request the elasticsearch
+# query profile with "profile=es"
+ES_PROFILE_PARAM = 'es'
+
 
 @login_required(login_url=API_LOGIN_REQUIRED_URL)
 def query_variants_handler(request, search_hash):
@@ -57,9 +69,7 @@ def query_variants_handler(request, search_hash):
     """
     page = int(request.GET.get('page') or 1)
     per_page = int(request.GET.get('per_page') or 100)
-    sort = request.GET.get('sort') or XPOS_SORT_KEY
-    if sort == PATHOGENICTY_SORT_KEY and user_is_analyst(request.user):
-        sort = PATHOGENICTY_HGMD_SORT_KEY
+    sort = _get_search_sort(request)
 
     search_context = json.loads(request.body or '{}')
     try:
@@ -70,8 +80,29 @@ def query_variants_handler(request, search_hash):
     _check_results_permission(results_model, request.user)
     is_all_project_search = _is_all_project_family_search(search_context)
 
-    variants, total_results = get_es_variants(results_model, sort=sort, page=page, num_results=per_page,
-                                              skip_genotype_filter=is_all_project_search)
+    variants = None
+    if request.GET.get('async') == 'true':
+        # Searches which have not already been loaded are run as a background job, and the job status is returned
+        # instead of the results. Once the job completes, requesting the same page again returns the loaded results
+        variants, total_results = get_cached_es_variants(results_model, sort=sort, page=page, num_results=per_page)
+        if variants is None:
+            return _search_job_response(
+                results_model, search_hash, sort, page, per_page, is_all_project_search)
+
+    profiler = None
+    if variants is None:
+        profile = request.GET.get('profile')
+        profiler = SearchProfiler(include_es_profile=profile == ES_PROFILE_PARAM) \
+            if profile and user_is_analyst(request.user) else None
+
+        try:
+            variants, total_results = get_es_variants(results_model, sort=sort, page=page, num_results=per_page,
+                                                      skip_genotype_filter=is_all_project_search, profiler=profiler)
+        except SearchLoadingException:
+            # If the search is already being loaded, such as by a prefetch job, the request does not wait for it.
+            # Instead, the page is loaded by a job once the search is loaded, and the job status is returned
+            return _search_job_response(
+                results_model, search_hash, sort, page, per_page, is_all_project_search)
 
     response_context = {}
     if is_all_project_search and len(variants) == total_results:
@@ -89,10 +120,34 @@ def query_variants_handler(request, search_hash):
     response['search'] = _get_search_context(results_model)
     response['search']['totalResults'] = total_results
     response.update(response_context)
+    if profiler:
+        response['searchProfile'] = profiler.to_json()
+
+    if request.GET.get('prefetch') == 'true':
+        # Load the following page in the background once the requested page is returned
+        prefetch_search_page(
+            results_model, total_results, sort=sort, page=page, num_results=per_page,
+            skip_genotype_filter=is_all_project_search)
 
     return create_json_response(response)
 
 
+def _search_job_response(results_model, search_hash, sort, page, per_page, is_all_project_search):
+    job_status = submit_search_job(
+        results_model, sort=sort, page=page, num_results=per_page, skip_genotype_filter=is_all_project_search)
+    return create_json_response({
+        'search': _get_search_context(results_model),
+        'searchJobStatus': {search_hash: job_status},
+    })
+
+
+def _get_search_sort(request):
+    sort = request.GET.get('sort') or XPOS_SORT_KEY
+    if sort == PATHOGENICTY_SORT_KEY and user_is_analyst(request.user):
+        sort = PATHOGENICTY_HGMD_SORT_KEY
+    return sort
+
+
 def _is_all_project_family_search(search_context):
     return bool(search_context and search_context.get('allProjectFamilies'))
 
@@ -244,6 +299,18 @@ VARIANT_SAMPLE_DATA = [
 ]
 
 
+@login_required(login_url=API_LOGIN_REQUIRED_URL)
+def get_variant_search_job_status(request, search_hash):
+    results_model = VariantSearchResults.objects.get(search_hash=search_hash)
+    _check_results_permission(results_model, request.user)
+
+    page = int(request.GET.get('page') or 1)
+    per_page = int(request.GET.get('per_page') or 100)
+    sort = _get_search_sort(request)
+    job_status = get_search_job_status(results_model, sort=sort, page=page, num_results=per_page)
+    return create_json_response({'searchJobStatus': {search_hash: job_status}})
+
+
 @login_required(login_url=API_LOGIN_REQUIRED_URL)
 def get_variant_gene_breakdown(request, search_hash):
     results_model = VariantSearchResults.objects.get(search_hash=search_hash)
@@ -265,14 +332,58 @@ def export_variants_handler(request, search_hash):
     families = results_model.families.all()
     family_ids_by_guid = {family.guid: family.family_id for family in families}
 
+    file_format = request.GET.get('file_format', 'tsv')
+    filename_prefix = 'search_results_{}'.format(search_hash)
+
+    if request.GET.get('stream') == 'true' and file_format in STREAMING_EXPORT_FORMATS:
+        # The number of family and sample columns is bounded by the searched families, so the header can be written
+        # before any variants are loaded
+        max_families_per_variant = len(family_ids_by_guid)
+        max_samples_per_variant = Individual.objects.filter(
+            family__in=families, sample__is_active=True).distinct().count()
+        header = _get_variant_export_header(max_families_per_variant, max_samples_per_variant)
+        # Load the first page before streaming begins so search errors are returned as an error response
+        first_page = get_es_variants(results_model, page=1, num_results=EXPORT_PAGE_SIZE)
+        rows = (
+            row for variants in _iter_export_variant_pages(results_model, *first_page)
+            for row in _get_variant_export_rows(
+                variants, families, family_ids_by_guid, max_families_per_variant, max_samples_per_variant)
+        )
+        return export_table_stream(filename_prefix, header, rows, file_format)
+
     variants, _ = get_es_variants(results_model, page=1, load_all=True)
     variants = _flatten_variants(variants)
 
-    json, variants_to_saved_variants = _get_saved_variants(variants, families)
-
     max_families_per_variant = max([len(variant['familyGuids']) for variant in variants])
     max_samples_per_variant = max([len(variant['genotypes']) for variant in variants])
 
+    rows = _get_variant_export_rows(
+        variants, families, family_ids_by_guid, max_families_per_variant, max_samples_per_variant)
+    header = _get_variant_export_header(max_families_per_variant, max_samples_per_variant)
+
+    return export_table(filename_prefix, header, rows, file_format, titlecase_header=False)
+
+
+def _iter_export_variant_pages(results_model, variants, total_results):
+    page = 1
+    while variants:
+        yield _flatten_variants(variants)
+        if page * EXPORT_PAGE_SIZE >= (total_results or 0):
+            return
+        page += 1
+        try:
+            # The streamed response already holds the request, so later pages wait for the search if it is being loaded
+            variants, total_results = get_es_variants(
+                results_model, page=page, num_results=EXPORT_PAGE_SIZE, wait_for_loading=True)
+        except InvalidSearchException as e:
+            logger.warning('Export of search {} truncated after {} results: {}'.format(
+                results_model.search_hash, (page - 1) * EXPORT_PAGE_SIZE, e))
+            return
+
+
+def _get_variant_export_rows(variants, families, family_ids_by_guid, max_families_per_variant, max_samples_per_variant):
+    json, variants_to_saved_variants = _get_saved_variants(variants, families)
+
     rows = []
     for variant in variants:
         row = [_get_field_value(variant, config) for config in VARIANT_EXPORT_DATA]
@@ -290,16 +401,16 @@ def export_variants_handler(request, search_hash):
             genotype = genotypes[i] if i < len(genotypes) else {}
             row += [_get_field_value(genotype, config) for config in VARIANT_SAMPLE_DATA]
         rows.append(row)
+    return rows
+
 
+def _get_variant_export_header(max_families_per_variant, max_samples_per_variant):
     header = [config['header'] for config in VARIANT_EXPORT_DATA]
     for i in range(max_families_per_variant):
         header += ['{}_{}'.format(config['header'], i+1) for config in VARIANT_FAMILY_EXPORT_DATA]
     for i in range(max_samples_per_variant):
         header += ['{}_{}'.format(config['header'], i+1) for config in VARIANT_SAMPLE_DATA]
-
-    file_format = request.GET.get('file_format', 'tsv')
-
-    return export_table('search_results_{}'.format(search_hash), header, rows, file_format, titlecase_header=False)
+    return header
 
 
 def _get_field_value(value, config):
@@ -545,27 +656,47 @@ def _get_saved_searches(user):
     return {'savedSearchesByGuid': {search['savedSearchGuid']: search for search in saved_searches}}
 
 
+# Saved variants are looked up by joining against arrays of the searched keys, rather than with a filter clause for
+# each searched variant, so the query size and planning time do not grow with the number of variants
+SAVED_VARIANT_ID_LOOKUP = 'SELECT saved_variant.id FROM {table} saved_variant INNER JOIN ' \
+                          'unnest(%s::text[], %s::integer[]) AS lookup(variant_id, family_id) ON ' \
+                          'saved_variant.variant_id = lookup.variant_id AND saved_variant.family_id = lookup.family_id'
+SAVED_VARIANT_POSITION_LOOKUP = 'SELECT saved_variant.id FROM {table} saved_variant INNER JOIN ' \
+                                'unnest(%s::bigint[], %s::text[], %s::text[], %s::integer[]) ' \
+                                'AS lookup(xpos, ref, alt, family_id) ON saved_variant.xpos = lookup.xpos AND ' \
+                                'saved_variant.ref = lookup.ref AND saved_variant.alt = lookup.alt AND ' \
+                                'saved_variant.family_id = lookup.family_id'
+
+
 def _get_saved_variants(variants, families, include_discovery_tags=False):
     variants = _flatten_variants(variants)
 
     prefetch_related_objects(families, 'project')
+    family_ids_by_guid = {family.guid: family.id for family in families}
     hg37_family_guids = {family.guid for family in families if family.project.genome_version == GENOME_VERSION_GRCh37}
 
-    variant_q = Q()
+    variant_id_keys = []
+    lifted_variant_keys = []
     variants_by_id = {}
     for variant in variants:
         variants_by_id[get_variant_key(**variant)] = variant
-        variant_q |= Q(variant_id=variant['variantId'], family__guid__in=variant['familyGuids'])
+        variant_family_ids = [
+            family_ids_by_guid[family_guid] for family_guid in variant['familyGuids'] if family_guid in family_ids_by_guid
+        ]
+        variant_id_keys += [(variant['variantId'], family_id) for family_id in variant_family_ids]
         if variant['liftedOverGenomeVersion'] == GENOME_VERSION_GRCh37 and hg37_family_guids:
             variant_hg37_families = [family_guid for family_guid in variant['familyGuids'] if family_guid in hg37_family_guids]
             if variant_hg37_families:
                 lifted_xpos = get_xpos(variant['liftedOverChrom'], variant['liftedOverPos'])
-                variant_q |= Q(xpos=lifted_xpos, ref=variant['ref'], alt=variant['alt'], family__guid__in=variant_hg37_families)
+                lifted_variant_keys += [
+                    (lifted_xpos, variant['ref'], variant['alt'], family_ids_by_guid[family_guid])
+                    for family_guid in variant_hg37_families
+                ]
                 variants_by_id[get_variant_key(
                     xpos=lifted_xpos, ref=variant['ref'], alt=variant['alt'], genomeVersion=variant['liftedOverGenomeVersion']
                 )] = variant
 
-    saved_variants = SavedVariant.objects.filter(variant_q)
+    saved_variants = SavedVariant.objects.filter(_saved_variant_lookup_q(variant_id_keys, lifted_variant_keys))
 
     json = get_json_for_saved_variants_with_tags(saved_variants, add_details=True)
 
@@ -601,6 +732,16 @@ def _get_saved_variants(variants, families, include_discovery_tags=False):
     return json, variants_to_saved_variants
 
 
+def _saved_variant_lookup_q(variant_id_keys, lifted_variant_keys):
+    table = SavedVariant._meta.db_table
+    variant_q = Q(id__in=RawSQL(
+        SAVED_VARIANT_ID_LOOKUP.format(table=table), [list(values) for values in zip(*variant_id_keys)] or [[], []]))
+    if lifted_variant_keys:
+        variant_q |= Q(id__in=RawSQL(
+            SAVED_VARIANT_POSITION_LOOKUP.format(table=table), [list(values) for values in zip(*lifted_variant_keys)]))
+    return variant_q
+
+
 def _flatten_variants(variants):
     flattened_variants = []
     for variant in variants:
@@ -6,11 +6,12 @@ from django.db import transaction
 from django.urls.base import reverse
 from elasticsearch.exceptions import ConnectionTimeout, TransportError
 
-from seqr.models import VariantSearchResults, LocusList, Project, VariantSearch
-from seqr.utils.elasticsearch.utils import InvalidIndexException, InvalidSearchException
+from seqr.models import VariantSearchResults, LocusList, Project, VariantSearch, Family
+from seqr.utils.elasticsearch.utils import InvalidIndexException, InvalidSearchException, SearchLoadingException
 from seqr.views.apis.variant_search_api import query_variants_handler, query_single_variant_handler, \
     export_variants_handler, search_context_handler, get_saved_search_handler, create_saved_search_handler, \
-    update_saved_search_handler, delete_saved_search_handler, get_variant_gene_breakdown
+    update_saved_search_handler, delete_saved_search_handler, get_variant_gene_breakdown, get_variant_search_job_status, \
+    _get_saved_variants
 from seqr.views.utils.test_utils import AuthenticationTestCase, VARIANTS, AnvilAuthenticationTestCase,\
     MixAuthenticationTestCase
 
@@ -47,6 +48,11 @@ def _get_empty_es_variants(results_model, **kwargs):
     return [], 0
 
 
+def _get_profiled_es_variants(results_model, profiler=None, **kwargs):
+    with profiler.timed('esSearch'):
+        return _get_es_variants(results_model, **kwargs)
+
+
 COMP_HET_VARAINTS = [[VARIANTS[2], VARIANTS[1]]]
 def _get_compound_het_es_variants(results_model, **kwargs):
     results_model.save()
@@ -159,19 +165,19 @@ class VariantSearchAPITest(object):
         )
 
         results_model = VariantSearchResults.objects.get(search_hash=SEARCH_HASH)
-        mock_get_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100, skip_genotype_filter=False)
+        mock_get_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100, skip_genotype_filter=False, profiler=None)
         mock_error_logger.assert_not_called()
 
         # Test pagination
         response = self.client.get('{}?page=3'.format(url))
         self.assertEqual(response.status_code, 200)
-        mock_get_variants.assert_called_with(results_model, sort='xpos', page=3, num_results=100, skip_genotype_filter=False)
+        mock_get_variants.assert_called_with(results_model, sort='xpos', page=3, num_results=100, skip_genotype_filter=False, profiler=None)
         mock_error_logger.assert_not_called()
 
         # Test sort
         response = self.client.get('{}?sort=pathogenicity'.format(url))
         self.assertEqual(response.status_code, 200)
-        mock_get_variants.assert_called_with(results_model, sort='pathogenicity', page=1, num_results=100, skip_genotype_filter=False)
+        mock_get_variants.assert_called_with(results_model, sort='pathogenicity', page=1, num_results=100, skip_genotype_filter=False, profiler=None)
         mock_error_logger.assert_not_called()
 
         # Test export
@@ -198,6 +204,58 @@ class VariantSearchAPITest(object):
         mock_get_variants.assert_called_with(results_model, page=1, load_all=True)
         mock_error_logger.assert_not_called()
 
+        # Test streamed export
+        def _get_paged_es_variants(results_model, page=1, num_results=100, **kwargs):
+            return deepcopy(VARIANTS[(page - 1) * num_results:page * num_results]), len(VARIANTS)
+        mock_get_variants.reset_mock()
+        mock_get_variants.side_effect = _get_paged_es_variants
+        with mock.patch('seqr.views.apis.variant_search_api.EXPORT_PAGE_SIZE', 2):
+            response = self.client.get('{}?stream=true'.format(export_url))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            content = b''.join(response.streaming_content)
+
+        # Family and sample columns are sized to the searched families
+        num_extra_samples = 3
+        extra_sample_header = []
+        for i in range(3, 3 + num_extra_samples):
+            extra_sample_header += ['sample_{}'.format(i), 'num_alt_alleles_{}'.format(i), 'gq_{}'.format(i), 'ab_{}'.format(i)]
+        expected_streamed_content = [expected_content[0] + extra_sample_header] + [
+            row + [''] * len(extra_sample_header) for row in expected_content[1:]]
+        self.assertEqual(content, ('\n'.join(['\t'.join(line) for line in expected_streamed_content])+'\n').encode('utf-8'))
+        mock_get_variants.assert_has_calls([
+            mock.call(results_model, page=1, num_results=2),
+            mock.call(results_model, page=2, num_results=2, wait_for_loading=True),
+        ])
+        self.assertEqual(mock_get_variants.call_count, 2)
+
+        mock_get_variants.reset_mock()
+        response = self.client.get('{}?stream=true&file_format=json'.format(export_url))
+        self.assertEqual(response.status_code, 200)
+        json_rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual(len(json_rows), 3)
+        self.assertListEqual(list(json_rows[0].keys()), expected_streamed_content[0])
+        self.assertListEqual(list(json_rows[2].values()), expected_streamed_content[3])
+        mock_get_variants.assert_called_once_with(results_model, page=1, num_results=500)
+
+        def _get_limited_paged_es_variants(results_model, page=1, num_results=100, **kwargs):
+            if page > 1:
+                raise InvalidSearchException('Unable to load more than 2 variants (4 requested)')
+            return _get_paged_es_variants(results_model, page=page, num_results=num_results)
+        mock_get_variants.side_effect = _get_limited_paged_es_variants
+        with mock.patch('seqr.views.apis.variant_search_api.EXPORT_PAGE_SIZE', 2), \
+                mock.patch('seqr.views.apis.variant_search_api.logger') as mock_logger:
+            response = self.client.get('{}?stream=true'.format(export_url))
+            self.assertEqual(response.status_code, 200)
+            content = b''.join(response.streaming_content)
+            mock_logger.warning.assert_called_with(
+                'Export of search {} truncated after 2 results: Unable to load more than 2 variants (4 requested)'.format(
+                    SEARCH_HASH))
+        self.assertEqual(
+            content, ('\n'.join(['\t'.join(line) for line in expected_streamed_content[:3]])+'\n').encode('utf-8'))
+        mock_get_variants.side_effect = _get_es_variants
+        mock_error_logger.assert_not_called()
+
         # Test gene breakdown
         gene_counts = {
             'ENSG00000227232': {'total': 2, 'families': {'F000001_1': 2, 'F000002_2': 1}},
@@ -251,9 +309,25 @@ class VariantSearchAPITest(object):
 
         self.assertListEqual(response_json['searchedVariants'], VARIANTS_WITH_DISCOVERY_TAGS)
         self.assertSetEqual(set(response_json['familiesByGuid'].keys()), {'F000011_11'})
-        mock_get_variants.assert_called_with(results_model, sort='pathogenicity_hgmd', page=1, num_results=100, skip_genotype_filter=False)
+        mock_get_variants.assert_called_with(results_model, sort='pathogenicity_hgmd', page=1, num_results=100, skip_genotype_filter=False, profiler=None)
         mock_error_logger.assert_not_called()
 
+        # Test search profiling for analyst users
+        mock_get_variants.side_effect = _get_profiled_es_variants
+        response = self.client.get('{}?profile=true'.format(url))
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertDictEqual(response_json['searchProfile'], {
+            'phasesMs': {'esSearch': mock.ANY}, 'esRequests': 0, 'esTookMs': 0, 'esOverheadMs': mock.ANY,
+        })
+        profiler = mock_get_variants.call_args[1]['profiler']
+        self.assertFalse(profiler.include_es_profile)
+
+        response = self.client.get('{}?profile=es'.format(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(response.json()['searchProfile']['esProfiles'], [])
+        self.assertTrue(mock_get_variants.call_args[1]['profiler'].include_es_profile)
+
         # Test no results
         mock_get_variants.side_effect = _get_empty_es_variants
         response = self.client.post(url, content_type='application/json', data=json.dumps({
@@ -271,6 +345,77 @@ class VariantSearchAPITest(object):
         })
         mock_error_logger.assert_not_called()
 
+    @mock.patch('seqr.views.apis.variant_search_api.prefetch_search_page')
+    @mock.patch('seqr.views.apis.variant_search_api.get_search_job_status')
+    @mock.patch('seqr.views.apis.variant_search_api.submit_search_job')
+    @mock.patch('seqr.views.apis.variant_search_api.get_cached_es_variants')
+    @mock.patch('seqr.views.apis.variant_search_api.get_es_variants')
+    def test_query_variants_async(self, mock_get_variants, mock_get_cached_variants, mock_submit_job,
+                                  mock_get_job_status, mock_prefetch):
+        url = reverse(query_variants_handler, args=[SEARCH_HASH])
+        self.check_collaborator_login(url, request_data={'projectFamilies': PROJECT_FAMILIES})
+
+        # Test searches which are not loaded are submitted as a job
+        job_status = {'status': 'queued', 'page': 1, 'numResults': 100, 'loadedVariantCounts': {}}
+        mock_submit_job.return_value = job_status
+        mock_get_cached_variants.return_value = (None, None)
+        response = self.client.post('{}?async=true'.format(url), content_type='application/json', data=json.dumps({
+            'projectFamilies': PROJECT_FAMILIES, 'search': SEARCH
+        }))
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(response.json(), {
+            'search': {'search': {}, 'projectFamilies': PROJECT_FAMILIES},
+            'searchJobStatus': {SEARCH_HASH: job_status},
+        })
+        results_model = VariantSearchResults.objects.get(search_hash=SEARCH_HASH)
+        mock_get_cached_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100)
+        mock_submit_job.assert_called_with(
+            results_model, sort='xpos', page=1, num_results=100, skip_genotype_filter=False)
+        mock_get_variants.assert_not_called()
+        mock_prefetch.assert_not_called()
+
+        # Test job status
+        status_url = reverse(get_variant_search_job_status, args=[SEARCH_HASH])
+        running_status = {'status': 'running', 'page': 1, 'numResults': 100, 'loadedVariantCounts': {
+            'test_index': {'loaded': 0, 'total': 0}}}
+        mock_get_job_status.return_value = running_status
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(response.json(), {'searchJobStatus': {SEARCH_HASH: running_status}})
+        mock_get_job_status.assert_called_with(results_model, sort='xpos', page=1, num_results=100)
+
+        response = self.client.get('{}?page=2&per_page=10'.format(status_url))
+        self.assertEqual(response.status_code, 200)
+        mock_get_job_status.assert_called_with(results_model, sort='xpos', page=2, num_results=10)
+
+        # Test loaded searches are returned, and the next page is prefetched
+        mock_get_cached_variants.return_value = (deepcopy(VARIANTS), len(VARIANTS))
+        response = self.client.get('{}?async=true&prefetch=true&per_page=2'.format(url))
+        self.assertEqual(response.status_code, 200)
+        response_json = response.json()
+        self.assertNotIn('searchJobStatus', response_json)
+        self.assertListEqual(response_json['searchedVariants'], VARIANTS)
+        self.assertEqual(response_json['search']['totalResults'], 3)
+        self.assertEqual(mock_submit_job.call_count, 1)
+        mock_get_variants.assert_not_called()
+        mock_prefetch.assert_called_with(
+            results_model, 3, sort='xpos', page=1, num_results=2, skip_genotype_filter=False)
+
+        # Test synchronous searches which are already being loaded are submitted as a job instead of waiting
+        mock_get_variants.side_effect = SearchLoadingException('This search is already being loaded')
+        mock_prefetch.reset_mock()
+        response = self.client.get('{}?prefetch=true&page=2'.format(url))
+        self.assertEqual(response.status_code, 200)
+        self.assertDictEqual(response.json(), {
+            'search': {'search': {}, 'projectFamilies': PROJECT_FAMILIES},
+            'searchJobStatus': {SEARCH_HASH: job_status},
+        })
+        mock_get_variants.assert_called_with(
+            results_model, sort='xpos', page=2, num_results=100, skip_genotype_filter=False, profiler=None)
+        mock_submit_job.assert_called_with(
+            results_model, sort='xpos', page=2, num_results=100, skip_genotype_filter=False)
+        mock_prefetch.assert_not_called()
+
     @mock.patch('seqr.views.apis.variant_search_api.get_es_variants')
     def test_query_all_projects_variants(self, mock_get_variants):
         url = reverse(query_variants_handler, args=[SEARCH_HASH])
@@ -299,7 +444,7 @@ class VariantSearchAPITest(object):
                 'totalResults': 3,
         }})
         results_model = VariantSearchResults.objects.get(search_hash=SEARCH_HASH)
-        mock_get_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100, skip_genotype_filter=True)
+        mock_get_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100, skip_genotype_filter=True, profiler=None)
 
         results_model.delete()
         self.login_collaborator()
@@ -334,7 +479,7 @@ class VariantSearchAPITest(object):
 
         results_model = VariantSearchResults.objects.get(search_hash=SEARCH_HASH)
         mock_get_variants.assert_called_with(results_model, sort='xpos', page=1, num_results=100,
-                                             skip_genotype_filter=True)
+                                             skip_genotype_filter=True, profiler=None)
 
     @mock.patch('seqr.views.apis.variant_search_api.get_es_variants')
     def test_query_all_project_families_variants(self, mock_get_variants):
@@ -576,6 +721,40 @@ class VariantSearchAPITest(object):
         self.assertEqual(response.status_code, 403)
 
 
+    def test_get_saved_variants(self):
+        families = Family.objects.filter(guid__in=['F000001_1', 'F000002_2'])
+        variants = [
+            {
+                'variantId': '21-3343353-GAGA-G', 'xpos': 21003343353, 'ref': 'GAGA', 'alt': 'G', 'genomeVersion': '37',
+                'liftedOverGenomeVersion': None, 'familyGuids': ['F000001_1', 'F000002_2'],
+            },
+            # Saved for a different family than the one it was found in
+            {
+                'variantId': '12-48367227-TC-T', 'xpos': 1248367227, 'ref': 'TC', 'alt': 'T', 'genomeVersion': '37',
+                'liftedOverGenomeVersion': None, 'familyGuids': ['F000001_1'],
+            },
+            # Lifted over to the position of a saved GRCh37 variant
+            [{
+                'variantId': '1-1600000-G-C', 'xpos': 1001600000, 'ref': 'G', 'alt': 'C', 'genomeVersion': '38',
+                'liftedOverGenomeVersion': '37', 'liftedOverChrom': '1', 'liftedOverPos': 1562437,
+                'familyGuids': ['F000001_1', 'F000002_2'],
+            }],
+        ]
+
+        with self.assertNumQueries(7):
+            response_json, variants_to_saved_variants = _get_saved_variants(variants, families)
+        self.assertSetEqual(
+            set(response_json['savedVariantsByGuid'].keys()),
+            {'SV0000001_2103343353_r0390_100', 'SV0059957_11562437_f019313_1'})
+        self.assertDictEqual(variants_to_saved_variants, {
+            '21-3343353-GAGA-G': {'F000001_1': 'SV0000001_2103343353_r0390_100'},
+            '1-1600000-G-C': {'F000001_1': 'SV0059957_11562437_f019313_1'},
+        })
+
+        response_json, variants_to_saved_variants = _get_saved_variants([], families)
+        self.assertDictEqual(response_json['savedVariantsByGuid'], {})
+        self.assertDictEqual(variants_to_saved_variants, {})
+
 # Tests for AnVIL access disabled
 class LocalVariantSearchAPITest(AuthenticationTestCase, VariantSearchAPITest):
     fixtures = ['users', '1kg_project', 'reference_data', 'variant_searches']
@@ -596,7 +775,7 @@ class AnvilVariantSearchAPITest(AnvilAuthenticationTestCase, VariantSearchAPITes
 
     def test_query_variants(self, *args):
         super(AnvilVariantSearchAPITest, self).test_query_variants(*args)
-        assert_no_list_ws_has_al(self, 13)
+        assert_no_list_ws_has_al(self, 16)
 
     def test_query_all_projects_variants(self, *args):
         super(AnvilVariantSearchAPITest, self).test_query_all_projects_variants(*args)
@@ -4,7 +4,7 @@ import openpyxl as xl
 from tempfile import NamedTemporaryFile
 import zipfile
 
-from django.http.response import HttpResponse
+from django.http.response import HttpResponse, StreamingHttpResponse
 
 from seqr.views.utils.json_utils import _to_title_case
 
@@ -27,10 +27,7 @@ def export_table(filename_prefix, header, rows, file_format='tsv', titlecase_hea
     """
 
     for i, row in enumerate(rows):
-        if len(header) != len(row):
-            raise ValueError('len(header) != len(row): %s != %s\n%s\n%s' % (
-                len(header), len(row), ','.join(header), ','.join(row)))
-        rows[i] = ['' if value is None else value for value in row]
+        rows[i] = _format_row(header, row)
 
     if file_format == "tsv":
         response = HttpResponse(content_type='text/tsv')
@@ -41,10 +38,7 @@ def export_table(filename_prefix, header, rows, file_format='tsv', titlecase_hea
     elif file_format == "json":
         response = HttpResponse(content_type='application/json')
         response['Content-Disposition'] = 'attachment; filename="{}.json"'.format(filename_prefix).encode('ascii', 'ignore')
-        for row in rows:
-            json_keys = [s.replace(" ", "_").lower() for s in header]
-            json_values = list(map(str, row))
-            response.write(json.dumps(OrderedDict(zip(json_keys, json_values)))+'\n')
+        response.writelines(_json_lines(header, rows))
         return response
     elif file_format == "xls":
         wb = xl.Workbook(write_only=True)
@@ -64,6 +58,55 @@ def export_table(filename_prefix, header, rows, file_format='tsv', titlecase_hea
         raise ValueError("Invalid file_format: %s" % file_format)
 
 
+def export_table_stream(filename_prefix, header, rows, file_format='tsv'):
+    """Generates a streaming HTTP response for a table with the given header and rows, exported into the given
+    file_format. Rows are written to the response as they are generated, so the full table is never held in memory.
+
+    Args:
+        filename_prefix (string): Filename without the extension.
+        header (list): List of column names
+        rows (iterable): Iterable of rows, where each row is a list of column values
+        file_format (string): "tsv" or "json"
+    Returns:
+        Django StreamingHttpResponse object with the table data as an attachment.
+    """
+    rows = (_format_row(header, row) for row in rows)
+
+    if file_format == "tsv":
+        content = _tsv_lines(header, rows)
+        content_type = 'text/tsv'
+    elif file_format == "json":
+        content = _json_lines(header, rows)
+        content_type = 'application/json'
+    else:
+        raise ValueError("Invalid file_format for streaming: %s" % file_format)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(filename_prefix, file_format).encode(
+        'ascii', 'ignore')
+    return response
+
+
+def _format_row(header, row):
+    if len(header) != len(row):
+        raise ValueError('len(header) != len(row): %s != %s\n%s\n%s' % (
+            len(header), len(row), ','.join(header), ','.join(map(str, row))))
+    return ['' if value is None else value for value in row]
+
+
+def _tsv_lines(header, rows):
+    yield '\t'.join(header)+'\n'
+    for row in rows:
+        yield '\t'.join(map(str, row))+'\n'
+
+
+def _json_lines(header, rows):
+    json_keys = [s.replace(" ", "_").lower() for s in header]
+    for row in rows:
+        json_values = list(map(str, row))
+        yield json.dumps(OrderedDict(zip(json_keys, json_values)))+'\n'
+
+
 def export_multiple_files(files, zip_filename, file_format='csv', add_header_prefix=False, blank_value=''):
     if file_format not in DELIMITERS:
         raise ValueError('Invalid file_format: {}'.format(file_format))
@@ -6,6 +6,7 @@ import logging
 from collections import defaultdict
 
 from seqr.models import Sample, IgvSample, Individual, Family
+from seqr.utils.elasticsearch.search_context_cache import reset_cached_search_context
 from seqr.views.utils.pedigree_image_utils import update_pedigree_images
 from seqr.views.utils.json_to_orm_utils import update_individual_from_json, update_family_from_json, \
     create_model_from_json
@@ -121,6 +122,9 @@ def add_or_update_individuals_and_families(project, individual_records, user):
     # update pedigree images
     update_pedigree_images(updated_families, user, project_guid=project.guid)
 
+    # Cached search samples include individual sex and affected status
+    reset_cached_search_context()
+
     return list(updated_families), list(updated_individuals)
 
 
@@ -145,6 +149,8 @@ def delete_individuals(project, individual_guids, user):
 
     Individual.bulk_delete(user, queryset=individuals_to_delete)
 
+    reset_cached_search_context()
+
     update_pedigree_images(families, user)
 
     families_with_deleted_individuals = list(families)
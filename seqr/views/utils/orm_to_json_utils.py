@@ -5,14 +5,16 @@ Utility functions for converting Django ORM object to JSON
 import json
 import logging
 import os
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from copy import copy, deepcopy
-from django.db.models import prefetch_related_objects, Prefetch
+from functools import lru_cache
+from django.db.models import prefetch_related_objects, Prefetch, QuerySet
 from django.db.models.fields.files import ImageFieldFile
 from django.contrib.auth.models import User
 
 from reference_data.models import GeneConstraint, dbNSFPGene, Omim, MGI, PrimateAI, HumanPhenotypeOntology
-from seqr.models import GeneNote, VariantNote, VariantTag, VariantFunctionalData, SavedVariant, CAN_EDIT, CAN_VIEW
+from seqr.models import GeneNote, VariantNote, VariantTag, VariantFunctionalData, SavedVariant, FamilyAnalysedBy, \
+    Individual, Sample, IgvSample, CAN_EDIT, CAN_VIEW
 from seqr.views.utils.json_utils import _to_camel_case
 from seqr.views.utils.permissions_utils import has_project_permissions, has_case_review_permissions, \
     project_has_anvil, get_workspace_collaborator_perms, user_is_analyst, user_is_data_manager, user_is_pm
@@ -77,6 +79,92 @@ def _get_json_for_models(models, nested_fields=None, user=None, is_analyst=None,
     return results
 
 
+def _get_json_for_model_values(queryset, nested_fields=None, user=None, is_analyst=None, process_result=None, guid_key=None, additional_model_fields=None, related_fields=None):
+    """Returns an array JSON representations of the models in the given queryset, without instantiating the models.
+
+    Returns the same JSON as _get_json_for_models, but only fetches the serialized fields using values_list, and builds
+    each result using a key map which is planned once for each model class and set of fields.
+
+    Args:
+        queryset (object): Django queryset for the models
+        user (object): Django User object for determining whether to include restricted/internal-only fields
+        nested_fields (array): Optional array of fields to get from the model that are nested on related objects
+        process_result (lambda): Optional function to post-process a given model json. Called with the json and the
+            model id
+        guid_key (string): Optional key to use for the model's guid
+        related_fields (dict): Optional map of foreign key fields to the fields to get from the related model. Related
+            models are returned as named tuples of these fields
+    Returns:
+        array: json objects
+    """
+    model_class = queryset.model
+    fields = copy(model_class._meta.json_fields)
+    if is_analyst is None:
+        is_analyst = user and user_is_analyst(user)
+    if is_analyst:
+        fields += getattr(model_class._meta, 'internal_json_fields', [])
+    if additional_model_fields:
+        fields += additional_model_fields
+
+    nested_fields = nested_fields or []
+    nested_values = {
+        nested_field.get('key', _to_camel_case('_'.join(nested_field['fields']))): nested_field['value']
+        for nested_field in nested_fields if nested_field.get('value')
+    }
+    plan = _get_model_values_plan(
+        model_class, tuple(fields),
+        tuple((tuple(nested_field['fields']), nested_field.get('key')) for nested_field in nested_fields
+              if not nested_field.get('value')),
+        tuple((field, tuple(related)) for field, related in (related_fields or {}).items() if field in fields),
+        guid_key,
+    )
+
+    results = []
+    for row in queryset.values_list(*plan.lookups):
+        result = dict(zip(plan.keys, row))
+        for key, related_tuple, start, end in plan.related_fields:
+            if result[key] is not None:
+                result[key] = related_tuple(*row[start:end])
+        if plan.created_by_index is not None and result['createdBy']:
+            first_name, last_name, email = row[plan.created_by_index:plan.created_by_index + 3]
+            result['createdBy'] = '{} {}'.format(first_name, last_name).strip() or email
+        result.update(nested_values)
+        if result.get('guid'):
+            result[plan.guid_key] = result.pop('guid')
+        if process_result:
+            process_result(result, row[-1])
+        results.append(result)
+
+    return results
+
+
+ModelValuesPlan = namedtuple('ModelValuesPlan', ['lookups', 'keys', 'related_fields', 'created_by_index', 'guid_key'])
+
+
+@lru_cache()
+def _get_model_values_plan(model_class, fields, nested_fields, related_fields, guid_key):
+    lookups = list(fields)
+    keys = [_to_camel_case(field) for field in fields]
+    for nested_fields_path, key in nested_fields:
+        lookups.append('__'.join(nested_fields_path))
+        keys.append(key or _to_camel_case('_'.join(nested_fields_path)))
+
+    # Values for related models and the model id are fetched after the columns which are mapped directly to json keys
+    planned_related_fields = []
+    for field, related in related_fields:
+        planned_related_fields.append((
+            _to_camel_case(field), namedtuple(field, related), len(lookups), len(lookups) + len(related)))
+        lookups += ['{}__{}'.format(field, related_field) for related_field in related]
+    created_by_index = None
+    if 'created_by' in fields:
+        created_by_index = len(lookups)
+        lookups += ['created_by__first_name', 'created_by__last_name', 'created_by__email']
+    lookups.append('id')
+
+    guid_key = guid_key or '{}{}Guid'.format(model_class.__name__[0].lower(), model_class.__name__[1:])
+    return ModelValuesPlan(lookups, keys, planned_related_fields, created_by_index, guid_key)
+
+
 def _get_json_for_model(model, get_json_for_models=_get_json_for_models, **kwargs):
     """Helper function to return a JSON representations of the given model.
 
@@ -172,26 +260,35 @@ def _get_json_for_project(project, user, **kwargs):
     return _get_json_for_model(project, get_json_for_models=get_json_for_projects, user=user, **kwargs)
 
 
-def _get_case_review_fields(model, has_case_review_perm, user, get_project):
-    if has_case_review_perm is None:
-        has_case_review_perm = user and has_case_review_permissions(get_project(model), user)
+def _get_case_review_fields(models, has_case_review_perm, user, get_project):
+    if has_case_review_perm is None and user:
+        # Querysets are not loaded to check permissions, so only the first model is fetched
+        model = models.first() if isinstance(models, QuerySet) else models[0]
+        has_case_review_perm = model and has_case_review_permissions(get_project(model), user)
     if not has_case_review_perm:
         return []
-    return [field.name for field in type(model)._meta.fields if field.name.startswith('case_review')]
+    model_class = models.model if isinstance(models, QuerySet) else type(models[0])
+    return [field.name for field in model_class._meta.fields if field.name.startswith('case_review')]
+
+
+def _get_user_full_name(user):
+    return '{} {}'.format(user.first_name, user.last_name).strip()
 
 
 def _get_json_for_families(families, user=None, add_individual_guids_field=False, project_guid=None, skip_nested=False, is_analyst=None, has_case_review_perm=None):
     """Returns a JSON representation of the given Family.
 
     Args:
-        families (array): array of django models representing the family.
+        families (array): array of django models representing the family. If a queryset is given, the families are
+            serialized from their values without instantiating the models
         user (object): Django User object for determining whether to include restricted/internal-only fields
         add_individual_guids_field (bool): whether to add an 'individualGuids' field. NOTE: this will require a database query.
         project_guid (boolean): An optional field to use as the projectGuid instead of querying the DB
     Returns:
         array: json objects
     """
-    if not families:
+    use_values = isinstance(families, QuerySet)
+    if not use_values and not families:
         return []
 
     def _get_pedigree_image_url(pedigree_image):
@@ -203,38 +300,72 @@ def _get_json_for_families(families, user=None, add_individual_guids_field=False
         return os.path.join("/media/", pedigree_image) if pedigree_image else None
 
     analyst_users = set(User.objects.filter(groups__name=ANALYST_USER_GROUP) if ANALYST_USER_GROUP else [])
+
+    def _get_analysed_by_json(last_modified_date, full_name, email, is_analyst):
+        return {
+            'createdBy': {'fullName': full_name, 'email': email, 'isAnalyst': is_analyst},
+            'lastModifiedDate': last_modified_date,
+        }
+
+    if use_values:
+        analyst_user_ids = {analyst.id for analyst in analyst_users}
+        family_ids = families.values('id')
+        analysed_by_by_family = defaultdict(list)
+        for family_id, last_modified_date, created_by_id, first_name, last_name, email in FamilyAnalysedBy.objects.filter(
+                family_id__in=family_ids).values_list(
+                'family_id', 'last_modified_date', 'created_by_id', 'created_by__first_name', 'created_by__last_name',
+                'created_by__email'):
+            analysed_by_by_family[family_id].append(_get_analysed_by_json(
+                last_modified_date, '{} {}'.format(first_name, last_name).strip(), email,
+                created_by_id in analyst_user_ids))
+        get_analysed_by = lambda family_id: analysed_by_by_family[family_id]
+
+        individual_guids_by_family = defaultdict(list)
+        if add_individual_guids_field:
+            for family_id, individual_guid in Individual.objects.filter(family_id__in=family_ids).values_list(
+                    'family_id', 'guid'):
+                individual_guids_by_family[family_id].append(individual_guid)
+        get_individual_guids = lambda family_id: individual_guids_by_family[family_id]
+    else:
+        get_analysed_by = lambda family: [_get_analysed_by_json(
+            ab.last_modified_date, ab.created_by.get_full_name(), ab.created_by.email, ab.created_by in analyst_users,
+        ) for ab in family.familyanalysedby_set.all()]
+        get_individual_guids = lambda family: [i.guid for i in family.individual_set.all()]
+
     def _process_result(result, family):
-        result['analysedBy'] = [{
-            'createdBy': {'fullName': ab.created_by.get_full_name(), 'email': ab.created_by.email, 'isAnalyst': ab.created_by in analyst_users},
-            'lastModifiedDate': ab.last_modified_date,
-        } for ab in family.familyanalysedby_set.all()]
+        result['analysedBy'] = get_analysed_by(family)
         pedigree_image = _get_pedigree_image_url(result.pop('pedigreeImage'))
         result['pedigreeImage'] = pedigree_image
         if add_individual_guids_field:
-            result['individualGuids'] = [i.guid for i in family.individual_set.all()]
+            result['individualGuids'] = get_individual_guids(family)
         if not result['displayName']:
             result['displayName'] = result['familyId']
         if result['assignedAnalyst']:
             result['assignedAnalyst'] = {
-                'fullName': result['assignedAnalyst'].get_full_name(),
+                'fullName': _get_user_full_name(result['assignedAnalyst']),
                 'email': result['assignedAnalyst'].email,
             }
         else:
             result['assignedAnalyst'] = None
 
-    prefetch_related_objects(families, 'assigned_analyst')
-    prefetch_related_objects(families, 'familyanalysedby_set__created_by')
-    if add_individual_guids_field:
-        prefetch_related_objects(families, 'individual_set')
+    if not use_values:
+        prefetch_related_objects(families, 'assigned_analyst')
+        prefetch_related_objects(families, 'familyanalysedby_set__created_by')
+        if add_individual_guids_field:
+            prefetch_related_objects(families, 'individual_set')
 
     kwargs = {'additional_model_fields': _get_case_review_fields(
-        families[0], has_case_review_perm, user, lambda family: family.project)
+        families, has_case_review_perm, user, lambda family: family.project)
     }
     if project_guid or not skip_nested:
         kwargs.update({'nested_fields': [{'fields': ('project', 'guid'), 'value': project_guid}]})
     else:
         kwargs['additional_model_fields'].append('project_id')
 
+    if use_values:
+        return _get_json_for_model_values(
+            families, user=user, is_analyst=is_analyst, process_result=_process_result,
+            related_fields={'assigned_analyst': ['first_name', 'last_name', 'email']}, **kwargs)
     return _get_json_for_models(families, user=user, is_analyst=is_analyst, process_result=_process_result, **kwargs)
 
 
@@ -257,7 +388,8 @@ def _get_json_for_individuals(individuals, user=None, project_guid=None, family_
     """Returns a JSON representation for the given list of Individuals.
 
     Args:
-        individuals (array): array of django models for the individual.
+        individuals (array): array of django models for the individual. If a queryset is given, the individuals are
+            serialized from their values without instantiating the models
         user (object): Django User object for determining whether to include restricted/internal-only fields
         project_guid (string): An optional field to use as the projectGuid instead of querying the DB
         family_guid (boolean): An optional field to use as the familyGuid instead of querying the DB
@@ -266,7 +398,8 @@ def _get_json_for_individuals(individuals, user=None, project_guid=None, family_
         array: array of json objects
     """
 
-    if not individuals:
+    use_values = isinstance(individuals, QuerySet)
+    if not use_values and not individuals:
         return []
 
     def _get_case_review_status_modified_by(modified_by):
@@ -286,12 +419,27 @@ def _get_json_for_individuals(individuals, user=None, project_guid=None, family_
         })
 
         if add_sample_guids_field:
-            result['sampleGuids'] = [s.guid for s in individual.sample_set.all()]
-            result['igvSampleGuids'] = [s.guid for s in individual.igvsample_set.all()]
+            result['sampleGuids'] = get_sample_guids(individual)
+            result['igvSampleGuids'] = get_igv_sample_guids(individual)
+
+    if add_sample_guids_field and use_values:
+        sample_guids_by_individual = defaultdict(list)
+        for individual_id, sample_guid in Sample.objects.filter(individual_id__in=individuals.values('id')).values_list(
+                'individual_id', 'guid'):
+            sample_guids_by_individual[individual_id].append(sample_guid)
+        igv_sample_guids_by_individual = defaultdict(list)
+        for individual_id, sample_guid in IgvSample.objects.filter(
+                individual_id__in=individuals.values('id')).values_list('individual_id', 'guid'):
+            igv_sample_guids_by_individual[individual_id].append(sample_guid)
+        get_sample_guids = lambda individual_id: sample_guids_by_individual[individual_id]
+        get_igv_sample_guids = lambda individual_id: igv_sample_guids_by_individual[individual_id]
+    elif add_sample_guids_field:
+        get_sample_guids = lambda individual: [s.guid for s in individual.sample_set.all()]
+        get_igv_sample_guids = lambda individual: [s.guid for s in individual.igvsample_set.all()]
 
     kwargs = {
         'additional_model_fields': _get_case_review_fields(
-            individuals[0], has_case_review_perm, user, lambda indiv: indiv.family.project)
+            individuals, has_case_review_perm, user, lambda indiv: indiv.family.project)
     }
     if project_guid or not skip_nested:
         nested_fields = [
@@ -309,15 +457,24 @@ def _get_json_for_individuals(individuals, user=None, project_guid=None, family_
         kwargs['additional_model_fields'] += [
             'features', 'absent_features', 'nonstandard_features', 'absent_nonstandard_features']
 
-    prefetch_related_objects(individuals, 'mother')
-    prefetch_related_objects(individuals, 'father')
-    if 'case_review_status_last_modified_by' in kwargs['additional_model_fields']:
-        prefetch_related_objects(individuals, 'case_review_status_last_modified_by')
-    if add_sample_guids_field:
-        prefetch_related_objects(individuals, 'sample_set')
-        prefetch_related_objects(individuals, 'igvsample_set')
+    if use_values:
+        parsed_individuals = _get_json_for_model_values(
+            individuals, user=user, is_analyst=is_analyst, process_result=_process_result, related_fields={
+                'mother': ['guid', 'individual_id'],
+                'father': ['guid', 'individual_id'],
+                'case_review_status_last_modified_by': ['email', 'username'],
+            }, **kwargs)
+    else:
+        prefetch_related_objects(individuals, 'mother')
+        prefetch_related_objects(individuals, 'father')
+        if 'case_review_status_last_modified_by' in kwargs['additional_model_fields']:
+            prefetch_related_objects(individuals, 'case_review_status_last_modified_by')
+        if add_sample_guids_field:
+            prefetch_related_objects(individuals, 'sample_set')
+            prefetch_related_objects(individuals, 'igvsample_set')
 
-    parsed_individuals = _get_json_for_models(individuals, user=user, is_analyst=is_analyst, process_result=_process_result, **kwargs)
+        parsed_individuals = _get_json_for_models(
+            individuals, user=user, is_analyst=is_analyst, process_result=_process_result, **kwargs)
     if add_hpo_details:
         all_hpo_ids = set()
         for i in parsed_individuals:
@@ -353,7 +510,8 @@ def get_json_for_samples(samples, project_guid=None, individual_guid=None, skip_
     """Returns a JSON representation of the given list of Samples.
 
     Args:
-        samples (array): array of django models for the Samples.
+        samples (array): array of django models for the Samples. If a queryset is given, the samples are serialized
+            from their values without instantiating the models
     Returns:
         array: array of json objects
     """
@@ -366,6 +524,8 @@ def get_json_for_samples(samples, project_guid=None, individual_guid=None, skip_
     else:
         kwargs = {'additional_model_fields': ['individual_id']}
 
+    if isinstance(samples, QuerySet):
+        return _get_json_for_model_values(samples, guid_key='sampleGuid', **kwargs)
     return _get_json_for_models(samples, guid_key='sampleGuid', **kwargs)
 
 
@@ -456,64 +616,35 @@ def get_json_for_saved_variants_with_tags(saved_variants, include_missing_varian
 
     missing_ids = set()
     saved_variant_id_map = {var.id: var.guid for var in saved_variants}
+    # Filtering on a subquery avoids sending a query parameter for every saved variant
+    saved_variant_ids = saved_variants.values('id') if isinstance(saved_variants, QuerySet) \
+        else saved_variant_id_map.keys()
+
+    # Tags, functional data and notes are each loaded in a single query on the many-to-many table, and serialized
+    # directly from the returned rows rather than from model instances
+    relations = [
+        ('variantTagsByGuid', 'tagGuids', VariantTag, {
+            field: 'variant_tag_type__{}'.format(field) for field in ['name', 'category', 'color']
+        }, None),
+        ('variantFunctionalDataByGuid', 'functionalDataGuids', VariantFunctionalData, None,
+         _process_functional_data_values),
+        ('variantNotesByGuid', 'noteGuids', VariantNote, None, None),
+    ]
 
-    variant_tag_id_map = defaultdict(list)
-    for tag_mapping in VariantTag.saved_variants.through.objects.filter(savedvariant_id__in=saved_variant_id_map.keys()):
-        variant_tag_id_map[tag_mapping.varianttag_id].append(tag_mapping.savedvariant_id)
-    tag_models = VariantTag.objects.filter(id__in=variant_tag_id_map.keys())
-    tag_id_map = {tag.guid: tag.id for tag in tag_models}
-
-    tags = get_json_for_variant_tags(tag_models, add_variant_guids=False)
-    for tag in tags:
-        tag_guid = tag['tagGuid']
-        tag['variantGuids'] = []
-        variant_ids = variant_tag_id_map[tag_id_map[tag_guid]]
-        for variant_id in variant_ids:
-            variant_guid = saved_variant_id_map.get(variant_id)
-            if variant_guid:
-                variants_by_guid[variant_guid]['tagGuids'].append(tag['tagGuid'])
-                tag['variantGuids'].append(variant_guid)
-            else:
-                missing_ids.add(variant_id)
-
-    variant_functional_id_map = defaultdict(list)
-    for functional_mapping in VariantFunctionalData.saved_variants.through.objects.filter(
-            savedvariant_id__in=saved_variant_id_map.keys()):
-        variant_functional_id_map[functional_mapping.variantfunctionaldata_id].append(functional_mapping.savedvariant_id)
-    functional_models = VariantFunctionalData.objects.filter(id__in=variant_functional_id_map.keys())
-    functional_id_map = {tag.guid: tag.id for tag in functional_models}
-
-    functional_data = get_json_for_variant_functional_data_tags(functional_models, add_variant_guids=False)
-    for tag in functional_data:
-        tag_guid = tag['tagGuid']
-        tag['variantGuids'] = []
-        variant_ids = variant_functional_id_map[functional_id_map[tag_guid]]
-        for variant_id in variant_ids:
-            variant_guid = saved_variant_id_map.get(variant_id)
-            if variant_guid:
-                variants_by_guid[variant_guid]['functionalDataGuids'].append(tag['tagGuid'])
-                tag['variantGuids'].append(variant_guid)
-            else:
-                missing_ids.add(variant_id)
-
-    variant_note_id_map = defaultdict(list)
-    for note_mapping in VariantNote.saved_variants.through.objects.filter(savedvariant_id__in=saved_variant_id_map.keys()):
-        variant_note_id_map[note_mapping.variantnote_id].append(note_mapping.savedvariant_id)
-    note_models = VariantNote.objects.filter(id__in=variant_note_id_map.keys())
-    note_id_map = {note.guid: note.id for note in note_models}
-
-    notes = get_json_for_variant_notes(note_models, add_variant_guids=False)
-    for note in notes:
-        note_guid = note['noteGuid']
-        note['variantGuids'] = []
-        variant_ids = variant_note_id_map[note_id_map[note_guid]]
-        for variant_id in variant_ids:
-            variant_guid = saved_variant_id_map.get(variant_id)
-            if variant_guid:
-                variants_by_guid[variant_guid]['noteGuids'].append(note['noteGuid'])
-                note['variantGuids'].append(variant_guid)
-            else:
-                missing_ids.add(variant_id)
+    response = {}
+    for response_key, variant_key, model_class, nested_fields, process_result in relations:
+        models_json, variant_ids_by_guid = _get_json_for_saved_variant_relation(
+            model_class, saved_variant_ids, nested_fields=nested_fields, process_result=process_result)
+        for guid, model_json in models_json.items():
+            model_json['variantGuids'] = []
+            for variant_id in variant_ids_by_guid[guid]:
+                variant_guid = saved_variant_id_map.get(variant_id)
+                if variant_guid:
+                    variants_by_guid[variant_guid][variant_key].append(guid)
+                    model_json['variantGuids'].append(variant_guid)
+                else:
+                    missing_ids.add(variant_id)
+        response[response_key] = models_json
 
     if include_missing_variants and missing_ids:
         variants_by_guid.update({
@@ -521,16 +652,72 @@ def get_json_for_saved_variants_with_tags(saved_variants, include_missing_varian
             for variant in get_json_for_saved_variants(SavedVariant.objects.filter(id__in=missing_ids), **kwargs)
         })
 
-    response = {
-        'variantTagsByGuid': {tag['tagGuid']: tag for tag in tags},
-        'variantNotesByGuid': {note['noteGuid']: note for note in notes},
-        'variantFunctionalDataByGuid': {tag['tagGuid']: tag for tag in functional_data},
-        'savedVariantsByGuid': variants_by_guid,
-    }
+    response['savedVariantsByGuid'] = variants_by_guid
 
     return response
 
 
+SAVED_VARIANT_RELATION_GUID_KEYS = {VariantTag: 'tagGuid', VariantFunctionalData: 'tagGuid', VariantNote: 'noteGuid'}
+FUNCTIONAL_DATA_TAG_DISPLAY = {
+    name: tag_json for _, tags in VariantFunctionalData.FUNCTIONAL_DATA_CHOICES for name, tag_json in tags
+}
+
+
+def _get_json_for_saved_variant_relation(model_class, saved_variant_ids, nested_fields=None, process_result=None):
+    """Returns the JSON for all models of the given class linked to the given saved variants, and the linked saved
+    variant ids for each model, keyed by guid.
+
+    Args:
+        model_class (class): Django model class with a many-to-many saved_variants field
+        saved_variant_ids (list): Ids, or a subquery for the ids, of the saved variants to load linked models for
+        nested_fields (dict): Optional mapping of json keys to field lookups on related objects
+        process_result (lambda): Optional function to post-process a given model json
+    Returns:
+        tuple: json objects keyed by guid, and saved variant ids keyed by guid
+    """
+    related_name = model_class._meta.model_name
+    fields = model_class._meta.json_fields
+    lookups = {field: '{}__{}'.format(related_name, field) for field in fields}
+    lookups.update({
+        key: '{}__{}'.format(related_name, field) for key, field in (nested_fields or {}).items()
+    })
+    created_by_lookups = [
+        '{}__created_by__{}'.format(related_name, field) for field in ['first_name', 'last_name', 'email']
+    ] if 'created_by' in fields else []
+
+    guid_key = SAVED_VARIANT_RELATION_GUID_KEYS[model_class]
+    guid_lookup = lookups['guid']
+    models_json = {}
+    variant_ids_by_guid = defaultdict(list)
+    for row in model_class.saved_variants.through.objects.filter(savedvariant_id__in=saved_variant_ids).order_by(
+            '{}_id'.format(related_name), 'id').values('savedvariant_id', *lookups.values(), *created_by_lookups):
+        guid = row[guid_lookup]
+        variant_ids_by_guid[guid].append(row['savedvariant_id'])
+        if guid in models_json:
+            continue
+
+        result = {_to_camel_case(key): row[lookup] for key, lookup in lookups.items() if key != 'guid'}
+        result[guid_key] = guid
+        if result.get('createdBy'):
+            first_name, last_name, email = [row[lookup] for lookup in created_by_lookups]
+            result['createdBy'] = '{} {}'.format(first_name, last_name).strip() or email
+        if process_result:
+            process_result(result)
+        models_json[guid] = result
+
+    return models_json, variant_ids_by_guid
+
+
+def _process_functional_data_values(tag_json):
+    tag_name = tag_json.pop('functionalDataTag')
+    display_data = json.loads(FUNCTIONAL_DATA_TAG_DISPLAY.get(tag_name, tag_name))
+    tag_json.update({
+        'name': tag_name,
+        'metadataTitle': display_data.get('metadata_title'),
+        'color': display_data['color'],
+    })
+
+
 def get_json_for_discovery_tags(variants):
     from seqr.views.utils.variant_utils import get_variant_key
     response = {}
@@ -4,11 +4,12 @@ import mock
 
 from reference_data.models import GeneInfo
 from seqr.models import Project, Family, Individual, Sample, IgvSample, SavedVariant, VariantTag, VariantFunctionalData, \
-    VariantNote, LocusList, VariantSearch
+    VariantNote, LocusList, VariantSearch, FamilyAnalysedBy
 from seqr.views.utils.orm_to_json_utils import _get_json_for_user, _get_json_for_project, _get_json_for_family, \
     _get_json_for_individual, get_json_for_sample, get_json_for_saved_variant, get_json_for_variant_tags, \
     get_json_for_variant_functional_data_tags, get_json_for_variant_note, get_json_for_locus_list, get_json_for_gene, \
-    get_json_for_saved_search, get_json_for_saved_variants_with_tags
+    get_json_for_saved_search, get_json_for_saved_variants_with_tags, _get_json_for_families, \
+    _get_json_for_individuals, get_json_for_samples
 from seqr.views.utils.test_utils import USER_FIELDS, PROJECT_FIELDS, FAMILY_FIELDS, INTERNAL_FAMILY_FIELDS, \
     INDIVIDUAL_FIELDS, INTERNAL_INDIVIDUAL_FIELDS, INDIVIDUAL_FIELDS_NO_FEATURES, SAMPLE_FIELDS, SAVED_VARIANT_FIELDS,  \
     FUNCTIONAL_FIELDS, SAVED_SEARCH_FIELDS, LOCUS_LIST_DETAIL_FIELDS, GENE_FIELDS, GENE_DETAIL_FIELDS, IGV_SAMPLE_FIELDS, \
@@ -89,6 +90,46 @@ class JSONUtilsTest(TestCase):
 
         self.assertSetEqual(set(json.keys()), IGV_SAMPLE_FIELDS)
 
+    def test_json_for_model_querysets(self):
+        user = User.objects.get(username='test_user')
+        family = Family.objects.get(guid='F000001_1')
+        family.assigned_analyst = user
+        family.save()
+        FamilyAnalysedBy.objects.create(family=family, created_by=user)
+        Individual.objects.filter(guid='I000001_na19675').update(case_review_status_last_modified_by=user)
+
+        # Querysets are serialized from their values, and should return the same json as for models
+        families = Family.objects.filter(project__guid='R0001_1kg').order_by('id')
+        with self.assertNumQueries(3):
+            families_json = _get_json_for_families(
+                families, user, add_individual_guids_field=True, has_case_review_perm=True)
+        self.assertEqual(len(families_json), 11)
+        self.assertListEqual(families_json, _get_json_for_families(
+            list(families), user, add_individual_guids_field=True, has_case_review_perm=True))
+        self.assertDictEqual(families_json[0]['assignedAnalyst'], {
+            'fullName': 'Test User', 'email': 'test_user@broadinstitute.org'})
+        self.assertEqual(families_json[0]['analysedBy'][0]['createdBy']['email'], 'test_user@broadinstitute.org')
+
+        individuals = Individual.objects.filter(family__project__guid='R0001_1kg').order_by('id')
+        with self.assertNumQueries(3):
+            individuals_json = _get_json_for_individuals(
+                individuals, user, add_sample_guids_field=True, has_case_review_perm=True)
+        self.assertListEqual(individuals_json, _get_json_for_individuals(
+            list(individuals), user, add_sample_guids_field=True, has_case_review_perm=True))
+        self.assertListEqual(
+            _get_json_for_individuals(individuals, user, project_guid='R0001_1kg', add_hpo_details=True),
+            _get_json_for_individuals(list(individuals), user, project_guid='R0001_1kg', add_hpo_details=True))
+        self.assertEqual(individuals_json[0]['caseReviewStatusLastModifiedBy'], 'test_user@broadinstitute.org')
+
+        for model in [Sample, IgvSample]:
+            samples = model.objects.order_by('id')
+            self.assertListEqual(get_json_for_samples(samples), get_json_for_samples(list(samples)))
+            self.assertListEqual(
+                get_json_for_samples(samples, project_guid='R0001_1kg', skip_nested=True),
+                get_json_for_samples(list(samples), project_guid='R0001_1kg', skip_nested=True))
+
+        self.assertListEqual(_get_json_for_families(Family.objects.none(), user), [])
+
     def test_json_for_saved_variant(self):
         variant = SavedVariant.objects.get(guid='SV0000001_2103343353_r0390_100')
         json = get_json_for_saved_variant(variant)
@@ -117,7 +158,8 @@ class JSONUtilsTest(TestCase):
             'VFD0000026_1248367227_r0390_10'}
 
         variants = SavedVariant.objects.filter(guid__in=[variant_guid_1, variant_guid_2])
-        json = get_json_for_saved_variants_with_tags(variants)
+        with self.assertNumQueries(5):
+            json = get_json_for_saved_variants_with_tags(variants)
 
         keys = {'variantTagsByGuid', 'variantNotesByGuid', 'variantFunctionalDataByGuid', 'savedVariantsByGuid'}
         self.assertSetEqual(set(json.keys()), keys)
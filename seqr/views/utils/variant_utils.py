@@ -2,6 +2,7 @@ import logging
 import redis
 
 from seqr.models import SavedVariant, VariantSearchResults
+from seqr.utils.elasticsearch.index_metadata_cache import reset_index_metadata_cache
 from seqr.utils.elasticsearch.utils import get_es_variants_for_variant_ids
 from seqr.utils.gene_utils import get_genes
 from seqr.views.utils.json_to_orm_utils import update_model_from_json
@@ -58,6 +59,9 @@ def reset_cached_search_results(project, reset_index_metadata=False):
             logger.info('No cached results to reset')
     except Exception as e:
         logger.error("Unable to reset cached search results: {}".format(e))
+    if reset_index_metadata:
+        # Process caches are reset once the shared values are removed, so they can not reload the outdated values
+        reset_index_metadata_cache()
 
 
 def get_variant_key(xpos=None, ref=None, alt=None, genomeVersion=None, **kwargs):
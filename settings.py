@@ -41,7 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'guardian',
     'anymail',
-    'seqr',
+    'seqr.apps.SeqrConfig',
     'reference_data',
     'matchmaker',
     'social_django',
@@ -130,6 +130,10 @@ GENERATED_FILES_DIR = os.path.join(os.environ.get('STATIC_MEDIA_DIR', BASE_DIR),
 MEDIA_ROOT = os.path.join(GENERATED_FILES_DIR, 'media/')
 MEDIA_URL = '/media/'
 
+# If set, a memory mapped snapshot of the gene reference data is written to this path whenever reference data is
+# reloaded, and is used for gene lookups instead of querying the reference database
+GENE_REFERENCE_SNAPSHOT_PATH = os.environ.get('GENE_REFERENCE_SNAPSHOT_PATH')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -283,6 +287,26 @@ if ELASTICSEARCH_CA_PATH:
 else:
     ES_SSL_CONTEXT = None
 
+# Each gunicorn worker keeps one pool of keep-alive connections per elasticsearch host. Sniffing is off by default, as
+# seqr usually talks to elasticsearch through a single load balanced service hostname
+ELASTICSEARCH_CONNECTION_POOL_SIZE = int(os.environ.get('ELASTICSEARCH_CONNECTION_POOL_SIZE', 10))
+ELASTICSEARCH_SNIFFER_TIMEOUT = os.environ.get('ELASTICSEARCH_SNIFFER_TIMEOUT')
+# Page through search results with search_after cursors instead of from/size offsets, so deep pages are not limited by
+# the elasticsearch max_result_window
+ELASTICSEARCH_SEARCH_AFTER_PAGINATION = os.environ.get('ELASTICSEARCH_SEARCH_AFTER_PAGINATION') == 'true'
+# Searches across multiple indices are sent as a single multi-search unless search threads are configured, in which case
+# each index is searched and parsed concurrently. This should not exceed ELASTICSEARCH_CONNECTION_POOL_SIZE
+ELASTICSEARCH_SEARCH_THREADS = int(os.environ.get('ELASTICSEARCH_SEARCH_THREADS', 0))
+# Searches without inheritance filters across at least this many families filter on a stored lookup document of the
+# searched samples instead of on one query clause per family. Lookups are disabled if this is not set. Lookups are
+# written to the seqr_search_samples_lookup index while searching, so the elasticsearch user needs write access to that
+# index, and unused lookups are removed by the delete_stale_samples_lookups command
+ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD = int(os.environ.get('ELASTICSEARCH_SAMPLES_LOOKUP_FAMILY_THRESHOLD', 0))
+# Searches requested as background jobs are run by a pool of threads in each process rather than in the request thread,
+# and their elasticsearch requests may run for longer than the default client timeout
+SEARCH_JOB_WORKERS = int(os.environ.get('SEARCH_JOB_WORKERS', 2))
+SEARCH_JOB_ES_TIMEOUT = int(os.environ.get('SEARCH_JOB_ES_TIMEOUT', 300))
+
 KIBANA_SERVER = '{host}:{port}'.format(
     host=os.environ.get('KIBANA_SERVICE_HOSTNAME', 'localhost'),
     port=os.environ.get('KIBANA_SERVICE_PORT', 5601)